@@ -1,22 +1,133 @@
 #!/usr/bin/env python
 
+"""
+Checks that a blocked FASTQ file (or pair of files) has appropriate block
+boundaries: every --block-bytes block starts with a record, holds exactly
+--reads-per-block records and ends with a newline.  For pairs, also checks
+that both files have the same # blocks and that each block holds the same
+read names in both files.
+
+The file is memory-mapped and split into block-aligned ranges that are checked
+in parallel worker processes.  Every violation is reported with its block
+number, then we fail if there were any.
+"""
+
+from __future__ import print_function
+import os
+import mmap
+import zlib
+import multiprocessing
+import numpy as np
+
+
+_NL, _AT, _SPACE, _SLASH = 10, ord('@'), ord(' '), ord('/')
+
+
+def block_name_digests(arr, nl, nblocks, block_bytes):
+    """
+    CRC of the read names in each block, ignoring /1 and /2 suffixes and
+    anything after the first space (including block padding); nl are the
+    offsets of arr's newlines.  Only the headers are scanned, so temporaries
+    are proportional to the # records and name bytes, not to len(arr).
+    """
+    line_starts = np.concatenate([[0], nl[:-1] + 1])
+    line_blocks = line_starts // block_bytes
+    rank = np.arange(len(line_starts)) - np.searchsorted(line_blocks, line_blocks)
+    hdr = np.flatnonzero(rank % 4 == 0)
+    hdr_start, hdr_end = line_starts[hdr], nl[hdr]
+    # step through all headers at once until each hits a space or its end
+    name_end = hdr_end.copy()
+    todo, pos = np.arange(len(hdr)), hdr_start.copy()
+    while len(todo) > 0:
+        todo, pos = todo[pos < hdr_end[todo]], pos[pos < hdr_end[todo]]
+        hit = arr[pos] == _SPACE
+        name_end[todo[hit]] = pos[hit]
+        todo, pos = todo[~hit], pos[~hit] + 1
+    mate_sfx = (name_end - hdr_start > 2) & (arr[np.maximum(name_end - 2, 0)] == _SLASH)
+    name_end = np.where(mate_sfx, name_end - 2, name_end)
+    lens = name_end - hdr_start
+    ends = np.cumsum(lens)
+    names = arr[np.arange(ends[-1] if len(ends) > 0 else 0) + np.repeat(hdr_start - (ends - lens), lens)]
+    # names are in file order, so each block's are a run of them
+    per_block = np.bincount(hdr_start // block_bytes, weights=lens, minlength=nblocks)
+    bounds = np.concatenate([[0], np.cumsum(per_block[:nblocks]).astype(np.int64)])
+    return [zlib.crc32(names[bounds[i]:bounds[i + 1]].tobytes()) & 0xffffffff for i in range(nblocks)]
+
+
+def check_range(job):
+    """ Check blocks [first_block, end_block) of a file; returns (violations, name digests) """
+    fn, first_block, end_block, block_bytes, rpb, want_names = job
+    violations = []
+    with open(fn, 'rb') as fh:
+        mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            start = first_block * block_bytes
+            nbytes = min(end_block * block_bytes, len(mm)) - start
+            arr = np.frombuffer(mm, dtype=np.uint8, count=nbytes, offset=start)
+            nblocks = end_block - first_block
+            nl = np.flatnonzero(arr == _NL)
+            counts = np.bincount(nl // block_bytes, minlength=nblocks)[:nblocks]
+            block_starts = np.arange(nblocks) * block_bytes
+            block_lasts = np.minimum(block_starts + block_bytes, nbytes) - 1
+            for i in np.flatnonzero(counts != rpb * 4):
+                violations.append((first_block + i, 'expected %d reads, found %d lines' % (rpb, counts[i])))
+            for i in np.flatnonzero(arr[block_starts] != _AT):
+                violations.append((first_block + i, 'does not start with "@"'))
+            for i in np.flatnonzero(arr[block_lasts] != _NL):
+                violations.append((first_block + i, 'does not end with a newline'))
+            digests = block_name_digests(arr, nl, nblocks, block_bytes) if want_names else None
+            del arr
+        finally:
+            mm.close()
+    return sorted(violations), digests
+
+
+def check_file(fn, args, nblocks, pool, want_names):
+    jobs = [(fn, b, min(b + args.blocks_per_job, nblocks), args.block_bytes, args.reads_per_block, want_names)
+            for b in range(0, nblocks, args.blocks_per_job)]
+    violations, digests = [], []
+    for vs, ds in pool.imap(check_range, jobs):
+        violations.extend(vs)
+        if want_names:
+            digests.extend(ds)
+    return violations, digests
+
 
 def go(args):
-    next_boundary = args.block_bytes
-    lines_per_block = args.reads_per_block * 4
-    with open(args.fastq, 'rb') as ifh:
-        i = 0
-        while True:
-            ln = ifh.readline()
-            if len(ln) == 0:
-                break
-            i += 1
-            if i % lines_per_block == 0:
-                if ifh.tell() != next_boundary:
-                    raise RuntimeError('Expected boundary %d, got %d at line %d' %
-                                       (next_boundary, ifh.tell(), i))
-                next_boundary += args.block_bytes
-    print('PASSED')
+    fns = [args.fastq] if args.fastq2 is None else [args.fastq, args.fastq2]
+    sizes = [os.path.getsize(fn) for fn in fns]
+    nblocks_list = [(size + args.block_bytes - 1) // args.block_bytes for size in sizes]
+    problems = []
+    for fn, size in zip(fns, sizes):
+        if size % args.block_bytes != 0:
+            problems.append('%s: size %d is not a multiple of %d; last block is partial' %
+                            (fn, size, args.block_bytes))
+    if len(fns) == 2 and nblocks_list[0] != nblocks_list[1]:
+        problems.append('%s has %d blocks but %s has %d' % (fns[0], nblocks_list[0], fns[1], nblocks_list[1]))
+    nblocks = min(nblocks_list)
+    if args.stop_after is not None:
+        nblocks = min(nblocks, (args.stop_after + args.reads_per_block - 1) // args.reads_per_block)
+
+    pool = multiprocessing.Pool(args.workers)
+    digests = []
+    for fn in fns:
+        violations, ds = check_file(fn, args, nblocks, pool, len(fns) == 2)
+        digests.append(ds)
+        problems.extend('%s: block %d: %s' % (fn, b, msg) for b, msg in violations)
+    pool.close()
+    pool.join()
+    if len(fns) == 2:
+        for b in np.flatnonzero(np.array(digests[0], dtype=np.int64) != np.array(digests[1], dtype=np.int64)):
+            problems.append('block %d: read names differ between %s and %s' % (b, fns[0], fns[1]))
+
+    for i, problem in enumerate(problems):
+        if args.max_errors is not None and i >= args.max_errors:
+            print('... and %d more' % (len(problems) - i))
+            break
+        print(problem)
+    if len(problems) > 0:
+        raise RuntimeError('%d problems found in %d blocks checked' % (len(problems), nblocks))
+    print('PASSED (%d blocks)' % nblocks)
 
 
 if __name__ == '__main__':
@@ -25,11 +136,19 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Check that a blocked FASTQ file has appropriate block boundaries')
 
     parser.add_argument('--fastq', metavar='path', type=str, required=True,
-                        help='FASTQ file to check.')
+                        help='FASTQ file to check (mate 1 for pairs).')
+    parser.add_argument('--fastq2', metavar='path', type=str,
+                        help='Mate 2 FASTQ file; checked against --fastq block by block.')
     parser.add_argument('--stop-after', metavar='int', type=int,
                         help='stop after parsing this many reads in an input file')
     parser.add_argument('--block-bytes', metavar='int', type=int, default=12288,
                         help='# characters constituting a single fixed-size block of FASTQ input')
     parser.add_argument('--reads-per-block', metavar='int', type=int, default=70,
                         help='# reads in a single fixed-size block')
+    parser.add_argument('--workers', metavar='int', type=int, default=multiprocessing.cpu_count(),
+                        help='# worker processes')
+    parser.add_argument('--blocks-per-job', metavar='int', type=int, default=8192,
+                        help='# blocks checked by a worker at a time')
+    parser.add_argument('--max-errors', metavar='int', type=int,
+                        help='print at most this many problems (all are counted)')
     go(parser.parse_args())
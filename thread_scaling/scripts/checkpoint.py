@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+"""
+Durable checkpoints for long-running scripts like reads.py.
+
+A Manifest is a small JSON file recording (a) positions within the stage in
+progress and (b) which stages are complete, along with checksums of the files
+they produced.  Every update is written to a temporary file, fsynced and
+renamed into place, so a job killed at any point leaves either the old or the
+new manifest behind.  Callers are responsible for fsyncing the data files a
+position refers to before recording it.
+"""
+
+from __future__ import print_function
+import os
+import sys
+import json
+import time
+import zlib
+
+
+def fsync_file(fh):
+    fh.flush()
+    os.fsync(fh.fileno())
+
+
+def fsync_dir(dr):
+    try:
+        fd = os.open(dr, os.O_RDONLY)
+    except OSError:
+        return  # e.g. platforms that can't open directories
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def file_checksum(fn, bufsize=16 * 1024 * 1024):
+    """ Size and CRC32 of a file; CRC rather than a hash since files are big """
+    crc, size = 0, 0
+    with open(fn, 'rb') as fh:
+        while True:
+            buf = fh.read(bufsize)
+            if len(buf) == 0:
+                break
+            crc = zlib.crc32(buf, crc)
+            size += len(buf)
+    return '%d:%08x' % (size, crc & 0xffffffff)
+
+
+def open_truncated(fn, nbytes):
+    """ Open fn for writing, discarding anything past the first nbytes """
+    ofh = open(fn, 'r+b')
+    ofh.truncate(nbytes)
+    ofh.seek(nbytes)
+    return ofh
+
+
+class Manifest(object):
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.state = {}
+        if os.path.exists(fn):
+            with open(fn) as fh:
+                self.state = json.load(fh)
+
+    def get(self, key, default=None):
+        return self.state.get(key, default)
+
+    def put(self, key, value):
+        self.state[key] = value
+        self.save()
+
+    def save(self):
+        tmp_fn = self.fn + '.tmp'
+        with open(tmp_fn, 'w') as ofh:
+            json.dump(self.state, ofh)
+            fsync_file(ofh)
+        os.rename(tmp_fn, self.fn)
+        fsync_dir(os.path.dirname(os.path.abspath(self.fn)))
+
+    def stage_done(self, stage, fns):
+        """ Record that stage is complete, with checksums of its outputs """
+        self.put('done:' + stage, dict((fn, file_checksum(fn)) for fn in fns))
+
+    def verify_stage(self, stage):
+        """ True iff stage was completed and its outputs are unchanged """
+        sums = self.get('done:' + stage)
+        if sums is None:
+            return False
+        for fn, cksum in sums.items():
+            if not os.path.exists(fn) or file_checksum(fn) != cksum:
+                print('Output "%s" of completed stage "%s" is missing or changed; redoing stage' % (fn, stage),
+                      file=sys.stderr)
+                return False
+        return True
+
+
+class Interval(object):
+    """ Says when it's time for the next checkpoint """
+
+    def __init__(self, secs):
+        self.secs = secs
+        self.last = time.time()
+
+    def due(self):
+        now = time.time()
+        if now - self.last >= self.secs:
+            self.last = now
+            return True
+        return False
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+
+"""
+Compares two sets of tabulated results (tabulate.py --store; see
+results_store.py), a baseline and a candidate, e.g. batch_parsing_output vs.
+blocked_input.  Points are matched by (machine, aligner, pe, # threads), and
+each attempt's threads_div_max is one throughput measurement (with --steady,
+its steady-state reads per second from master.py --progress, which also
+covers runs stopped by --early-stop).  Since a store usually holds several
+series, --baseline-series and --candidate-series pick one from each.
+
+For each point, delta is the candidate's mean throughput over the
+baseline's, minus 1 (geometric means over attempts).  Its p-value is from a
+one-sided permutation test on log throughput in the direction of the change:
+every split of the pooled attempts into baseline and candidate groups if
+there are at most --permutations of them, else that many random splits.  A
+point is a regression if the candidate is more than --threshold slower and
+p <= --alpha.  With a single attempt on either side there's no test (p is
+NA, test "none"), and if no split could give p <= --alpha (e.g. 2 vs. 2
+attempts: p >= 1/6) the test is "underpowered"; either way the threshold
+alone decides.  Exits with status 1 if there are any regressions, so it can
+gate a campaign:
+
+    python compare.py --baseline knl.npz --baseline-series parsing-batch \
+        --candidate knl_new.npz --candidate-series final-block --threshold 0.03
+"""
+
+from __future__ import print_function
+import sys
+import itertools
+import numpy
+import results_store
+
+POINT_KEYS = ['machine', 'aligner', 'pe', 'totthreads']
+
+
+def points(fns, series, col='threads_div_max'):
+    """ {(machine, aligner, pe, # threads): [log throughput per attempt]} """
+    runs = results_store.load(fns)['runs']
+    if col not in runs:
+        raise RuntimeError('No %s in %s; re-run tabulate.py --store' % (col, ' '.join(fns)))
+    res, seen = {}, {}
+    for i in range(len(runs['attempt'])):
+        if series is not None and runs['series'][i] != series:
+            continue
+        x = runs[col][i]
+        if not numpy.isfinite(x) or x <= 0:
+            continue
+        key = tuple(str(runs[k][i]) for k in POINT_KEYS)
+        seen.setdefault(key, set()).add(str(runs['series'][i]))
+        if len(seen[key]) > 1:
+            raise RuntimeError('Several series (%s) at %s in %s; pick one with --*-series' %
+                               (', '.join(sorted(seen[key])), ' '.join(key), ' '.join(fns)))
+        res.setdefault(key, []).append(numpy.log(x))
+    return res
+
+
+def perm_test(base, cand, max_perm, rng):
+    """ One-sided permutation p-value for mean(cand) - mean(base), in the direction it points """
+    pooled = numpy.concatenate([base, cand])
+    n, k = len(pooled), len(cand)
+    obs = numpy.mean(cand) - numpy.mean(base)
+    total = pooled.sum()
+
+    def stat(idx):
+        s = pooled[list(idx)].sum()
+        return s / k - (total - s) / (n - k)
+    nsplits = 1
+    for j in range(k):
+        nsplits = nsplits * (n - j) // (j + 1)
+    if nsplits <= max_perm:
+        stats = numpy.array([stat(idx) for idx in itertools.combinations(range(n), k)])
+    else:
+        stats = numpy.array([stat(rng.permutation(n)[:k]) for _ in range(max_perm)] + [obs])
+    eps = 1e-12 * max(1.0, abs(obs))
+    if obs < 0:
+        return float((stats <= obs + eps).mean())
+    return float((stats >= obs - eps).mean())
+
+
+def min_p(nbase, ncand, max_perm):
+    """ Smallest p-value perm_test can give """
+    nsplits = 1
+    for j in range(ncand):
+        nsplits = nsplits * (nbase + ncand - j) // (j + 1)
+    return 1.0 / nsplits if nsplits <= max_perm else 1.0 / (max_perm + 1)
+
+
+def judge(base, cand, threshold, alpha, max_perm, rng):
+    """ (delta, p or None, test, status) for one point's log throughputs """
+    b, c = numpy.asarray(base), numpy.asarray(cand)
+    delta = numpy.exp(c.mean() - b.mean()) - 1.0
+    p, test = None, 'none'
+    if min(len(b), len(c)) > 1:
+        p = perm_test(b, c, max_perm, rng)
+        test = 'perm' if min_p(len(b), len(c), max_perm) <= alpha else 'underpowered'
+    significant = test != 'perm' or p <= alpha
+    status = 'ok'
+    if delta < -threshold and significant:
+        status = 'REGRESSION'
+    elif delta > threshold and significant:
+        status = 'improvement'
+    return delta, p, test, status
+
+
+def go(args):
+    rng = numpy.random.RandomState(args.seed)
+    col = 'steady_rate' if args.steady else 'threads_div_max'
+    base = points(args.baseline, args.baseline_series, col)
+    cand = points(args.candidate, args.candidate_series, col)
+    for name, only in [('baseline', set(base) - set(cand)), ('candidate', set(cand) - set(base))]:
+        for key in sorted(only):
+            print('Only in %s: %s' % (name, ' '.join(key)), file=sys.stderr)
+    common = sorted(set(base) & set(cand), key=lambda k: k[:3] + (int(k[3]),))
+    if len(common) == 0:
+        raise RuntimeError('No points in common between baseline and candidate')
+    print('\t'.join(POINT_KEYS + ['nbase', 'ncand', 'base_thruput', 'cand_thruput', 'delta', 'p', 'test',
+                                  'status']))
+    nreg = 0
+    for key in common:
+        b, c = numpy.array(base[key]), numpy.array(cand[key])
+        delta, p, test, status = judge(b, c, args.threshold, args.alpha, args.permutations, rng)
+        if status == 'REGRESSION':
+            nreg += 1
+        print('\t'.join(list(key) + ['%d' % len(b), '%d' % len(c), '%0.4g' % numpy.exp(b.mean()),
+                                     '%0.4g' % numpy.exp(c.mean()), '%0.4f' % delta,
+                                     'NA' if p is None else '%0.4f' % p, test, status]))
+    print('%d regressions in %d points' % (nreg, len(common)), file=sys.stderr)
+    if nreg > 0:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+
+    import argparse
+    import unittest
+    import os
+    import shutil
+    import tempfile
+
+    class TestCompare(unittest.TestCase):
+
+        def write_store(self, fn, thruputs):
+            """ Store with one bt2 point at 16 threads, one run per throughput """
+            n = len(thruputs)
+            runs = {'machine': numpy.array(['knl'] * n), 'aligner': numpy.array(['bt2'] * n),
+                    'series': numpy.array(['s'] * n), 'pe': numpy.array(['unp'] * n),
+                    'threads_per_proc': numpy.zeros(n, dtype=numpy.int64),
+                    'totthreads': numpy.full(n, 16, dtype=numpy.int64),
+                    'attempt': numpy.arange(1, n + 1), 'threads_div_max': numpy.array(thruputs, dtype=float)}
+            results_store.write(fn, {'runs': runs, 'threads': {'run': numpy.arange(n)}})
+
+        def gate(self, base, cand):
+            tmp = tempfile.mkdtemp()
+            try:
+                fns = [os.path.join(tmp, 'base.npz'), os.path.join(tmp, 'cand.npz')]
+                self.write_store(fns[0], base)
+                self.write_store(fns[1], cand)
+                args = argparse.Namespace(baseline=[fns[0]], candidate=[fns[1]], baseline_series=None,
+                                          candidate_series=None, threshold=0.05, alpha=0.05,
+                                          permutations=10000, seed=0, steady=False)
+                try:
+                    go(args)
+                except SystemExit as e:
+                    return e.code
+                return 0
+            finally:
+                shutil.rmtree(tmp)
+
+        def test_min_p(self):
+            self.assertAlmostEqual(1.0 / 6, min_p(2, 2, 10000))
+            self.assertAlmostEqual(1.0 / 11, min_p(5, 5, 10))
+
+        def test_underpowered_regression_fails(self):
+            # 2 vs. 2 attempts can't reach p <= 0.05, so a large drop alone fails the gate
+            rng = numpy.random.RandomState(0)
+            delta, p, test, status = judge(numpy.log([10.0, 10.2]), numpy.log([7.0, 7.1]), 0.05, 0.05, 10000, rng)
+            self.assertEqual('underpowered', test)
+            self.assertEqual('REGRESSION', status)
+            self.assertEqual(1, self.gate([10.0, 10.2], [7.0, 7.1]))
+
+        def test_no_change_passes(self):
+            self.assertEqual(0, self.gate([10.0, 10.2], [10.1, 9.9]))
+            self.assertEqual(0, self.gate([10.0], [10.1]))
+
+        def test_noisy_regression_passes(self):
+            # 6 vs. 6 attempts, mean 7% lower but overlapping: not significant
+            rng = numpy.random.RandomState(0)
+            _, p, test, status = judge(numpy.log([10, 12, 8, 11, 9, 10.5]), numpy.log([9, 11.5, 7.5, 10, 8.5, 9.5]),
+                                       0.05, 0.05, 10000, rng)
+            self.assertEqual('perm', test)
+            self.assertGreater(p, 0.05)
+            self.assertEqual('ok', status)
+
+    if '--test' in sys.argv:
+        unittest.main(argv=[sys.argv[0]])
+
+    else:
+
+        parser = argparse.ArgumentParser(description='Compare throughput between two sets of tabulated results.')
+
+        parser.add_argument('--baseline', metavar='path', type=str, nargs='+', required=True,
+                            help='Baseline .npz(s) written by tabulate.py --store.')
+        parser.add_argument('--candidate', metavar='path', type=str, nargs='+', required=True,
+                            help='Candidate .npz(s) written by tabulate.py --store.')
+        parser.add_argument('--baseline-series', type=str,
+                            help='Only use this series from the baseline.')
+        parser.add_argument('--candidate-series', type=str,
+                            help='Only use this series from the candidate.')
+        parser.add_argument('--steady', action='store_const', const=True, default=False,
+                            help='Compare steady-state reads per second (master.py --progress) instead of '
+                                 'threads_div_max.')
+        parser.add_argument('--threshold', type=float, default=0.05,
+                            help='Report changes in throughput larger than this fraction.')
+        parser.add_argument('--alpha', type=float, default=0.05,
+                            help='Significance level for changes.')
+        parser.add_argument('--permutations', type=int, default=10000,
+                            help='Most splits of attempts to try in each permutation test.')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Seed for random permutations.')
+
+        go(parser.parse_args())
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+
+"""
+Chunked FASTQ parsing shared by the scripts in this directory.
+
+Rather than calling readline() four times per record, we read large chunks
+into a single bytes buffer, find all the newlines at once with numpy and
+describe the whole records in the chunk with arrays of offsets.  For record i
+of a chunk, line k (0=header, 1=sequence, 2=plus, 3=quality) spans
+buf[starts[i, k]:ends[i, k]], not including the newline.  Validation and
+trimming are then vectorized operations over those arrays.
+
+Assumes the usual 4-line FASTQ records (no line-wrapped sequences).
+"""
+
+from __future__ import print_function
+import gzip
+import numpy as np
+
+
+DEFAULT_CHUNK = 16 * 1024 * 1024
+
+_NL, _AT, _PLUS, _SPACE = 10, ord('@'), ord('+'), ord(' ')
+
+
+def open_fastq(fn):
+    """ Open a possibly-gzipped FASTQ file for binary reading """
+    if fn.endswith('.gz'):
+        return gzip.open(fn, 'rb')
+    return open(fn, 'rb')
+
+
+class FastqChunk(object):
+    """ A run of whole FASTQ records at the beginning of a bytes buffer """
+
+    def __init__(self, buf, nl, nrecords, offset=0):
+        self.buf = buf
+        self.offset = offset  # offset of buf[0] in the stream it came from
+        self.arr = np.frombuffer(buf, dtype=np.uint8)
+        ends = nl[:4 * nrecords]
+        starts = np.empty_like(ends)
+        if len(ends) > 0:
+            starts[0] = 0
+            starts[1:] = ends[:-1] + 1
+        self.starts = starts.reshape(-1, 4)
+        self.ends = ends.reshape(-1, 4)
+
+    def __len__(self):
+        return self.starts.shape[0]
+
+    @property
+    def nbytes(self):
+        """ # bytes of buf taken up by the records """
+        return int(self.ends[-1, 3]) + 1 if len(self) > 0 else 0
+
+    @property
+    def record_starts(self):
+        return self.starts[:, 0]
+
+    @property
+    def record_ends(self):
+        """ Offsets just past the final newline of each record """
+        return self.ends[:, 3] + 1
+
+    @property
+    def record_lens(self):
+        return self.record_ends - self.record_starts
+
+    @property
+    def seq_lens(self):
+        return self.ends[:, 1] - self.starts[:, 1]
+
+    @property
+    def qual_lens(self):
+        return self.ends[:, 3] - self.starts[:, 3]
+
+    def line(self, i, k):
+        return self.buf[self.starts[i, k]:self.ends[i, k]]
+
+    def header(self, i):
+        return self.line(i, 0)
+
+    def seq(self, i):
+        return self.line(i, 1)
+
+    def qual(self, i):
+        return self.line(i, 3)
+
+    def header_pad(self):
+        """ # trailing spaces on each header line, e.g. block padding """
+        n = self.nbytes
+        idx = np.where(self.arr[:n] != _SPACE, np.arange(n), -1)
+        last_nonspace = np.maximum.accumulate(idx)[self.ends[:, 0] - 1]
+        return self.ends[:, 0] - 1 - last_nonspace
+
+    def data(self):
+        """ Raw bytes of all the records in the chunk """
+        return self.buf[:self.nbytes]
+
+    def validate(self):
+        """ Raise RuntimeError describing the first malformed record, if any """
+        if len(self) == 0:
+            return
+        bad = self.arr[self.starts[:, 0]] != _AT
+        bad |= self.arr[self.starts[:, 2]] != _PLUS
+        bad |= self.seq_lens == 0
+        bad |= self.seq_lens != self.qual_lens
+        if bad.any():
+            i = int(np.flatnonzero(bad)[0])
+            raise RuntimeError('Malformed FASTQ record at byte offset %d: %s' %
+                               (self.offset + int(self.starts[i, 0]),
+                                repr(self.buf[self.starts[i, 0]:self.ends[i, 3]])))
+
+    def trimmed_ends(self, trim_to):
+        """ Per-record ends of the sequence and quality lines after trimming """
+        seq_end = np.minimum(self.ends[:, 1], self.starts[:, 1] + trim_to)
+        qual_end = np.minimum(self.ends[:, 3], self.starts[:, 3] + trim_to)
+        return seq_end, qual_end
+
+    def trimmed(self, trim_to):
+        """ Bytes of all records with sequences and qualities cut to trim_to """
+        seq_end, qual_end = self.trimmed_ends(trim_to)
+        n = self.nbytes
+        cut_starts = np.concatenate([seq_end, qual_end])
+        cut_ends = np.concatenate([self.ends[:, 1], self.ends[:, 3]])
+        if (cut_starts == cut_ends).all():
+            return self.data()
+        delta = np.bincount(cut_starts, minlength=n + 1) - np.bincount(cut_ends, minlength=n + 1)
+        keep = np.cumsum(delta)[:n] == 0
+        return self.arr[:n][keep].tobytes()
+
+
+class ChunkReader(object):
+    """
+    Reads a FASTQ stream a chunk at a time.  Bytes after the last whole record
+    of a chunk are carried over to the next one.  Newlines are found once per
+    chunk read from the stream, so taking a few records at a time costs only
+    as much as the records taken.
+    """
+
+    def __init__(self, fh, chunk_bytes=DEFAULT_CHUNK):
+        self.fh = fh
+        self.chunk_bytes = chunk_bytes
+        self.buf = b''
+        self.pos = 0  # start of the bytes not yet returned
+        self.nl = np.zeros(0, dtype=np.int64)  # offsets of buf's newlines
+        self.nl_pos = 0  # index in nl of the first newline past pos
+        self.offset = 0  # stream offset of buf[pos]
+        self.eof = False
+
+    def refill(self):
+        """ Drop the bytes already returned and append the next chunk of the stream """
+        rest = self.buf[self.pos:]
+        new = self.fh.read(self.chunk_bytes)
+        if len(new) == 0:
+            self.eof = True
+            if len(rest) > 0 and rest[-1:] != b'\n':
+                new = b'\n'
+        new_nl = np.flatnonzero(np.frombuffer(new, dtype=np.uint8) == _NL) + len(rest)
+        self.nl = np.concatenate([self.nl[self.nl_pos:] - self.pos, new_nl])
+        self.buf, self.pos, self.nl_pos = rest + new, 0, 0
+
+    def read(self, max_records=None):
+        """
+        Return a FastqChunk with at least one and at most max_records records,
+        or None at end of input.
+        """
+        # don't let the carried-over bytes grow when callers take few records
+        need_more = len(self.buf) - self.pos < self.chunk_bytes
+        while True:
+            if need_more and not self.eof:
+                self.refill()
+            nrecords = (len(self.nl) - self.nl_pos) // 4
+            if nrecords > 0 or self.eof:
+                break
+            need_more = True
+        if nrecords == 0:
+            if self.pos < len(self.buf):
+                raise RuntimeError('Incomplete FASTQ record at end of input, offset %d' % self.offset)
+            return None
+        if max_records is not None:
+            nrecords = min(nrecords, max_records)
+        nl = self.nl[self.nl_pos:self.nl_pos + 4 * nrecords] - self.pos
+        chunk = FastqChunk(self.buf[self.pos:self.pos + int(nl[-1]) + 1], nl, nrecords, self.offset)
+        self.pos += chunk.nbytes
+        self.nl_pos += 4 * nrecords
+        self.offset += chunk.nbytes
+        return chunk
+
+    def unread(self, nbytes):
+        """ Give back the last nbytes returned by read(), which must be whole records """
+        self.pos -= nbytes
+        self.offset -= nbytes
+        self.nl_pos = int(np.searchsorted(self.nl, self.pos))
+
+    def __iter__(self):
+        while True:
+            chunk = self.read()
+            if chunk is None:
+                return
+            yield chunk
+
+
+def iter_chunks(fh, chunk_bytes=DEFAULT_CHUNK):
+    """ Generator over the FastqChunks of a stream """
+    return iter(ChunkReader(fh, chunk_bytes))
+
+
+def iter_paired_chunks(fh1, fh2, chunk_bytes=DEFAULT_CHUNK):
+    """ Generator over pairs of FastqChunks holding the same # records """
+    rd1, rd2 = ChunkReader(fh1, chunk_bytes), ChunkReader(fh2, chunk_bytes)
+    while True:
+        c1 = rd1.read()
+        if c1 is None:
+            if rd2.read() is not None:
+                raise RuntimeError('Mate 2 file has more records than mate 1 file')
+            return
+        c2 = rd2.read(len(c1))
+        if c2 is None:
+            raise RuntimeError('Mate 1 file has more records than mate 2 file')
+        if len(c2) < len(c1):
+            # give the extra mate-1 records back; they start the next chunk
+            rd1.unread(c1.nbytes - int(c1.record_starts[len(c2)]))
+            c1 = FastqChunk(c1.buf, c1.ends.ravel(), len(c2), c1.offset)
+        yield c1, c2
+
+
+def copy_records(reader, ofh, nrecords):
+    """
+    Copy the next nrecords whole records from a ChunkReader to ofh.  Returns
+    the # records copied, which is less than nrecords only if input ran out.
+    """
+    ncopied = 0
+    while ncopied < nrecords:
+        chunk = reader.read(nrecords - ncopied)
+        if chunk is None:
+            break
+        ofh.write(chunk.data())
+        ncopied += len(chunk)
+    return ncopied
+
+
+def skip_records(reader, nrecords):
+    """ Skip past the next nrecords records; returns the # skipped """
+    nskipped = 0
+    while nskipped < nrecords:
+        chunk = reader.read(nrecords - nskipped)
+        if chunk is None:
+            break
+        nskipped += len(chunk)
+    return nskipped
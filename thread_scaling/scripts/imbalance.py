@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+
+"""
+Load-imbalance and straggler analytics from per-thread times, over
+tabulated results (tabulate.py --store; see results_store.py).  Throughput
+is threads over the slowest thread's time, so one straggler sets it.
+
+Per run (an attempt at a thread count, all processes together):
+
+imbalance         slowest thread's time over the mean; 1 is perfect balance
+tail_p90          90th percentile over median thread time
+tail_max          slowest over median thread time
+nstragglers       threads more than --mad robust SDs (1.4826 median absolute
+                  deviations) slower than the median
+cpu_rho/node_rho  Spearman rank correlation between a thread's CPU (NUMA
+                  node) changeovers and its time
+thruput           threads_div_max, as in the runs table
+balanced_thruput  throughput if the same total work were spread evenly, i.e.
+                  every thread finished at the mean time
+
+Then per (machine, aligner, series, pe), the pooled correlation between
+changeovers and lateness (time over the run's median), with a permutation
+p-value shuffling lateness among threads of the same run, and the mean
+throughput lost to imbalance.  A loss at the top thread counts comparable
+to what a better lock would gain (see scaling_fit.py) means tail imbalance
+is the next bottleneck.  --stragglers lists every straggler.
+"""
+
+from __future__ import print_function
+import numpy
+import results_store
+
+GROUP_KEYS = ['machine', 'aligner', 'series', 'pe']
+RUN_KEYS = GROUP_KEYS + ['threads_per_proc', 'totthreads', 'attempt']
+
+
+def ranks(x):
+    """ Ranks of x from 0, ties getting their mean rank """
+    order = numpy.argsort(x, kind='mergesort')
+    r = numpy.empty(len(x))
+    r[order] = numpy.arange(len(x))
+    xs = x[order]
+    # average over runs of equal values
+    starts = numpy.flatnonzero(numpy.concatenate([[True], xs[1:] != xs[:-1]]))
+    ends = numpy.concatenate([starts[1:], [len(x)]])
+    for s, e in zip(starts, ends):
+        if e - s > 1:
+            r[order[s:e]] = (s + e - 1) / 2.0
+    return r
+
+
+def spearman(x, y):
+    if len(x) < 3:
+        return float('nan')
+    rx, ry = ranks(x), ranks(y)
+    rx, ry = rx - rx.mean(), ry - ry.mean()
+    denom = numpy.sqrt((rx * rx).sum() * (ry * ry).sum())
+    return float((rx * ry).sum() / denom) if denom > 0 else float('nan')
+
+
+def within_ranks(vals, run):
+    """ Ranks of vals within each run, centered and scaled to unit variance per run """
+    res = numpy.zeros(len(vals))
+    for r in numpy.unique(run):
+        i = numpy.flatnonzero(run == r)
+        rk = ranks(vals[i])
+        rk -= rk.mean()
+        sd = rk.std()
+        res[i] = rk / sd if sd > 0 else 0.0
+    return res
+
+
+def pooled_rho(x, lateness, run, nperm, rng):
+    """
+    Mean within-run rank correlation of x and lateness, and its permutation
+    p-value; run must be non-decreasing
+    """
+    rx, ry = within_ranks(x, run), within_ranks(lateness, run)
+    rho = (rx * ry).mean()
+    hits = 0
+    for _ in range(nperm):
+        # sorting by run, then at random, shuffles within runs; run is
+        # non-decreasing, so positions line up
+        perm = ry[numpy.lexsort((rng.uniform(size=len(run)), run))]
+        hits += abs((rx * perm).mean()) >= abs(rho)
+    return rho, (hits + 1.0) / (nperm + 1.0)
+
+
+def run_stats(time, cpu, node, mad_limit):
+    """ imbalance, tail ratios, straggler mask and changeover correlations for one run's threads """
+    med = numpy.median(time)
+    mad = 1.4826 * numpy.median(numpy.abs(time - med))
+    slow = (time - med) > mad_limit * mad if mad > 0 else numpy.zeros(len(time), dtype=bool)
+    return {'imbalance': time.max() / time.mean(), 'tail_p90': numpy.percentile(time, 90) / med,
+            'tail_max': time.max() / med, 'stragglers': slow,
+            'cpu_rho': spearman(cpu, time), 'node_rho': spearman(node, time)}
+
+
+def go(args):
+    tables = results_store.load(args.store)
+    runs, threads = tables['runs'], tables['threads']
+    rng = numpy.random.RandomState(args.seed)
+    order = numpy.argsort(threads['run'], kind='mergesort')
+    bounds = numpy.searchsorted(threads['run'][order], numpy.arange(len(runs['attempt']) + 1))
+    print('\t'.join(RUN_KEYS + ['nthreads', 'imbalance', 'tail_p90', 'tail_max', 'nstragglers', 'cpu_rho',
+                                'node_rho', 'thruput', 'balanced_thruput']))
+    stragglers, groups = [], {}
+    for i in range(len(runs['attempt'])):
+        idx = order[bounds[i]:bounds[i + 1]]
+        time = threads['time'][idx]
+        ok = numpy.isfinite(time)
+        if ok.sum() < 2:
+            continue
+        idx, time = idx[ok], time[ok]
+        cpu, node = threads['cpu_changeovers'][idx], threads['node_changeovers'][idx]
+        st = run_stats(time, cpu, node, args.mad)
+        key = [str(runs[k][i]) for k in RUN_KEYS]
+        thru = runs['threads_div_max'][i] * args.reads_per_thread
+        print('\t'.join(key + ['%d' % len(time)] +
+                        ['%0.4f' % st[k] for k in ['imbalance', 'tail_p90', 'tail_max']] +
+                        ['%d' % st['stragglers'].sum()] + ['%0.3f' % st[k] for k in ['cpu_rho', 'node_rho']] +
+                        ['%0.4g' % thru, '%0.4g' % (thru * st['imbalance'])]))
+        for j in numpy.flatnonzero(st['stragglers']):
+            stragglers.append(key + ['%d' % threads['proc_id'][idx[j]], '%d' % threads['thread'][idx[j]],
+                                     '%0.3f' % time[j], '%0.3f' % (time[j] / numpy.median(time)),
+                                     '%d' % cpu[j], '%d' % node[j]])
+        g = groups.setdefault(tuple(key[:len(GROUP_KEYS)]), {'cpu': [], 'node': [], 'late': [], 'run': [],
+                                                               'loss': []})
+        g['cpu'].append(cpu)
+        g['node'].append(node)
+        g['late'].append(time / numpy.median(time))
+        g['run'].append(numpy.full(len(time), i))
+        g['loss'].append(1.0 - 1.0 / st['imbalance'])
+    print()
+    print('\t'.join(GROUP_KEYS + ['nruns', 'mean_imbalance_loss', 'cpu_rho', 'cpu_p', 'node_rho', 'node_p']))
+    for key, g in sorted(groups.items()):
+        late, run = numpy.concatenate(g['late']), numpy.concatenate(g['run'])
+        res = []
+        for col in ['cpu', 'node']:
+            res.extend(pooled_rho(numpy.concatenate(g[col]), late, run, args.permutations, rng))
+        print('\t'.join(list(key) + ['%d' % len(g['loss']), '%0.4f' % numpy.mean(g['loss'])] +
+                        ['%0.3f\t%0.4f' % tuple(res[k:k + 2]) for k in [0, 2]]))
+    if args.stragglers:
+        print()
+        print('\t'.join(RUN_KEYS + ['proc_id', 'thread', 'time', 'lateness', 'cpu_changeovers', 'node_changeovers']))
+        for row in stragglers:
+            print('\t'.join(row))
+
+
+if __name__ == '__main__':
+
+    import argparse
+    parser = argparse.ArgumentParser(description='Load-imbalance and straggler analytics from per-thread times.')
+
+    parser.add_argument('store', metavar='path', type=str, nargs='+',
+                        help='.npz written by tabulate.py --store; several are combined.')
+    parser.add_argument('--mad', type=float, default=3.5,
+                        help='Threads this many robust SDs slower than the median are stragglers.')
+    parser.add_argument('--reads-per-thread', type=float, default=1.0,
+                        help='Multiply throughputs by this for reads per second.')
+    parser.add_argument('--stragglers', action='store_const', const=True, default=False,
+                        help='Also list every straggler.')
+    parser.add_argument('--permutations', type=int, default=999,
+                        help='# permutations for the changeover correlation p-values.')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed for permutations.')
+
+    go(parser.parse_args())
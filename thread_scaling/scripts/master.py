@@ -10,6 +10,10 @@ Works for experiments that are:
 
 Experiments scale the amount of input data with the total number of threads.
 Input data is assumed to be pre-shuffled
+
+With --progress, progress is tracked while each run is in progress and a
+steady-state reads/sec, excluding warm-up and drain, is recorded alongside
+its output; see progress.py.
 """
 
 from __future__ import print_function
@@ -23,6 +27,8 @@ import time
 import datetime
 import signal
 import multiprocessing
+from fastq_chunks import open_fastq, ChunkReader, copy_records, skip_records
+from progress import ProgressMonitor
 
 
 join = os.path.join
@@ -141,17 +147,17 @@ def slice_lab(i):
 
 def slice_all_fastq(reads_per, n, ifn, ofn, sanity=True, compress=False):
     assert 'block' not in ifn
-    if ifn.endswith('.gz'):
-        feed_cmd = 'gzip -dc ' + ifn
-    else:
-        feed_cmd = 'cat ' + ifn
-    head_cmd = 'head -n %d' % (reads_per * n * 4)
-    split_cmd = 'split -l %d -a 3 - %s' % (reads_per * 4, ofn)
-    cmd = ' | '.join([feed_cmd, head_cmd, split_cmd])
-    print(cmd)
-    ret = os.system(cmd)
-    if ret != 0:
-        raise RuntimeError('Exitlevel %d from command "%s"' % (ret, cmd))
+    print('# Splitting first %d reads of "%s" into %d slices of %d' % (reads_per * n, ifn, n, reads_per))
+    with open_fastq(ifn) as ifh:
+        reader = ChunkReader(ifh)
+        for i in range(n):
+            fn = ofn + slice_lab(i)
+            with open(fn, 'wb') as ofh:
+                ncopied = copy_records(reader, ofh, reads_per)
+            if ncopied == 0:
+                os.remove(fn)  # like split, don't leave empty slices behind
+            if ncopied < reads_per:
+                break
     if sanity:
         for i in range(n):
             fn = ofn + slice_lab(i)
@@ -161,11 +167,12 @@ def slice_all_fastq(reads_per, n, ifn, ofn, sanity=True, compress=False):
 
 
 def slice_fastq(begin, end, ifn, ofn, sanity=True):
-    cmd = "sed -n '%d,%dp;%dq' < %s > %s" % (begin * 4 + 1, end * 4, end * 4 + 1, ifn, ofn)
-    print(cmd)
-    ret = os.system(cmd)
-    if ret != 0:
-        raise RuntimeError('Exitlevel %d from command "%s"' % (ret, cmd))
+    print('# Copying reads [%d, %d) of "%s" to "%s"' % (begin, end, ifn, ofn))
+    with open_fastq(ifn) as ifh:
+        reader = ChunkReader(ifh)
+        skip_records(reader, begin)
+        with open(ofn, 'wb') as ofh:
+            copy_records(reader, ofh, end - begin)
     if sanity:
         actual_nlines = wcl(ofn)
         if actual_nlines != (end - begin) * 4:
@@ -453,13 +460,25 @@ def go(args):
                             iostat = subprocess.Popen(iostat_cmd, stdout=iostat_ofh, stderr=iostat_ofh)
                         if os.system('which top >/dev/null 2>/dev/null') == 0:
                             top = subprocess.Popen(top_cmd, stdout=top_ofh, stderr=top_ofh)
+                        monitor = None
+                        progress_fns = stderr_ofns if tool == 'bwa' else sam_ofns
+                        if args.progress and idx_rev == 1 and '/dev/null' in progress_fns:
+                            print('#   WARNING: --progress needs SAM output; not tracking progress with '
+                                  '--sam-dev-null', file=sys.stderr)
+                        elif args.progress and '/dev/null' not in progress_fns:
+                            monitor = ProgressMonitor(progress_fns, tool == 'bwa', args.m2 is not None,
+                                                      args.reads_per_thread * nthreads or None,
+                                                      args.steady_lo, args.steady_hi, args.early_stop_window,
+                                                      tol=args.early_stop_tol)
                         print('#   Starting processes', file=sys.stderr)
                         ti = datetime.datetime.now()
                         for proc in procs:
                             proc.start()
+                        if monitor is not None:
+                            monitor.watch(procs, done_val, args.timeout, args.progress_interval, args.early_stop)
                         exitlevels = []
                         for proc in procs:
-                            proc.join(args.timeout)
+                            proc.join(args.timeout if monitor is None else max(args.timeout - monitor.elapsed(), 0))
                             if proc.is_alive():
                                 print('#   Process still alive after %d seconds; terminating all processes' % args.timeout,
                                       file=sys.stderr)
@@ -477,8 +496,19 @@ def go(args):
                             top.kill()
                         delt = datetime.datetime.now() - ti
                 print('#   All processes joined; took %f seconds' % delt.total_seconds(), file=sys.stderr)
+                if monitor is not None:
+                    steady = monitor.write(os.path.join(odir, run_name))
+                    if steady is None:
+                        print('#   Too few progress samples for a steady-state rate', file=sys.stderr)
+                    else:
+                        print('#   Steady-state rate: %0.1f reads/sec over [%0.1f, %0.1f] seconds' % steady[:3],
+                              file=sys.stderr)
                 os.system('touch ' + os.path.join(odir, run_name + '.JOIN'))
-                if any(map(lambda x: x is None, exitlevels)):
+                if monitor is not None and monitor.stopped_early:
+                    # aligners were killed, so no per-thread timings; tabulate.py keeps only the steady rate
+                    print('#   Stopped early once the rate was stable', file=sys.stderr)
+                    os.system('touch ' + os.path.join(odir, run_name + '.EARLY_STOP'))
+                elif any(map(lambda x: x is None, exitlevels)):
                     print('#   At least one subprocess timed out', file=sys.stderr)
                     os.system('touch ' + os.path.join(odir, run_name + '.TIME_OUT'))
                 elif any(map(lambda x: x != 0, exitlevels)):
@@ -566,5 +596,21 @@ if __name__ == '__main__':
                         help='Don\'t count reads at the beginning (can be slow)')
     parser.add_argument('--reads-per-thread', metavar='int', type=int, default=0,
                         help='set # of reads to align per thread/process directly, overrides --multiply-reads setting')
+    parser.add_argument('--progress', action='store_const', const=True, default=False,
+                        help='Track reads aligned while each run is in progress, from its SAM output (or bwa\'s '
+                             'stderr), and record a steady-state rate in <run>.steady')
+    parser.add_argument('--progress-interval', metavar='secs', type=float, default=2.0,
+                        help='Seconds between --progress samples')
+    parser.add_argument('--steady-lo', metavar='frac', type=float, default=0.1,
+                        help='Steady state starts once this fraction of the reads are aligned')
+    parser.add_argument('--steady-hi', metavar='frac', type=float, default=0.9,
+                        help='Steady state ends once this fraction of the reads are aligned')
+    parser.add_argument('--early-stop', action='store_const', const=True, default=False,
+                        help='With --progress, stop each run once its steady-state rate is stable; such runs get '
+                             '<run>.EARLY_STOP instead of .SUCCEED and only their steady rate is used')
+    parser.add_argument('--early-stop-window', metavar='secs', type=float, default=10.0,
+                        help='Length of each of the 3 windows whose rates must agree for --early-stop')
+    parser.add_argument('--early-stop-tol', metavar='frac', type=float, default=0.02,
+                        help='Most the window rates may differ from their mean for --early-stop')
 
     go(parser.parse_args())
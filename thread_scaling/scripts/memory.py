@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+
+"""
+Memory scaling from the top logs master.py records with each run
+(<run>.top, all attempts), for all four aligners.  For each snapshot, the
+run's aligner processes are summed counting shared pages (SHR, e.g. an index
+mapped with --mm) once: sum(RES - SHR) + max(SHR).  Per run:
+
+peak_rss    largest snapshot total
+steady_rss  median total over the middle half, by time, of the snapshots
+            with all the run's processes running, i.e. past index loading
+            and before processes exit
+
+Then per (machine, aligner, pe), over all series, least squares with
+non-negative coefficients fits
+
+    rss = fixed + per_proc (nproc - 1) + per_thread threads
+
+fixed is mostly the index, per_proc what each extra process adds (about
+nothing with --mm, a whole index without), and per_thread the threads'
+buffers.  per_proc is only identifiable if the group has runs with one
+process and with several; otherwise it's assumed to be fixed for bwa, which
+master.py never runs with --mm, and 0 for the others (per_proc_fitted = 0).
+
+With --ram, e.g. --ram mcdram=16g,ddr=96g for KNL flat and cache modes, the
+peak fit gives the most threads that fit in each, less --headroom, for
+each layout: threads per process as in master.py (0 is a single process),
+those measured plus --layouts.  Sizes are in MiB throughout.
+"""
+
+from __future__ import print_function
+import sys
+import os
+import numpy
+from tabulate import parse_dir, parse_file
+
+GROUP_KEYS = ['machine', 'aligner', 'pe']
+RUN_KEYS = ['machine', 'aligner', 'series', 'pe', 'threads_per_proc', 'totthreads', 'attempt']
+EXES = {'bt': 'bowtie-align-s', 'bt2': 'bowtie2-align-s', 'ht': 'hisat-align-s', 'bwa': 'bwa'}
+UNITS = {'k': 1, 'm': 2, 'g': 3, 't': 4, 'p': 5}
+MIB = 1024.0 * 1024.0
+
+
+def convert(st, default='k'):
+    """ Bytes in a size like top's RES column, e.g. 5.3g; no suffix means default (top's is KiB) """
+    st = st.lower()
+    if st[-1] in UNITS:
+        return float(st[:-1]) * 1024 ** UNITS[st[-1]]
+    return float(st) * 1024 ** UNITS.get(default, 0)
+
+
+def is_exe(cmd, exe):
+    """ top truncates long commands, marking them with + """
+    cmd = cmd.rstrip('+')
+    return cmd == exe or (len(cmd) >= min(len(exe), 8) and exe.startswith(cmd))
+
+
+def top_samples(fn, exe):
+    """ (# exe processes, RSS in bytes with shared pages counted once) per top snapshot """
+    samples, procs, cols = [], None, None
+
+    def flush():
+        if procs is not None and len(procs) > 0:
+            samples.append((len(procs), sum(r - s for r, s in procs) + max(s for _, s in procs)))
+    with open(fn) as fh:
+        for ln in fh:
+            toks = ln.split()
+            if len(toks) == 0:
+                continue
+            if ln.startswith('top - '):
+                flush()
+                procs = []
+            elif toks[0] == 'PID' and 'RES' in toks:
+                cols = (toks.index('RES'), toks.index('SHR'), toks.index('COMMAND'))
+            elif procs is not None and cols is not None and len(toks) > cols[2] and is_exe(toks[cols[2]], exe):
+                procs.append((convert(toks[cols[0]]), convert(toks[cols[1]])))
+    flush()
+    return samples
+
+
+def run_rss(samples, nproc):
+    """ (peak, steady) RSS in bytes from a run's snapshots """
+    peak = max(t for _, t in samples)
+    full = [t for n, t in samples if n >= nproc] or [t for _, t in samples]
+    k = len(full)
+    return peak, float(numpy.median(full[k // 4:k - k // 4]))
+
+
+def find_tops(system):
+    """ Run record, including its # processes and top log, for every run """
+    runs = []
+    for root, dirs, files in os.walk(os.path.join(system, 'results')):
+        for fn in sorted(files):
+            if not fn.endswith('.top'):
+                continue
+            aligner, series, pe = parse_dir(system, root)
+            threads_per_proc, proc_id, tot_threads, attempt = parse_file(fn, pe)
+            runs.append({'aligner': aligner, 'series': series, 'pe': pe, 'threads_per_proc': threads_per_proc,
+                         'totthreads': tot_threads, 'attempt': attempt,
+                         'nproc': 1 if threads_per_proc == 0 else tot_threads // threads_per_proc,
+                         'fn': os.path.join(root, fn)})
+    return sorted(runs, key=lambda r: tuple(r[k] for k in RUN_KEYS[1:]))
+
+
+def fit(threads, nproc, rss, aligner):
+    """ (fixed, per_proc, per_thread, per_proc fitted?) by least squares, coefficients non-negative """
+    threads, nproc = numpy.asarray(threads, dtype=numpy.float64), numpy.asarray(nproc, dtype=numpy.float64)
+    rss = numpy.asarray(rss, dtype=numpy.float64)
+    cols = numpy.column_stack([numpy.ones(len(rss)), nproc - 1, threads])
+    fitted = numpy.linalg.matrix_rank(cols) == 3
+    subsets = [(0, 1, 2), (0, 1), (0, 2), (0,)] if fitted else [(0, 2), (0,)]
+    best = None
+    for sub in subsets:
+        a = cols[:, list(sub)]
+        coef = numpy.linalg.lstsq(a, rss, rcond=None)[0]
+        if (coef < 0).any():
+            continue
+        sse = ((a.dot(coef) - rss) ** 2).sum()
+        if best is None or sse < best[1]:
+            full = numpy.zeros(3)
+            full[list(sub)] = coef
+            best = (full, sse)
+    if best is None:
+        raise RuntimeError('Could not fit memory model to %d runs' % len(rss))
+    fixed, per_proc, per_thread = best[0]
+    if not fitted:
+        per_proc = fixed if aligner == 'bwa' else 0.0
+    return fixed, per_proc, per_thread, fitted
+
+
+def predict(coef, threads, nproc):
+    fixed, per_proc, per_thread = coef[:3]
+    return fixed + per_proc * (nproc - 1) + per_thread * threads
+
+
+def max_threads(coef, budget, threads_per_proc, limit=None):
+    """ (most threads, # processes) whose predicted RSS fits in budget; limit caps the threads """
+    fixed, per_proc, per_thread = coef[:3]
+    k = threads_per_proc
+    if k == 0:
+        cost, extra = per_thread, budget - fixed
+    else:
+        cost, extra = per_proc / k + per_thread, budget - fixed + per_proc
+    n = float('inf') if cost <= 0 else extra / cost
+    if limit is not None:
+        n = min(n, limit)
+    if budget < fixed:
+        n = 0
+    if n == float('inf'):
+        return n, 1 if k == 0 else n
+    n = int(n)
+    if k > 0:
+        n -= n % k
+    return n, 1 if k == 0 else n // k
+
+
+def parse_ram(st):
+    """ [(name, bytes)] from name=size,name=size,... (a bare size is its own name) """
+    res = []
+    for tok in st.rstrip(',').split(','):
+        name, _, size = tok.rpartition('=')
+        res.append((name or size, convert(size, default='')))
+    return res
+
+
+def go(args):
+    rams = [] if args.ram is None else parse_ram(args.ram)
+    extra_layouts = [] if args.layouts is None else list(map(int, args.layouts.rstrip(',').split(',')))
+    machine = args.machine or os.path.basename(os.path.normpath(args.system))
+    runs = find_tops(args.system)
+    if len(runs) == 0:
+        raise RuntimeError('No .top files under "%s"' % os.path.join(args.system, 'results'))
+    print('\t'.join(RUN_KEYS + ['nproc', 'nsamples', 'peak_rss', 'steady_rss']))
+    groups = {}
+    for run in runs:
+        run['machine'] = machine
+        samples = top_samples(run['fn'], EXES[run['aligner']])
+        if len(samples) == 0:
+            print('WARNING: no %s processes in "%s"' % (EXES[run['aligner']], run['fn']), file=sys.stderr)
+            continue
+        peak, steady = run_rss(samples, run['nproc'])
+        print('\t'.join(['%s' % run[k] for k in RUN_KEYS] + ['%d' % run['nproc'], '%d' % len(samples),
+                                                            '%0.1f' % (peak / MIB), '%0.1f' % (steady / MIB)]))
+        g = groups.setdefault(tuple(run[k] for k in GROUP_KEYS), [])
+        g.append((run['totthreads'], run['nproc'], run['threads_per_proc'], peak, steady))
+    print()
+    print('\t'.join(GROUP_KEYS + ['nruns', 'per_proc_fitted'] +
+                    ['%s_%s' % (w, c) for w in ['peak', 'steady'] for c in ['fixed', 'per_proc', 'per_thread', 'rmse']]))
+    models = {}
+    for key, g in sorted(groups.items()):
+        threads, nproc, _, peak, steady = [numpy.array(c, dtype=numpy.float64) for c in zip(*g)]
+        row = []
+        for rss in [peak, steady]:
+            coef = fit(threads, nproc, rss, key[1])
+            rmse = numpy.sqrt(numpy.mean((predict(coef, threads, nproc) - rss) ** 2))
+            row.extend(['%0.1f' % (v / MIB) for v in coef[:3] + (rmse,)])
+            models.setdefault(key, coef)
+        print('\t'.join(list(key) + ['%d' % len(g), '%d' % models[key][3]] + row))
+    if len(rams) == 0:
+        return
+    print()
+    print('\t'.join(GROUP_KEYS + ['ram', 'ram_size', 'budget', 'threads_per_proc', 'max_threads', 'nproc',
+                                  'peak_rss']))
+    for key, g in sorted(groups.items()):
+        coef = models[key]
+        layouts = sorted(set([r[2] for r in g] + extra_layouts))
+        for name, size in rams:
+            budget = size * (1.0 - args.headroom)
+            for k in layouts:
+                n, nproc = max_threads(coef, budget, k, args.max_threads)
+                pred = 'NA' if n == 0 or n == float('inf') else '%0.1f' % (predict(coef, n, nproc) / MIB)
+                print('\t'.join(list(key) + [name, '%0.1f' % (size / MIB), '%0.1f' % (budget / MIB), '%d' % k,
+                                             '%s' % n, '%s' % nproc, pred]))
+
+
+if __name__ == '__main__':
+
+    import argparse
+    parser = argparse.ArgumentParser(description='Model memory scaling and plan thread/process layouts.')
+
+    parser.add_argument('system', metavar='dir', type=str,
+                        help='System directory, with runs under <dir>/results.')
+    parser.add_argument('--machine', metavar='name', type=str,
+                        help='Machine name to report; default: the system directory\'s name.')
+    parser.add_argument('--ram', metavar='name=size,...', type=str,
+                        help='Memory sizes to plan for, e.g. mcdram=16g,ddr=96g (k/m/g/t suffixes; none is bytes).')
+    parser.add_argument('--headroom', metavar='frac', type=float, default=0.05,
+                        help='Fraction of each --ram size to leave for the OS and page cache.')
+    parser.add_argument('--layouts', metavar='int,int,...', type=str,
+                        help='Also plan for these # threads per process (0 is a single process).')
+    parser.add_argument('--max-threads', metavar='int', type=int,
+                        help='Cap planned thread counts at this, e.g. the node\'s hardware threads.')
+
+    go(parser.parse_args())
@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+
+"""
+Writes gzip- or BGZF-compatible files, compressing independent chunks of the
+input in parallel.
+
+The byte stream is cut into fixed-size chunks; each chunk is deflated on its
+own into a complete gzip member and members are written in input order.
+Concatenated gzip members are a valid gzip file, so the output can be read
+with gunzip, zcat, Python's gzip module, etc.  BGZF is the same thing with
+small (<= 64K) chunks and an extra header field recording the member size,
+plus an empty EOF member; it can be read by htslib/samtools as well.
+
+Chunk boundaries depend only on the bytes written, zlib is deterministic and
+the member headers carry no timestamp or name, so the output is byte-identical
+from run to run regardless of the number of workers.  sync() makes what has
+been written durable and returns a state from which a new writer can pick up
+(resume=), e.g. after a job is killed; the result is still byte-identical.
+Each sync() writes the partial chunk to its own side file, so a state saved
+by an earlier sync() stays valid until the caller has saved the newer one.
+"""
+
+from __future__ import print_function
+import os
+import glob
+import struct
+import zlib
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+from collections import deque
+
+
+# Largest uncompressed BGZF chunk; leaves room for deflate overhead so a
+# compressed member never exceeds 64K, as htslib does
+BGZF_MAX_CHUNK = 0xff00
+
+GZIP_CHUNK = 4 * 1024 * 1024
+
+# Empty BGZF member marking end of file
+BGZF_EOF = b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00\x42\x43\x02\x00\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00'
+
+# magic, CM=deflate, FLG, MTIME=0, XFL=0, OS=255 (unknown, so output doesn't
+# depend on the platform zlib was built for)
+_GZIP_HEADER = b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff'
+
+FORMATS = ['gzip', 'bgzf']
+
+
+def _deflate_raw(data, level):
+    comp = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return comp.compress(data) + comp.flush()
+
+
+def _trailer(data):
+    return struct.pack('<II', zlib.crc32(data) & 0xffffffff, len(data) & 0xffffffff)
+
+
+def gzip_member(data, level=6):
+    """ Compress data into a single, self-contained gzip member """
+    return _GZIP_HEADER + _deflate_raw(data, level) + _trailer(data)
+
+
+def bgzf_member(data, level=6):
+    """ Compress data (at most BGZF_MAX_CHUNK bytes) into a BGZF member """
+    assert len(data) <= BGZF_MAX_CHUNK
+    cdata = _deflate_raw(data, level)
+    bsize = 18 + len(cdata) + 8
+    # FLG=FEXTRA, XLEN=6, subfield 'BC' of length 2 holding total member size - 1
+    header = struct.pack('<BBBBIBBHBBHH', 0x1f, 0x8b, 8, 4, 0, 0, 0xff, 6, 66, 67, 2, bsize - 1)
+    return header + cdata + _trailer(data)
+
+
+def _compress_chunk(job):
+    """ Top-level so that it can be shipped to a process pool """
+    fmt, level, data = job
+    if fmt == 'bgzf':
+        return bgzf_member(data, level)
+    return gzip_member(data, level)
+
+
+class ParallelGzipWriter(object):
+    """
+    File-like object that compresses what's written to it in a pool of
+    threads (zlib releases the GIL while deflating) or processes.
+    """
+
+    def __init__(self, fn, fmt='gzip', level=6, nworkers=1, processes=False, chunk_size=None, resume=None):
+        if fmt not in FORMATS:
+            raise RuntimeError('Unknown compression format: "%s"' % fmt)
+        if chunk_size is None:
+            chunk_size = BGZF_MAX_CHUNK if fmt == 'bgzf' else GZIP_CHUNK
+        if fmt == 'bgzf' and chunk_size > BGZF_MAX_CHUNK:
+            raise RuntimeError('BGZF chunk size must be <= %d' % BGZF_MAX_CHUNK)
+        self.fn = fn
+        self.fmt = fmt
+        self.level = level
+        self.chunk_size = chunk_size
+        self.buf = []
+        self.buf_len = 0
+        if resume is None:
+            self.ofh = open(fn, 'wb')
+        else:
+            # drop anything written after the sync, then restore the partial chunk
+            self.ofh = open(fn, 'r+b')
+            self.ofh.truncate(resume['bytes'])
+            self.ofh.seek(resume['bytes'])
+        self.pool = None
+        if nworkers > 1:
+            self.pool = multiprocessing.Pool(nworkers) if processes else ThreadPool(nworkers)
+        # bound the # chunks in flight so memory doesn't grow with the input
+        self.max_pending = 4 * max(nworkers, 1)
+        self.pending = deque()
+        # side files of the last two syncs; the caller may not have saved the last one yet
+        self.nsyncs = 0 if resume is None else resume['seq'] + 1
+        self.tails = [] if resume is None else [resume['tail']]
+        if resume is not None:
+            with open(resume['tail'], 'rb') as fh:
+                self.write(fh.read())
+
+    def write(self, data):
+        self.buf.append(data)
+        self.buf_len += len(data)
+        if self.buf_len >= self.chunk_size:
+            joined = b''.join(self.buf)
+            nfull = len(joined) // self.chunk_size
+            for i in range(nfull):
+                self._submit(joined[i * self.chunk_size:(i + 1) * self.chunk_size])
+            rest = joined[nfull * self.chunk_size:]
+            self.buf = [rest] if len(rest) > 0 else []
+            self.buf_len = len(rest)
+
+    def _submit(self, data):
+        job = (self.fmt, self.level, data)
+        if self.pool is None:
+            self.ofh.write(_compress_chunk(job))
+            return
+        self.pending.append(self.pool.apply_async(_compress_chunk, (job,)))
+        while len(self.pending) > self.max_pending:
+            self.ofh.write(self.pending.popleft().get())
+
+    def _drain(self):
+        while len(self.pending) > 0:
+            self.ofh.write(self.pending.popleft().get())
+
+    def sync(self):
+        """
+        Write out and fsync all whole chunks; the partial chunk goes to a
+        new side file.  Returns the state to pass as resume= to pick up from
+        here.  Side files from before the previous sync() are removed: by now
+        the caller has saved that sync's state, and only it or this one can
+        be resumed from.
+        """
+        self._drain()
+        self.ofh.flush()
+        os.fsync(self.ofh.fileno())
+        tail_fn = '%s.tail.%d' % (self.fn, self.nsyncs)
+        with open(tail_fn + '.tmp', 'wb') as ofh:
+            ofh.write(b''.join(self.buf))
+            ofh.flush()
+            os.fsync(ofh.fileno())
+        os.rename(tail_fn + '.tmp', tail_fn)
+        self.tails = self.tails[-1:] + [tail_fn]
+        for fn in glob.glob(self.fn + '.tail.*'):
+            if fn not in self.tails:
+                os.remove(fn)
+        self.nsyncs += 1
+        return {'bytes': self.ofh.tell(), 'tail': tail_fn, 'seq': self.nsyncs - 1}
+
+    def close(self):
+        if self.ofh is None:
+            return
+        if self.buf_len > 0:
+            self._submit(b''.join(self.buf))
+        self.buf, self.buf_len = [], 0
+        self._drain()
+        if self.fmt == 'bgzf':
+            self.ofh.write(BGZF_EOF)
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        self.ofh.close()
+        self.ofh = None
+        for fn in glob.glob(self.fn + '.tail.*'):
+            os.remove(fn)
+
+    def abort(self):
+        """
+        Stop without finishing the file, e.g. on an error; output and the
+        side file are left as of the last sync() so that we can resume
+        """
+        if self.ofh is None:
+            return
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+        self.ofh.close()
+        self.ofh = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+
+if __name__ == '__main__':
+
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description='Compress a file (or stdin) into gzip or BGZF format in parallel.')
+
+    parser.add_argument('--input', metavar='path', type=str,
+                        help='File to compress; default: stdin.')
+    parser.add_argument('--output', metavar='path', type=str, required=True,
+                        help='Compressed output file.')
+    parser.add_argument('--format', type=str, choices=FORMATS, default='gzip',
+                        help='Compressed format to write.')
+    parser.add_argument('--level', metavar='int', type=int, default=6,
+                        help='zlib compression level.')
+    parser.add_argument('--threads', metavar='int', type=int, default=multiprocessing.cpu_count(),
+                        help='# compression workers.')
+    parser.add_argument('--processes', action='store_const', const=True, default=False,
+                        help='Use a pool of processes rather than threads.')
+    args = parser.parse_args()
+
+    ifh = open(args.input, 'rb') if args.input is not None else getattr(sys.stdin, 'buffer', sys.stdin)
+    with ParallelGzipWriter(args.output, fmt=args.format, level=args.level,
+                            nworkers=args.threads, processes=args.processes) as ofh:
+        while True:
+            buf = ifh.read(GZIP_CHUNK)
+            if len(buf) == 0:
+                break
+            ofh.write(buf)
@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+
+"""
+Live progress of aligner runs, for master.py --progress.  While a run is in
+progress we poll, every few seconds, how many reads have been aligned so
+far, from either:
+
+- the growth of each process's SAM output: the primary records (neither
+  secondary, 0x100, nor supplementary, 0x800) appended since the last
+  poll, or
+- bwa's .err, whose "[M::mem_process_seqs] Processed N reads" lines say when
+  each batch is done (bwa's "[M::process] read N sequences" lines are
+  printed when a batch is read, before it's aligned)
+
+Mates are counted separately, so paired-end counts are halved.  The samples
+give a steady-state rate: the least-squares slope of reads vs. time while
+between --steady-lo and --steady-hi of the run's reads were done, which
+leaves out index loading and warm-up at the start and threads running dry
+at the end.  With --early-stop, the run is stopped once the rate over each
+of the last few windows is within a tolerance of their mean.
+"""
+
+from __future__ import print_function
+import os
+import re
+import time
+
+SAM_FLAG = re.compile(br'^[^@\t\n][^\t\n]*\t(\d+)\t', re.M)
+BWA_DONE = re.compile(br'^\[M::mem_process_seqs\] Processed (\d+) reads', re.M)
+
+
+class Tail(object):
+    """ Counts things in the complete lines appended to a file since the last poll """
+
+    def __init__(self, fn, count):
+        self.fn = fn
+        self.count = count
+        self.offset = 0
+        self.carry = b''
+        self.total = 0
+
+    def poll(self):
+        if not os.path.exists(self.fn):
+            return self.total
+        with open(self.fn, 'rb') as fh:
+            fh.seek(self.offset)
+            buf = fh.read()
+        self.offset += len(buf)
+        buf = self.carry + buf
+        end = buf.rfind(b'\n') + 1
+        self.carry = buf[end:]
+        self.total += self.count(buf[:end])
+        return self.total
+
+
+def count_sam(buf):
+    return sum(1 for flag in SAM_FLAG.findall(buf) if int(flag) & 0x900 == 0)
+
+
+def count_bwa(buf):
+    return sum(int(n) for n in BWA_DONE.findall(buf))
+
+
+def slope(samples):
+    """ Least-squares slope of reads vs. time """
+    n = float(len(samples))
+    mt = sum(t for t, _ in samples) / n
+    mr = sum(r for _, r in samples) / n
+    sxx = sum((t - mt) ** 2 for t, _ in samples)
+    if sxx == 0:
+        return float('nan')
+    return sum((t - mt) * (r - mr) for t, r in samples) / sxx
+
+
+class ProgressMonitor(object):
+
+    def __init__(self, fns, bwa, paired, total, steady_lo=0.1, steady_hi=0.9, window=10.0, windows=3, tol=0.02):
+        self.tails = [Tail(fn, count_bwa if bwa else count_sam) for fn in fns]
+        self.per_read = 2 if paired else 1
+        # expected # reads, or None to judge from the final count
+        self.total = total
+        self.steady_lo, self.steady_hi = steady_lo, steady_hi
+        self.window, self.windows, self.tol = window, windows, tol
+        self.start = time.time()
+        self.samples = []
+        self.stopped_early = False
+
+    def elapsed(self):
+        return time.time() - self.start
+
+    def poll(self):
+        reads = sum(t.poll() for t in self.tails) // self.per_read
+        self.samples.append((self.elapsed(), reads))
+        return reads
+
+    def stable(self):
+        """ True once the rates over the last few windows past warm-up agree """
+        if self.total is None or len(self.samples) < 2:
+            return False
+        now = self.samples[-1][0]
+        past = [s for s in self.samples if s[1] >= self.steady_lo * self.total]
+        if len(past) == 0 or now - past[0][0] < self.window * self.windows:
+            return False
+        rates = []
+        for k in range(self.windows):
+            lo, hi = now - (k + 1) * self.window, now - k * self.window
+            win = [s for s in past if lo <= s[0] <= hi]
+            if len(win) < 2:
+                return False
+            rates.append(slope(win))
+        mean = sum(rates) / len(rates)
+        return mean > 0 and max(abs(r - mean) for r in rates) <= self.tol * mean
+
+    def watch(self, procs, done_val, timeout, interval, early_stop=False):
+        """ Poll until the processes finish, timeout passes or, with early_stop, the rate is stable """
+        while any(p.is_alive() for p in procs) and self.elapsed() < timeout:
+            time.sleep(interval)
+            self.poll()
+            if early_stop and self.stable():
+                self.stopped_early = True
+                done_val.value = 1
+                return
+        self.poll()
+
+    def steady(self):
+        """ (reads per second, window start, window end, reads in window), or None if too few samples """
+        final = self.samples[-1][1]
+        total = final if self.total is None else self.total
+        # stopped early, the run never drained
+        hi = final if self.stopped_early else self.steady_hi * total
+        win = [s for s in self.samples if self.steady_lo * total <= s[1] <= hi]
+        if len(win) < 3:
+            return None
+        return slope(win), win[0][0], win[-1][0], win[-1][1] - win[0][1]
+
+    def write(self, prefix):
+        """ Samples to prefix.progress and the steady-state rate to prefix.steady; returns the latter """
+        with open(prefix + '.progress', 'w') as ofh:
+            ofh.write('secs\treads\n')
+            for t, r in self.samples:
+                ofh.write('%0.3f\t%d\n' % (t, r))
+        st = self.steady()
+        with open(prefix + '.steady', 'w') as ofh:
+            ofh.write('reads_per_sec\twindow_start\twindow_end\twindow_reads\tearly_stop\n')
+            if st is None:
+                ofh.write('NA\tNA\tNA\tNA\t%d\n' % self.stopped_early)
+            else:
+                ofh.write('%0.3f\t%0.3f\t%0.3f\t%d\t%d\n' % (st + (self.stopped_early,)))
+        return st
+
+
+if __name__ == '__main__':
+
+    import sys
+    import shutil
+    import tempfile
+    import unittest
+
+    def ramp(rates, dt=0.5):
+        """ Samples every dt seconds, for (seconds, reads/sec) phases in turn """
+        samples, t, reads = [(0.0, 0)], 0.0, 0.0
+        for secs, rate in rates:
+            for _ in range(int(round(secs / dt))):
+                t += dt
+                reads += rate * dt
+                samples.append((t, int(round(reads))))
+        return samples
+
+    def monitor(samples, total, **kwargs):
+        mon = ProgressMonitor([], False, False, total, **kwargs)
+        mon.samples = list(samples)
+        return mon
+
+    class TestProgressMonitor(unittest.TestCase):
+
+        def test_steady_skips_warmup_and_drain(self):
+            # 10 reads/sec for the first 10% and last 10%, 100 reads/sec between
+            mon = monitor(ramp([(10, 10), (8, 100), (10, 10)]), 1000)
+            rate, start, end, nreads = mon.steady()
+            self.assertAlmostEqual(100.0, rate, delta=1.0)
+            self.assertGreaterEqual(start, 10.0)
+            self.assertLessEqual(end, 18.0)
+
+        def test_steady_total_from_final_count(self):
+            mon = monitor(ramp([(10, 10), (8, 100), (10, 10)]), None)
+            self.assertAlmostEqual(100.0, mon.steady()[0], delta=1.0)
+
+        def test_steady_stopped_early(self):
+            # stopped at 50% of the expected reads: the window runs to the end
+            mon = monitor(ramp([(10, 10), (4, 100)]), 1000)
+            mon.stopped_early = True
+            rate, start, end, nreads = mon.steady()
+            self.assertAlmostEqual(100.0, rate, delta=1.0)
+            self.assertEqual(14.0, end)
+
+        def test_steady_too_few_samples(self):
+            self.assertIsNone(monitor([(0.0, 0), (1.0, 500), (2.0, 1000)], 1000).steady())
+
+        def test_stable(self):
+            # needs 3 windows of 1 sec past 10% of the reads, all at the same rate
+            samples = ramp([(1, 100), (4, 100)], dt=0.25)
+            self.assertTrue(monitor(samples, 1000, window=1.0).stable())
+            self.assertFalse(monitor(samples[:-5], 1000, window=1.0).stable())
+            self.assertFalse(monitor(samples, None, window=1.0).stable())
+
+        def test_not_stable_while_rate_changes(self):
+            samples = ramp([(2, 100), (1, 100), (1, 110), (1, 120)], dt=0.25)
+            self.assertFalse(monitor(samples, 1000, window=1.0).stable())
+            self.assertTrue(monitor(samples, 1000, window=1.0, tol=0.2).stable())
+
+    class TestTail(unittest.TestCase):
+
+        def setUp(self):
+            self.tmp = tempfile.mkdtemp()
+            self.fn = os.path.join(self.tmp, 'out')
+
+        def tearDown(self):
+            shutil.rmtree(self.tmp)
+
+        def append(self, data):
+            with open(self.fn, 'ab') as fh:
+                fh.write(data)
+
+        def test_sam(self):
+            tail = Tail(self.fn, count_sam)
+            self.assertEqual(0, tail.poll())
+            self.append(b'@HD\tVN:1.0\nr1\t0\tchr1\t1\nr1\t256\tchr1\t9\nr2\t2048\tchr1\t5\nr3\t16\tch')
+            self.assertEqual(1, tail.poll())
+            self.append(b'r1\t5\n')
+            self.assertEqual(2, tail.poll())
+
+        def test_bwa(self):
+            tail = Tail(self.fn, count_bwa)
+            self.append(b'[M::process] read 100 sequences\n[M::mem_process_seqs] Processed 100 reads in 1 CPU sec\n')
+            self.assertEqual(100, tail.poll())
+            self.append(b'[M::mem_process_seqs] Processed 40 reads in 1 CPU sec\n')
+            self.assertEqual(140, tail.poll())
+
+    if '--test' in sys.argv:
+        unittest.main(argv=[sys.argv[0]])
+    else:
+        print('Used by master.py --progress; run with --test for unit tests', file=sys.stderr)
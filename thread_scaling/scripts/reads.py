@@ -6,10 +6,18 @@ Constructs reads files for thread-scaling experiments.
   bowtie2 and hisat
 - Can trim reads as it goes, so can produce either reads the same length as
   input, or shorter for tools like bowtie
+- Can write gzip- or BGZF-compressed output directly (--compress), deflating
+  chunks in parallel; output is byte-identical across runs for a given seed
+- Can sample several shards in parallel (--shards/--workers) and shuffle them
+  together with one global permutation, so any prefix of the output is a
+  uniform sample of the whole corpus
+- Checkpoints progress within each stage; a killed job restarted with --resume
+  continues from its last checkpoint, skipping completed stages whose outputs
+  still match their checksums
 
 To construct inputs for our experiments:
-- pypy reads.py --prefix=mix100 --reads-per-accession=100000000
-- pypy reads.py --trim-to 50 --max-read-size 175 --prefix=mix50 --reads-per-accession=100000000
+- pypy reads.py --prefix=mix100 --reads-per-accession=10000000 --shards 10 --workers 10 --seed 0
+- pypy reads.py --trim-to 50 --max-read-size 175 --prefix=mix50 --reads-per-accession=10000000 --shards 10 --workers 10 --seed 0
 """
 
 from __future__ import print_function
@@ -20,16 +28,21 @@ import os
 import numpy as np
 import subprocess
 import shutil
+import multiprocessing
+from parallel_gz import ParallelGzipWriter, FORMATS
+from fastq_chunks import iter_paired_chunks, DEFAULT_CHUNK
+from checkpoint import Manifest, Interval, fsync_file, open_truncated
 
 
 class ReservoirSampler(object):
     """ Simple reservoir sampler """
 
-    def __init__(self, k, fn):
+    def __init__(self, k, fn, n=0, nbytes=None):
         self.k = k  # # elts to collect
-        self.n = 0  # # elts scanned
+        self.n = n  # # elts scanned
         self.fn = fn
-        self.ofh = open(fn, 'wb')
+        # when resuming, drop anything written after the checkpoint
+        self.ofh = open(fn, 'wb') if nbytes is None else open_truncated(fn, nbytes)
 
     def add_pre(self):
         if self.n < self.k:
@@ -43,6 +56,11 @@ class ReservoirSampler(object):
     def add_post(self, obj, j):
         self.ofh.write('\t'.join([str(j)] + list(map(str, obj))) + '\n')
 
+    def sync(self):
+        """ Make records written so far durable; returns # bytes written """
+        fsync_file(self.ofh)
+        return self.ofh.tell()
+
     def close(self):
         if self.ofh is not None:
             self.ofh.close()
@@ -64,6 +82,17 @@ def wcl(fn):
     return int(subprocess.check_output('wc -l ' + fn, shell=True).strip().split()[0])
 
 
+def open_output(fn, args, state=None):
+    """
+    Open an output FASTQ, compressing it if --compress was specified.  If
+    state (from sync_output) is given, continue from that point.
+    """
+    if args.compress is None:
+        return open(fn, 'wb') if state is None else open_truncated(fn, state['bytes'])
+    return ParallelGzipWriter(fn + '.gz', fmt=args.compress, level=args.compress_level,
+                              nworkers=args.compress_threads, processes=args.compress_processes, resume=state)
+
+
 reads = [
     # https://www.ncbi.nlm.nih.gov/sra/?term=ERR194147
     # Platinum genomes project, Illumina Cambridge
@@ -118,185 +147,324 @@ def reverse_readline(filename, buf_size=8192):
             yield segment
 
 
+ival_mult = 1.2
+
+
+def rng_state():
+    st = random.getstate()
+    return [st[0], list(st[1]), st[2]]
+
+
+def set_rng_state(st):
+    random.setstate((st[0], tuple(st[1]), st[2]))
+
+
+def skip_bytes(fh, nbytes, bufsize=DEFAULT_CHUNK):
+    """ Read past the first nbytes of a (decompressed) stream """
+    while nbytes > 0:
+        buf = fh.read(min(nbytes, bufsize))
+        if len(buf) == 0:
+            raise RuntimeError('Input ended before checkpointed position')
+        nbytes -= len(buf)
+
+
+def save_position(man, acc, n, last_seqlen, nfile=0, offset1=0, offset2=0, samp=None):
+    """
+    Checkpoint the sampling of a shard: we're nfile reads (offset1/offset2
+    decompressed bytes) into accession acc, with the given reservoir and
+    random state
+    """
+    pos = {'acc': acc, 'n': n, 'last_seqlen': last_seqlen, 'rng': rng_state(),
+           'nfile': nfile, 'offset1': offset1, 'offset2': offset2}
+    if samp is not None:
+        pos['res_n'] = samp.n
+        pos['res_bytes'] = samp.sync()
+    man.put('position', pos)
+
+
+def sample_shard(args, shard, reads_per_accession, tmpfns):
+    """
+    Reservoir-sample reads_per_accession read pairs from each accession into
+    the given temporary files.  Each shard draws from its own seed, so shards
+    can be sampled in parallel and shard 0 matches an unsharded run.  Returns
+    True iff any sampling was (re)done, False if the shard was already
+    complete.
+    """
+    lab = ('shard %d: ' % shard) if args.shards > 1 else ''
+    man = Manifest(os.path.join(args.temp_dir, '.reads.py.shard%d.json' % shard))
+    if args.resume and man.verify_stage('sample'):
+        print(lab + 'Already sampled', file=sys.stderr)
+        return False
+    pos = man.get('position') if args.resume else None
+    if pos is None:
+        random.seed(args.seed + shard)
+        pos = {'acc': 0, 'n': 0, 'last_seqlen': None}
+    else:
+        print(lab + 'Resuming from checkpoint after %d reads' % pos['n'], file=sys.stderr)
+        set_rng_state(pos['rng'])
+    interval = Interval(args.checkpoint_secs)
+    n = pos['n']
+    ival = max(100, int(n * ival_mult))
+    last_seqlen = pos['last_seqlen']
+    for acc in range(pos['acc'], len(reads)):
+        rd = reads[acc]
+        print(lab + 'Handling ' + rd['srr'], file=sys.stderr)
+        for ur in ['url1', 'url2']:
+            if not os.path.exists(os.path.basename(rd[ur])):
+                raise RuntimeError('No file for %s' % rd[ur])
+        if acc == pos['acc'] and 'res_bytes' in pos:
+            samp = ReservoirSampler(reads_per_accession, tmpfns[acc], pos['res_n'], pos['res_bytes'])
+            nfile, base1, base2 = pos['nfile'], pos['offset1'], pos['offset2']
+        else:
+            samp = ReservoirSampler(reads_per_accession, tmpfns[acc])
+            nfile, base1, base2 = 0, 0, 0
+        with gzip.open(os.path.basename(rd['url1']), 'rb') as r1:
+            with gzip.open(os.path.basename(rd['url2']), 'rb') as r2:
+                # still have to decompress up to the checkpoint, but not parse
+                skip_bytes(r1, base1)
+                skip_bytes(r2, base2)
+                for c1, c2 in iter_paired_chunks(r1, r2, args.chunk_bytes):
+                    c1.validate()
+                    c2.validate()
+                    seqlens = c1.seq_lens
+                    if last_seqlen is None:
+                        last_seqlen = int(seqlens[0])
+                    if (seqlens != last_seqlen).any() or (seqlens != c2.seq_lens).any():
+                        raise RuntimeError('Reads in %s are not all %d nt long' % (rd['srr'], last_seqlen))
+                    nrecs = len(c1)
+                    if args.stop_after is not None:
+                        nrecs = min(nrecs, args.stop_after - nfile)
+                    # reservoir decisions are sequential, parsing and trimming are not
+                    js = [samp.add_pre() for _ in range(nrecs)]
+                    keep = [i for i in range(nrecs) if js[i] is not None]
+                    if len(keep) > 0:
+                        keep_arr = np.array(keep, dtype=np.int64)
+                        fields = []
+                        for c in [c1, c2]:
+                            seq_end, qual_end = c.trimmed_ends(args.trim_to)
+                            fields.append([c.starts[keep_arr, 0].tolist(), c.ends[keep_arr, 0].tolist(),
+                                           c.starts[keep_arr, 1].tolist(), seq_end[keep_arr].tolist(),
+                                           c.starts[keep_arr, 3].tolist(), qual_end[keep_arr].tolist()])
+                        (hs1, he1, ss1, se1, qs1, qe1), (hs2, he2, ss2, se2, qs2, qe2) = fields
+                        b1, b2 = c1.buf, c2.buf
+                        for k, i in enumerate(keep):
+                            samp.add_post([b1[hs1[k]:he1[k]].rstrip(), b1[ss1[k]:se1[k]], '+', b1[qs1[k]:qe1[k]],
+                                           b2[hs2[k]:he2[k]].rstrip(), b2[ss2[k]:se2[k]], '+', b2[qs2[k]:qe2[k]]],
+                                          js[i])
+                    n += nrecs
+                    nfile += nrecs
+                    if n >= ival:
+                        ival = int(n * ival_mult)
+                        print(lab + '  processed %d reads' % n, file=sys.stderr)
+                    if args.stop_after is not None and nfile >= args.stop_after:
+                        break
+                    if interval.due():
+                        save_position(man, acc, n, last_seqlen, nfile,
+                                      base1 + c1.offset + c1.nbytes, base2 + c2.offset + c2.nbytes, samp)
+                else:
+                    # reading one past the last record cost one more draw
+                    samp.add_pre()
+        samp.close()
+        save_position(man, acc + 1, n, last_seqlen)
+    man.stage_done('sample', tmpfns)
+    return True
+
+
+def _sample_shard_job(job):
+    return sample_shard(*job)
+
+
+def output_fn(fn, args):
+    return fn + '.gz' if args.compress is not None else fn
+
+
+def sync_output(ofh):
+    """ Make output written so far durable; returns state for open_output """
+    if isinstance(ofh, ParallelGzipWriter):
+        return ofh.sync()
+    fsync_file(ofh)
+    return {'bytes': ofh.tell()}
+
+
 def go(args):
     random.seed(args.seed)
     np.random.seed(args.seed)
     if not args.resume and os.path.exists(args.temp_dir):
         raise RuntimeError('--temp-dir %s already exists' % args.temp_dir)
+    if args.shards < 1:
+        raise RuntimeError('--shards must be at least 1')
     mkdir_quiet(args.temp_dir)
     block_sz = args.block_boundary
     reads_per_block = int(block_sz / args.max_read_size)
 
     reads_per_accession = args.reads_per_accession - (args.reads_per_accession % reads_per_block)
     assert reads_per_accession % reads_per_block == 0
-    tmpfns = [os.path.join(args.temp_dir, '.reads.py.tmp%d') % i for i in range(len(reads))]
-    samplers = [ReservoirSampler(reads_per_accession, tmpfns[i]) for i in range(len(reads))]
+    # one reservoir per (shard, accession); shard 0 keeps the unsharded names
+    tmpfns = [[os.path.join(args.temp_dir, '.reads.py.tmp%d') % (shard * len(reads) + i) for i in range(len(reads))]
+              for shard in range(args.shards)]
     unsrt_fn = os.path.join(args.temp_dir, '.reads.py.unsorted')
-    nreads = reads_per_accession * len(samplers)
-
-    ival_mult = 1.2
-    if (os.path.exists(unsrt_fn) and args.resume) or not os.path.exists(unsrt_fn):
-        n = 0
-        ival = 100
-        last_seqlen = None
-        print('*** Initial sampling run ***', file=sys.stderr)
-        for rd, samp in zip(reads, samplers):
-            print('Handling ' + rd['srr'], file=sys.stderr)
-            for ur in ['url1', 'url2']:
-                if not os.path.exists(os.path.basename(rd[ur])):
-                    raise RuntimeError('No file for %s' % rd[ur])
-            nfile = 0
-            with gzip.open(os.path.basename(rd['url1']), 'rb') as r1:
-                with gzip.open(os.path.basename(rd['url2']), 'rb') as r2:
-                    while True:
-                        j = samp.add_pre()
-                        if j is not None:
-                            l1 = r1.readline().rstrip()
-                            l2 = r2.readline().rstrip()
-                            if len(l1) == 0:
-                                break
-                            seq1 = r1.readline().rstrip()
-                            seq2 = r2.readline().rstrip()
-                            assert last_seqlen is None or len(seq1) == last_seqlen
-                            last_seqlen = len(seq1)
-                            assert len(seq1) > 0
-                            assert len(seq1) == len(seq2)
-                            r1.readline()
-                            r2.readline()
-                            qual1 = r1.readline().rstrip()
-                            qual2 = r2.readline().rstrip()
-                            assert len(qual1) > 0
-                            assert len(qual1) == len(seq1)
-                            assert len(qual1) == len(qual2)
-                            if len(seq1) > args.trim_to:
-                                seq1 = seq1[:args.trim_to]
-                                qual1 = qual1[:args.trim_to]
-                            if len(seq2) > args.trim_to:
-                                seq2 = seq2[:args.trim_to]
-                                qual2 = qual2[:args.trim_to]
-                            samp.add_post([l1, seq1, '+', qual1, l2, seq2, '+', qual2], j)
-                        else:
-                            # skip
-                            if len(r1.readline()) == 0:
-                                break
-                            r2.readline()
-                            for r in [r1, r2]:
-                                for _ in range(3):
-                                    r.readline()
+    srt_fn = os.path.join(args.temp_dir, '.reads.py.sorted')
+    nreads = reads_per_accession * len(reads) * args.shards
+
+    # Stages record their progress here; with --resume we pick up from the
+    # last checkpoint and skip stages whose outputs still match their checksums
+    man = Manifest(os.path.join(args.temp_dir, '.reads.py.manifest.json'))
+
+    if args.resume and man.verify_stage('sort'):
+        print('*** Sorted sample file already complete ***', file=sys.stderr)
+    else:
+        if args.resume and man.verify_stage('permute'):
+            print('*** Permuted sample file already complete ***', file=sys.stderr)
+        else:
+            print('*** Initial sampling run ***', file=sys.stderr)
+            jobs = [(args, shard, reads_per_accession, tmpfns[shard]) for shard in range(args.shards)]
+            if args.workers > 1 and args.shards > 1:
+                print('Sampling %d shards with %d workers' % (args.shards, args.workers), file=sys.stderr)
+                pool = multiprocessing.Pool(min(args.workers, args.shards))
+                resampled = pool.map(_sample_shard_job, jobs, chunksize=1)
+                pool.close()
+                pool.join()
+            else:
+                resampled = [_sample_shard_job(job) for job in jobs]
+
+            print('*** Permuting ***', file=sys.stderr)
+            pos = man.get('permute_position') if args.resume and not any(resampled) else None
+            print('Generating permutation with %d elements' % nreads, file=sys.stderr)
+            idxs = np.random.permutation(nreads)
+            n = 0 if pos is None else pos['n']
+            ival = max(100, int(n * ival_mult))
+            with (open(unsrt_fn, 'wb') if pos is None else open_truncated(unsrt_fn, pos['bytes'])) as ofh:
+                for si, sampler_fn in enumerate(sum(tmpfns, [])):
+                    if pos is not None and si < pos['next']:
+                        continue
+                    seen_items = set()
+                    for ln in reverse_readline(sampler_fn):
+                        ln = ln.rstrip()
+                        taboff = ln.find('\t')
+                        assert taboff >= 0
+                        orig_rank = int(ln[:taboff])
+                        if orig_rank not in seen_items:
+                            i = orig_rank + si * reads_per_accession
+                            ofh.write(str(idxs[i]) + '\t' + ln[taboff+1:] + '\n')
+                            seen_items.add(orig_rank)
                         if n == ival:
                             ival = int(ival * ival_mult)
-                            print('  processed %d reads' % n, file=sys.stderr)
+                            print('  processed %d unsorted records' % n, file=sys.stderr)
                         n += 1
-                        nfile += 1
-                        if args.stop_after is not None and nfile >= args.stop_after:
-                            break
-            samp.close()
-
-        print('*** Permuting ***', file=sys.stderr)
-        print('Generating permutation with %d elements' % nreads, file=sys.stderr)
-        idxs = np.random.permutation(nreads)
-        n = 0
-        ival = 100
-        with open(unsrt_fn, 'wb') as ofh:
-            for si, sampler in enumerate(samplers):
-                seen_items = set()
-                for ln in reverse_readline(sampler.fn):
-                    ln = ln.rstrip()
-                    taboff = ln.find('\t')
-                    assert taboff >= 0
-                    orig_rank = int(ln[:taboff])
-                    if orig_rank not in seen_items:
-                        i = orig_rank + si * reads_per_accession
-                        ofh.write(str(idxs[i]) + '\t' + ln[taboff+1:] + '\n')
-                        seen_items.add(orig_rank)
-                    if n == ival:
-                        ival = int(ival * ival_mult)
-                        print('  processed %d unsorted records' % n, file=sys.stderr)
-                    n += 1
-                del seen_items
-        del idxs
-
-        if not args.keep_intermediates:
-            print('Deleting %d reservoir samplers:' % len(samplers), file=sys.stderr)
-            for samp in samplers:
-                del samp
+                    del seen_items
+                    fsync_file(ofh)
+                    man.put('permute_position', {'next': si + 1, 'bytes': ofh.tell(), 'n': n})
+            del idxs
+            man.stage_done('permute', [unsrt_fn])
 
-    unsrt_n = wcl(unsrt_fn)
-    if unsrt_n != nreads:
-        raise RuntimeError('Number of reads in unsorted file "%s" (%d) '
-                           'does not match target (%d)' % (unsrt_fn, unsrt_n, nreads))
+        unsrt_n = wcl(unsrt_fn)
+        if unsrt_n != nreads:
+            raise RuntimeError('Number of reads in unsorted file "%s" (%d) '
+                               'does not match target (%d)' % (unsrt_fn, unsrt_n, nreads))
 
-    if not args.keep_intermediates:
-        print('Deleting %d reservoir temporary files:' % len(samplers), file=sys.stderr)
-        for fn in tmpfns:
-            os.remove(fn)
-
-    print('*** Sorting ***', file=sys.stderr)
-    print('Sorting temporary sample file by permuted index', file=sys.stderr)
-    srt_fn = os.path.join(args.temp_dir, '.reads.py.sorted')
-    srt_tmp_dir = os.path.join(args.temp_dir, 'sort_temp')
-    mkdir_quiet(srt_tmp_dir)
-    cmd = 'sort -n -k1,1 -S %dG -T %s %s > %s' % (args.sort_gb, srt_tmp_dir, unsrt_fn, srt_fn)
-    print(cmd, file=sys.stderr)
-    ret = os.system(cmd)
-    if ret != 0:
-        raise RuntimeError('sort command failed')
+        if not args.keep_intermediates:
+            print('Deleting %d reservoir temporary files:' % (len(reads) * args.shards), file=sys.stderr)
+            for fn in sum(tmpfns, []):
+                if os.path.exists(fn):
+                    os.remove(fn)
+
+        print('*** Sorting ***', file=sys.stderr)
+        print('Sorting temporary sample file by permuted index', file=sys.stderr)
+        srt_tmp_dir = os.path.join(args.temp_dir, 'sort_temp')
+        mkdir_quiet(srt_tmp_dir)
+        sort_par = (' --parallel=%d' % args.workers) if args.workers > 1 else ''
+        cmd = 'sort -n -k1,1 -S %dG%s -T %s %s > %s' % (args.sort_gb, sort_par, srt_tmp_dir, unsrt_fn, srt_fn)
+        print(cmd, file=sys.stderr)
+        ret = os.system(cmd)
+        if ret != 0:
+            raise RuntimeError('sort command failed')
+        man.stage_done('sort', [srt_fn])
+        # outputs of any earlier attempt came from a different sorted file
+        for key in ['unblocked_position', 'blocked_position', 'done:unblocked', 'done:blocked']:
+            man.state.pop(key, None)
+        man.save()
 
-    if not args.keep_intermediates:
-        print('Deleting temporary sample file', file=sys.stderr)
-        os.remove(unsrt_fn)
+        if not args.keep_intermediates:
+            print('Deleting temporary sample file', file=sys.stderr)
+            os.remove(unsrt_fn)
 
     print('*** Output ***', file=sys.stderr)
-    print('Preparing unblocked reads:', file=sys.stderr)
-    with open(srt_fn, 'rb') as fh:
-        with open(args.prefix + '_1.fq', 'wb') as ofh1:
-            with open(args.prefix + '_2.fq', 'wb') as ofh2:
-                n = 0
-                ival = 100
-                for ln in fh:
-                    toks = ln.rstrip().split('\t')
-                    assert toks[1][0] == '@'
-                    assert toks[3][0] == '+'
-                    assert toks[5][0] == '@'
-                    assert toks[7][0] == '+'
-                    ofh1.write(b'\n'.join(toks[1:5]) + b'\n')
-                    ofh2.write(b'\n'.join(toks[5:9]) + b'\n')
-                    if n == ival:
-                        ival = int(ival * ival_mult)
-                        print('  processed %d sorted records for unblocked output' % n, file=sys.stderr)
-                    n += 1
-
-    print('Preparing blocked reads:', file=sys.stderr)
-    with open(srt_fn, 'rb') as fh:
-        with open(args.prefix + '_block_1.fq', 'wb') as ofhb1:
-            with open(args.prefix + '_block_2.fq', 'wb') as ofhb2:
-                ival = 100
-                toks1, toks2 = [], []
-                nbytes1, nbytes2 = 0, 0
-                for i, ln in enumerate(fh):
-                    toks = ln.rstrip().split('\t')
-                    assert toks[1][0] == '@'
-                    assert toks[3][0] == '+'
-                    assert toks[5][0] == '@'
-                    assert toks[7][0] == '+'
-                    toks1.append(toks[1:5])
-                    toks2.append(toks[5:9])
-                    nbytes1 += sum(map(len, toks1[-1])) + 4
-                    nbytes2 += sum(map(len, toks2[-1])) + 4
-                    if (i+1) % reads_per_block == 0:
-                        toks1[-1][0] += b' ' * (block_sz - nbytes1)
-                        toks2[-1][0] += b' ' * (block_sz - nbytes2)
-                        for rec in toks1:
-                            ofhb1.write(b'\n'.join(rec) + b'\n')
-                        for rec in toks2:
-                            ofhb2.write(b'\n'.join(rec) + b'\n')
-                        toks1, toks2 = [], []
-                        nbytes1, nbytes2 = 0, 0
-                    if i == ival:
-                        ival = int(ival * ival_mult)
-                        print('  processed %d sorted records for blocked output' % i, file=sys.stderr)
-                if len(toks1) > 0:
-                    raise RuntimeError('Did not end on block boundary')
+    ofns = [args.prefix + '_1.fq', args.prefix + '_2.fq']
+    if args.resume and man.verify_stage('unblocked'):
+        print('Unblocked reads already complete', file=sys.stderr)
+    else:
+        print('Preparing unblocked reads:', file=sys.stderr)
+        pos = man.get('unblocked_position') if args.resume else None
+        interval = Interval(args.checkpoint_secs)
+        with open(srt_fn, 'rb') as fh:
+            in_off, n = (0, 0) if pos is None else (pos['in'], pos['n'])
+            fh.seek(in_off)
+            with open_output(ofns[0], args, None if pos is None else pos['out1']) as ofh1:
+                with open_output(ofns[1], args, None if pos is None else pos['out2']) as ofh2:
+                    ival = max(100, int(n * ival_mult))
+                    for ln in fh:
+                        in_off += len(ln)
+                        toks = ln.rstrip().split('\t')
+                        assert toks[1][0] == '@'
+                        assert toks[3][0] == '+'
+                        assert toks[5][0] == '@'
+                        assert toks[7][0] == '+'
+                        ofh1.write(b'\n'.join(toks[1:5]) + b'\n')
+                        ofh2.write(b'\n'.join(toks[5:9]) + b'\n')
+                        if n == ival:
+                            ival = int(ival * ival_mult)
+                            print('  processed %d sorted records for unblocked output' % n, file=sys.stderr)
+                        n += 1
+                        if interval.due():
+                            man.put('unblocked_position', {'in': in_off, 'n': n,
+                                                           'out1': sync_output(ofh1), 'out2': sync_output(ofh2)})
+        man.stage_done('unblocked', [output_fn(fn, args) for fn in ofns])
+
+    ofns = [args.prefix + '_block_1.fq', args.prefix + '_block_2.fq']
+    if args.resume and man.verify_stage('blocked'):
+        print('Blocked reads already complete', file=sys.stderr)
+    else:
+        print('Preparing blocked reads:', file=sys.stderr)
+        pos = man.get('blocked_position') if args.resume else None
+        interval = Interval(args.checkpoint_secs)
+        with open(srt_fn, 'rb') as fh:
+            in_off, start = (0, 0) if pos is None else (pos['in'], pos['n'])
+            fh.seek(in_off)
+            with open_output(ofns[0], args, None if pos is None else pos['out1']) as ofhb1:
+                with open_output(ofns[1], args, None if pos is None else pos['out2']) as ofhb2:
+                    ival = max(100, int(start * ival_mult))
+                    toks1, toks2 = [], []
+                    nbytes1, nbytes2 = 0, 0
+                    for i, ln in enumerate(fh, start):
+                        in_off += len(ln)
+                        toks = ln.rstrip().split('\t')
+                        assert toks[1][0] == '@'
+                        assert toks[3][0] == '+'
+                        assert toks[5][0] == '@'
+                        assert toks[7][0] == '+'
+                        toks1.append(toks[1:5])
+                        toks2.append(toks[5:9])
+                        nbytes1 += sum(map(len, toks1[-1])) + 4
+                        nbytes2 += sum(map(len, toks2[-1])) + 4
+                        if (i+1) % reads_per_block == 0:
+                            toks1[-1][0] += b' ' * (block_sz - nbytes1)
+                            toks2[-1][0] += b' ' * (block_sz - nbytes2)
+                            for rec in toks1:
+                                ofhb1.write(b'\n'.join(rec) + b'\n')
+                            for rec in toks2:
+                                ofhb2.write(b'\n'.join(rec) + b'\n')
+                            toks1, toks2 = [], []
+                            nbytes1, nbytes2 = 0, 0
+                            # only checkpoint on block boundaries
+                            if interval.due():
+                                man.put('blocked_position', {'in': in_off, 'n': i + 1,
+                                                             'out1': sync_output(ofhb1), 'out2': sync_output(ofhb2)})
+                        if i == ival:
+                            ival = int(ival * ival_mult)
+                            print('  processed %d sorted records for blocked output' % i, file=sys.stderr)
+                    if len(toks1) > 0:
+                        raise RuntimeError('Did not end on block boundary')
+        man.stage_done('blocked', [output_fn(fn, args) for fn in ofns])
 
     if not args.keep_intermediates:
         print('Deleting sorted sample file', file=sys.stderr)
@@ -326,9 +494,27 @@ if __name__ == '__main__':
     parser.add_argument('--keep-intermediates', action='store_const', const=True, default=False,
                         help='If set, intermediate files are not deleted.')
     parser.add_argument('--resume', action='store_const', const=True, default=False,
-                        help='Try to resume a job partway.')
+                        help='Resume a killed job from its last checkpoint in --temp-dir.')
+    parser.add_argument('--checkpoint-secs', metavar='int', type=int, default=600,
+                        help='Checkpoint progress within a stage at most this often.')
     parser.add_argument('--prefix', metavar='str', type=str, default='out',
                         help='Prefix for output files.')
     parser.add_argument('--temp-dir', metavar='str', type=str, default='temp',
                         help='Put intermediates in temporary directory with this name.')
+    parser.add_argument('--chunk-bytes', metavar='int', type=int, default=DEFAULT_CHUNK,
+                        help='# bytes of decompressed input to parse at a time.')
+    parser.add_argument('--shards', metavar='int', type=int, default=1,
+                        help='Sample this many independent shards (each with --reads-per-accession reads per '
+                             'accession and seed --seed + shard index), then shuffle all of them together into '
+                             'a single output set.')
+    parser.add_argument('--workers', metavar='int', type=int, default=1,
+                        help='# shards to sample in parallel; also passed to sort --parallel.')
+    parser.add_argument('--compress', type=str, choices=FORMATS,
+                        help='Write compressed output (<prefix>_1.fq.gz etc) in gzip or BGZF format.')
+    parser.add_argument('--compress-level', metavar='int', type=int, default=6,
+                        help='zlib compression level for --compress.')
+    parser.add_argument('--compress-threads', metavar='int', type=int, default=4,
+                        help='# threads compressing each output file for --compress.')
+    parser.add_argument('--compress-processes', action='store_const', const=True, default=False,
+                        help='Compress in a pool of processes rather than threads (e.g. when running under pypy).')
     go(parser.parse_args())
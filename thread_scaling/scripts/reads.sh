@@ -9,39 +9,54 @@ for i in `cat .reads.txt` ; do
     fi
 done
 
-for i in 0 1 2 3 4 5 6 7 8 9 ; do
-    cat >.reads100.${i}.sh <<EOF
+BLOCK_BYTES=12288
+SHARDS=10
+
+# Shards are sampled in parallel with seeds 0-9 and shuffled together into a
+# single output set, so there is no separate concatenation step
+cat >.reads100.sh <<EOF2
 #!/bin/bash -l
 #SBATCH
 #SBATCH --partition=shared
 #SBATCH --nodes=1
-#SBATCH --mem=8G
+#SBATCH --mem=32G
 #SBATCH --time=10:00:00
-#SBATCH --ntasks-per-node=2
+#SBATCH --ntasks-per-node=${SHARDS}
+
+set -ex
 
 # For HISAT unpaired to run about a minute, we need about 300M reads
-pypy reads.py --prefix=mix100_${i} --temp-dir=mix100_${i}_temp \
-              --reads-per-accession 10000000 --seed ${i}
+pypy reads.py --prefix=mix100 --temp-dir=mix100_temp \\
+              --reads-per-accession 10000000 --seed 0 \\
+              --shards ${SHARDS} --workers ${SHARDS} --sort-gb 16
+
+python check_blocked.py --fastq mix100_block_1.fq --fastq2 mix100_block_2.fq \\
+                        --block-bytes ${BLOCK_BYTES} --reads-per-block 44 --workers ${SHARDS}
 
-EOF
-    echo "sbatch .reads100.${i}.sh"
+EOF2
+echo "sbatch .reads100.sh"
 
-    cat >.reads50.${i}.sh <<EOF
+cat >.reads50.sh <<EOF2
 #!/bin/bash -l
 #SBATCH
 #SBATCH --partition=shared
 #SBATCH --nodes=1
-#SBATCH --mem=8G
+#SBATCH --mem=32G
 #SBATCH --time=10:00:00
-#SBATCH --ntasks-per-node=2
+#SBATCH --ntasks-per-node=${SHARDS}
+
+set -ex
 
 # For Bowtie 1 unpaired to run about a mnute, we need about 300M reads
-pypy reads.py --trim-to 50 --max-read-size 175 --prefix=mix50_${i} --temp-dir=mix50_${i}_temp \
-              --reads-per-accession 10000000 --seed ${i}
+pypy reads.py --trim-to 50 --max-read-size 175 --prefix=mix50 --temp-dir=mix50_temp \\
+              --reads-per-accession 10000000 --seed 0 \\
+              --shards ${SHARDS} --workers ${SHARDS} --sort-gb 16
 
-EOF
-    echo "sbatch .reads50.${i}.sh"
-done
+python check_blocked.py --fastq mix50_block_1.fq --fastq2 mix50_block_2.fq \\
+                        --block-bytes ${BLOCK_BYTES} --reads-per-block 70 --workers ${SHARDS}
+
+EOF2
+echo "sbatch .reads50.sh"
 
 #for i in `cat .reads.txt` ; do
 #    rm -f `basename $i`
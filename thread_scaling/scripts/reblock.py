@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+
+"""
+Lays out an existing FASTQ file (or pair of files) in fixed-size blocks for
+the `blocked_input` branches of bowtie, bowtie2 and hisat.
+
+reads.py picks the # reads per block from a worst-case read size and can only
+block during a fresh sampling run.  Here we first scan the input to get the
+actual length of every record, pick the largest # reads per block such that
+every block fits, then write the blocked output in one streaming pass.  As in
+reads.py, each block is padded out to the block size with spaces at the end of
+the header of its last record, and reads past the last whole block are
+dropped.  Existing header padding is stripped, so already-blocked files can be
+re-blocked with a different --block-bytes.
+
+E.g., to compare layouts without writing anything:
+- python reblock.py --fastq mix100_1.fq --fastq2 mix100_2.fq --block-bytes 16384 --dry-run
+"""
+
+from __future__ import print_function
+import sys
+import numpy as np
+from fastq_chunks import iter_chunks, DEFAULT_CHUNK
+
+
+def scan_lengths(fn, chunk_bytes=DEFAULT_CHUNK):
+    """ Lengths of all records in fn, not counting header padding """
+    lens = []
+    with open(fn, 'rb') as fh:
+        for chunk in iter_chunks(fh, chunk_bytes):
+            chunk.validate()
+            lens.append((chunk.record_lens - chunk.header_pad()).astype(np.int32))
+    if len(lens) == 0:
+        raise RuntimeError('No records in "%s"' % fn)
+    return np.concatenate(lens)
+
+
+def block_sums(lens, reads_per_block):
+    """ Total record bytes in each whole block """
+    cum = np.concatenate([[0], np.cumsum(lens, dtype=np.int64)])
+    nblocks = len(lens) // reads_per_block
+    return cum[reads_per_block:nblocks * reads_per_block + 1:reads_per_block] - \
+        cum[0:nblocks * reads_per_block:reads_per_block]
+
+
+def fits(lens_list, block_bytes, reads_per_block):
+    return all(len(lens) >= reads_per_block and block_sums(lens, reads_per_block).max() <= block_bytes
+               for lens in lens_list)
+
+
+def max_reads_per_block(lens_list, block_bytes):
+    """ Largest # reads per block for which every block of every file fits """
+    upper = min(block_bytes // int(lens.min()) for lens in lens_list)
+    for reads_per_block in range(upper, 0, -1):
+        if fits(lens_list, block_bytes, reads_per_block):
+            return reads_per_block
+    raise RuntimeError('Some record is longer than a %d-byte block' % block_bytes)
+
+
+def write_blocked(ifn, ofn, lens, block_bytes, reads_per_block, chunk_bytes=DEFAULT_CHUNK):
+    """ Write the whole blocks of ifn to ofn, padding each out to block_bytes """
+    pads = block_bytes - block_sums(lens, reads_per_block)
+    nkeep = len(pads) * reads_per_block
+    nrecords = 0
+    with open(ifn, 'rb') as ifh:
+        with open(ofn, 'wb') as ofh:
+            for chunk in iter_chunks(ifh, chunk_bytes):
+                n = min(len(chunk), nkeep - nrecords)
+                if n <= 0:
+                    break
+                arr = chunk.arr[:int(chunk.record_ends[n - 1])]
+                hdr_end = chunk.ends[:n, 0]
+                old_pad = chunk.header_pad()[:n]
+                # strip existing header padding...
+                delta = np.bincount(hdr_end - old_pad, minlength=len(arr) + 1) - \
+                    np.bincount(hdr_end, minlength=len(arr) + 1)
+                arr = arr[np.cumsum(delta)[:len(arr)] == 0]
+                new_hdr_end = hdr_end - old_pad - np.concatenate([[0], np.cumsum(old_pad)[:-1]])
+                # ...then pad the header of the last record of each block
+                idx = nrecords + np.arange(n)
+                last = np.flatnonzero((idx + 1) % reads_per_block == 0)
+                block_pads = pads[(idx[last] + 1) // reads_per_block - 1]
+                arr = np.insert(arr, np.repeat(new_hdr_end[last], block_pads), 32)
+                ofh.write(arr.tobytes())
+                nrecords += n
+    return pads
+
+
+def go(args):
+    fns = [args.fastq] if args.fastq2 is None else [args.fastq, args.fastq2]
+    print('Scanning record lengths', file=sys.stderr)
+    lens_list = [scan_lengths(fn, args.chunk_bytes) for fn in fns]
+    if len(lens_list) == 2 and len(lens_list[0]) != len(lens_list[1]):
+        raise RuntimeError('Mate files have different # records (%d, %d)' %
+                           (len(lens_list[0]), len(lens_list[1])))
+    nreads = len(lens_list[0])
+    for fn, lens in zip(fns, lens_list):
+        print('  %s: %d records, length min/mean/max = %d/%0.1f/%d' %
+              (fn, len(lens), lens.min(), lens.mean(), lens.max()), file=sys.stderr)
+
+    if args.reads_per_block is not None:
+        reads_per_block = args.reads_per_block
+        if not fits(lens_list, args.block_bytes, reads_per_block):
+            raise RuntimeError('%d reads do not always fit in a %d-byte block' % (reads_per_block, args.block_bytes))
+    else:
+        reads_per_block = max_reads_per_block(lens_list, args.block_bytes)
+
+    nblocks = nreads // reads_per_block
+    print('block_bytes\t%d' % args.block_bytes)
+    print('reads_per_block\t%d' % reads_per_block)
+    print('blocks\t%d' % nblocks)
+    print('reads_dropped\t%d' % (nreads - nblocks * reads_per_block))
+    for mate, lens in enumerate(lens_list):
+        payload = int(block_sums(lens, reads_per_block).sum())
+        total = nblocks * args.block_bytes
+        print('mate%d_padding_bytes\t%d' % (mate + 1, total - payload))
+        print('mate%d_padding_pct\t%0.2f' % (mate + 1, 100.0 * (total - payload) / max(total, 1)))
+        print('mate%d_bytes_per_read\t%0.2f' % (mate + 1, float(total) / max(nblocks * reads_per_block, 1)))
+
+    if args.dry_run:
+        return
+    ofns = [args.output] if args.fastq2 is None else [args.output, args.output2]
+    if any(ofn is None for ofn in ofns):
+        raise RuntimeError('Specify --output (and --output2 for pairs) or --dry-run')
+    for fn, ofn, lens in zip(fns, ofns, lens_list):
+        print('Writing "%s"' % ofn, file=sys.stderr)
+        write_blocked(fn, ofn, lens, args.block_bytes, reads_per_block, args.chunk_bytes)
+
+
+if __name__ == '__main__':
+
+    import argparse
+    parser = argparse.ArgumentParser(description='Lay out existing FASTQ files in fixed-size blocks.')
+
+    parser.add_argument('--fastq', metavar='path', type=str, required=True,
+                        help='FASTQ file (mate 1 for pairs), blocked or not.')
+    parser.add_argument('--fastq2', metavar='path', type=str,
+                        help='Mate 2 FASTQ file.')
+    parser.add_argument('--output', metavar='path', type=str,
+                        help='Blocked FASTQ output.')
+    parser.add_argument('--output2', metavar='path', type=str,
+                        help='Blocked FASTQ output for mate 2.')
+    parser.add_argument('--block-bytes', metavar='int', type=int, default=12288,
+                        help='# characters constituting a single fixed-size block of FASTQ input')
+    parser.add_argument('--reads-per-block', metavar='int', type=int,
+                        help='# reads in a single fixed-size block; default: as many as always fit')
+    parser.add_argument('--chunk-bytes', metavar='int', type=int, default=DEFAULT_CHUNK,
+                        help='# bytes to parse at a time')
+    parser.add_argument('--dry-run', action='store_const', const=True, default=False,
+                        help='Just report the layout and padding overhead; don\'t write output')
+    go(parser.parse_args())
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+
+"""
+Columnar store of tabulated results, written by tabulate.py --store.  Instead
+of one CSV row per process with per-thread values space-joined in a cell, a
+.npz holds two tables, one array per column:
+
+threads   one row per thread: the run it belongs to (index into runs),
+          proc_id, thread (index within the process), time,
+          cpu_changeovers, node_changeovers
+runs      one row per run, i.e. per master.py invocation (all of an
+          attempt's processes): machine, aligner, series, pe,
+          threads_per_proc, totthreads, attempt, nproc, nthreads (threads
+          with times), nunp (reads over all processes), search_time
+          (slowest process), load_time (mean over processes of reference
+          and index loading; both leave out processes missing the value), mean/median/min/max of each per-thread
+          column over all the run's threads, threads_div_max
+          (totthreads / slowest thread time; times reads per thread, that's
+          reads per second), steady_rate (steady-state reads per second
+          from master.py --progress) and early_stop (1 if master.py
+          --early-stop stopped the run, leaving only steady_rate)
+
+Array names are "<table>.<column>".  Missing values are NaN.  load() reads
+one or more stores (e.g. KNL and Broadwell) into {table: {column: array}}
+with the run indices renumbered to match; columns an older store lacks are
+missing values (early_stop is 0).
+"""
+
+from __future__ import print_function
+import numpy
+
+RUN_KEYS = ['machine', 'aligner', 'series', 'pe', 'threads_per_proc', 'totthreads', 'attempt']
+THREAD_COLS = [('thread_times', 'time'), ('cpu_changeovers', 'cpu_changeovers'),
+               ('node_changeovers', 'node_changeovers')]
+STATS = ['mean', 'median', 'min', 'max']
+# what load() fills in for columns an older store lacks, if not NaN
+FILL = {'early_stop': 0}
+
+
+def num(x):
+    return float('nan') if x == 'NA' else float(x)
+
+
+def nan_reduce(func, vals):
+    """ func (e.g. numpy.nanmax) of vals ignoring NaNs, or NaN if they're all missing """
+    vals = numpy.asarray(vals, dtype=numpy.float64)
+    ok = numpy.isfinite(vals)
+    return float(func(vals[ok])) if ok.any() else float('nan')
+
+
+def group_stats(group, values, ngroups):
+    """ Mean, median, min and max of values within each group 0..ngroups-1 """
+    order = numpy.lexsort((values, group))
+    g, v = group[order], values[order]
+    counts = numpy.bincount(g, minlength=ngroups)
+    ends = numpy.cumsum(counts)
+    starts = ends - counts
+    empty = counts == 0
+    last = numpy.maximum(ends - 1, 0)
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        res = [numpy.bincount(g, weights=v, minlength=ngroups) / counts,
+               (v[numpy.minimum(starts + (counts - 1) // 2, last)] + v[numpy.minimum(starts + counts // 2, last)]) / 2.0,
+               v[numpy.minimum(starts, last)], v[last]]
+    for r in res:
+        r[empty] = numpy.nan
+    return res
+
+
+def build(dats, machine):
+    """ Tables from tabulate.py's per-process records, in order """
+    run_index, runs = {}, []
+    threads = dict((k, []) for k in ['run', 'proc_id', 'thread', 'time', 'cpu_changeovers', 'node_changeovers'])
+    for dat in dats:
+        key = (machine,) + tuple(dat[k] for k in RUN_KEYS[1:])
+        if key not in run_index:
+            run_index[key] = len(runs)
+            runs.append({'procs': [], 'nunp': [], 'search_time': [], 'load_time': [], 'steady_rate': [],
+                         'early_stop': 0})
+        i = run_index[key]
+        run = runs[i]
+        run['procs'].append(dat['proc_id'])
+        run['nunp'].append(num(dat['nunp']))
+        run['search_time'].append(num(dat['search_time']))
+        run['steady_rate'].append(num(dat['steady_rate']))
+        run['early_stop'] = max(run['early_stop'], int(dat['early_stop']))
+        loads = [num(dat[k]) for k in ['refload', 'fwload', 'rvload'] if dat[k] != 'NA']
+        run['load_time'].append(sum(loads) if len(loads) > 0 else float('nan'))
+        n = len(dat['thread_times'])
+        threads['run'].extend([i] * n)
+        threads['proc_id'].extend([dat['proc_id']] * n)
+        threads['thread'].extend(range(n))
+        for col, name in THREAD_COLS:
+            vals = dat[col]
+            threads[name].extend(map(num, vals) if len(vals) == n else [float('nan')] * n)
+    keys = sorted(run_index.items(), key=lambda kv: kv[1])
+    out_runs = {}
+    for j, k in enumerate(RUN_KEYS):
+        out_runs[k] = numpy.array([key[j] for key, _ in keys])
+    out_runs['nproc'] = numpy.array([len(set(r['procs'])) for r in runs], dtype=numpy.int64)
+    out_runs['nunp'] = numpy.array([sum(r['nunp']) for r in runs])
+    out_runs['search_time'] = numpy.array([nan_reduce(numpy.max, r['search_time']) for r in runs])
+    out_runs['load_time'] = numpy.array([nan_reduce(numpy.mean, r['load_time']) for r in runs])
+    out_threads = {'run': numpy.array(threads['run'], dtype=numpy.int64),
+                   'proc_id': numpy.array(threads['proc_id'], dtype=numpy.int64),
+                   'thread': numpy.array(threads['thread'], dtype=numpy.int64)}
+    for _, name in THREAD_COLS:
+        out_threads[name] = numpy.array(threads[name], dtype=numpy.float64)
+    out_runs['nthreads'] = numpy.bincount(out_threads['run'], minlength=len(runs))
+    for col, name in THREAD_COLS:
+        for stat, vals in zip(STATS, group_stats(out_threads['run'], out_threads[name], len(runs))):
+            out_runs['%s_%s' % (col, stat)] = vals
+    with numpy.errstate(divide='ignore'):
+        out_runs['threads_div_max'] = out_runs['totthreads'] / out_runs['thread_times_max']
+    # the same for every process of a run
+    out_runs['steady_rate'] = numpy.array([nan_reduce(numpy.max, r['steady_rate']) for r in runs])
+    out_runs['early_stop'] = numpy.array([r['early_stop'] for r in runs], dtype=numpy.int64)
+    return {'threads': out_threads, 'runs': out_runs}
+
+
+def write(fn, tables):
+    arrays = {}
+    for table, cols in tables.items():
+        for col, arr in cols.items():
+            arrays['%s.%s' % (table, col)] = arr
+    numpy.savez_compressed(fn, **arrays)
+
+
+def load(fns):
+    """ {table: {column: array}} from one or more stores, concatenated """
+    if isinstance(fns, str):
+        fns = [fns]
+    parts = []
+    for fn in fns:
+        tables = {}
+        with numpy.load(fn) as dat:
+            for name in dat.files:
+                table, col = name.split('.', 1)
+                tables.setdefault(table, {})[col] = dat[name]
+        parts.append(tables)
+    offset = 0
+    for tables in parts:
+        tables['threads']['run'] = tables['threads']['run'] + offset
+        offset += len(tables['runs']['attempt'])
+    res = {}
+    for table in parts[0]:
+        cols = sorted(set(col for p in parts for col in p[table]))
+        res[table] = {}
+        for col in cols:
+            arrs = []
+            for p in parts:
+                n = len(next(iter(p[table].values())))
+                arrs.append(p[table][col] if col in p[table] else numpy.full(n, FILL.get(col, numpy.nan)))
+            res[table][col] = numpy.concatenate(arrs)
+    return res
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+
+"""
+Fits scaling laws to tabulated results (tabulate.py --store; see
+results_store.py), per (machine, aligner, series, pe).  Throughput at N
+threads is each attempt's threads_div_max (times --reads-per-thread, if
+given, for reads per second), or with --steady its steady-state reads per
+second from master.py --progress, which also covers runs stopped by
+--early-stop.
+
+Both laws are fitted by least squares on N / X(N), which is linear in their
+coefficients (relative error, since each row is scaled by the measured
+value), with the coefficients kept non-negative:
+
+    Amdahl  X(N) = lambda N / (1 + sigma (N - 1))
+    USL     X(N) = lambda N / (1 + sigma (N - 1) + kappa N (N - 1))
+
+sigma is contention (the serial fraction) and kappa coherency (crosstalk);
+with kappa > 0 throughput peaks at N* = sqrt((1 - sigma) / kappa) threads.
+The knee is where the fitted USL curve is furthest above the chord from the
+fewest measured threads to min(N*, most measured threads), on axes scaled
+to [0, 1] (Kneedle): past it, adding threads buys much less.  Confidence
+intervals resample attempts within each thread count, or, with one attempt
+per thread count, the fit's relative residuals.
+
+The first table has one row per group; with --points, a second has parallel
+efficiency X(N) / (N X(1)) and the Karp-Flatt serial fraction per measured
+thread count (X(1) is measured if 1 thread was run, else the fitted lambda),
+and --predict adds fitted throughputs at thread counts that weren't run.
+"""
+
+from __future__ import print_function
+import sys
+import math
+import numpy
+import results_store
+
+GROUP_KEYS = ['machine', 'aligner', 'series', 'pe']
+
+
+def fit(n, x, coherency=True):
+    """ (lambda, sigma, kappa) of the USL, or of Amdahl's law (kappa = 0) if not coherency """
+    n, x = numpy.asarray(n, dtype=numpy.float64), numpy.asarray(x, dtype=numpy.float64)
+    y = n / x
+    cols = numpy.column_stack([numpy.ones(len(n)), n - 1, n * (n - 1)]) / y[:, None]
+    subsets = [(0, 1, 2), (0, 1), (0, 2), (0,)] if coherency else [(0, 1), (0,)]
+    best = None
+    for sub in subsets:
+        a = cols[:, list(sub)]
+        coef = numpy.linalg.lstsq(a, numpy.ones(len(n)), rcond=None)[0]
+        if coef[0] <= 0 or (coef[1:] < 0).any():
+            continue
+        sse = ((a.dot(coef) - 1.0) ** 2).sum()
+        if best is None or sse < best[1]:
+            full = numpy.zeros(3)
+            full[list(sub)] = coef
+            best = (full, sse)
+    if best is None:
+        raise RuntimeError('Could not fit scaling law to %d points' % len(n))
+    a, b, c = best[0]
+    return 1.0 / a, b / a, c / a
+
+
+def model(n, lam, sigma, kappa=0.0):
+    n = numpy.asarray(n, dtype=numpy.float64)
+    return lam * n / (1.0 + sigma * (n - 1) + kappa * n * (n - 1))
+
+
+def peak_threads(sigma, kappa):
+    if kappa <= 0 or sigma >= 1:
+        return float('inf')
+    return math.sqrt((1.0 - sigma) / kappa)
+
+
+def knee(lam, sigma, kappa, nmin, nmax, npts=2000):
+    """ Threads at the knee of the fitted USL curve between nmin and min(N*, nmax) """
+    upper = min(peak_threads(sigma, kappa), nmax)
+    if upper <= nmin:
+        return float(nmin)
+    ns = numpy.linspace(nmin, upper, npts)
+    xs = model(ns, lam, sigma, kappa)
+    if xs[-1] <= xs[0]:
+        return float(nmin)
+    dist = (xs - xs[0]) / (xs[-1] - xs[0]) - (ns - nmin) / (upper - nmin)
+    return float(ns[dist.argmax()])
+
+
+def summarize(n, x):
+    """ USL and Amdahl coefficients, peak, knee and peak throughput for points (n, x) """
+    lam, sigma, kappa = fit(n, x)
+    a_lam, a_sigma, _ = fit(n, x, coherency=False)
+    nstar = peak_threads(sigma, kappa)
+    return {'lambda': lam, 'sigma': sigma, 'kappa': kappa, 'amdahl_lambda': a_lam, 'amdahl_sigma': a_sigma,
+            'peak_threads': nstar, 'knee_threads': knee(lam, sigma, kappa, min(n), max(n)),
+            'peak_thruput': float(model(min(nstar, max(n)), lam, sigma, kappa))}
+
+
+def bootstrap(n, x, nboot, rng):
+    """ summarize() over nboot resamples of the points """
+    n, x = numpy.asarray(n), numpy.asarray(x)
+    ns = numpy.unique(n)
+    idx = [numpy.flatnonzero(n == k) for k in ns]
+    repeated = min(len(i) for i in idx) > 1
+    if not repeated:
+        lam, sigma, kappa = fit(n, x)
+        fitted = model(n, lam, sigma, kappa)
+        ratios = x / fitted
+    res = []
+    for _ in range(nboot):
+        if repeated:
+            pick = numpy.concatenate([rng.choice(i, len(i)) for i in idx])
+            bn, bx = n[pick], x[pick]
+        else:
+            bn, bx = n, fitted * rng.choice(ratios, len(ratios))
+        try:
+            res.append(summarize(bn, bx))
+        except RuntimeError:
+            continue
+    return res
+
+
+def interval(vals, level):
+    vals = numpy.asarray(vals, dtype=numpy.float64)
+    lo, hi = numpy.percentile(vals, [50.0 * (1 - level), 50.0 * (1 + level)])
+    return lo, hi
+
+
+def groups(runs, reads_per_thread=1.0, steady=False):
+    """ {group key: (thread counts, throughputs)}, one point per attempt """
+    res = {}
+    for i in range(len(runs['attempt'])):
+        x = runs['steady_rate'][i] if steady else runs['threads_div_max'][i] * reads_per_thread
+        if not numpy.isfinite(x) or x <= 0:
+            continue
+        key = tuple(str(runs[k][i]) for k in GROUP_KEYS)
+        ns, xs = res.setdefault(key, ([], []))
+        ns.append(int(runs['totthreads'][i]))
+        xs.append(float(x))
+    return res
+
+
+def go(args):
+    runs = results_store.load(args.store)['runs']
+    if args.steady and ('steady_rate' not in runs or not numpy.isfinite(runs['steady_rate']).any()):
+        raise RuntimeError('No steady-state rates in %s; were runs made with master.py --progress?' %
+                           ' '.join(args.store))
+    rng = numpy.random.RandomState(args.seed)
+    predict = [] if args.predict is None else list(map(int, args.predict.rstrip(',').split(',')))
+    fields = ['lambda', 'sigma', 'kappa', 'amdahl_sigma', 'peak_threads', 'knee_threads', 'peak_thruput']
+    print('\t'.join(GROUP_KEYS + ['npoints', 'measured_peak_threads', 'measured_peak_thruput'] + fields +
+                    ['%s_%s' % (f, b) for f in ['sigma', 'kappa', 'peak_threads', 'knee_threads']
+                     for b in ['lo', 'hi']] + ['thruput_%d' % k for k in predict]))
+    points = []
+    for key, (n, x) in sorted(groups(runs, args.reads_per_thread, args.steady).items()):
+        if len(set(n)) < 3:
+            print('Skipping %s: fewer than 3 thread counts' % ' '.join(key), file=sys.stderr)
+            continue
+        n, x = numpy.array(n), numpy.array(x)
+        est = summarize(n, x)
+        boot = bootstrap(n, x, args.bootstrap, rng)
+        cis = []
+        for f in ['sigma', 'kappa', 'peak_threads', 'knee_threads']:
+            cis.extend(interval([b[f] for b in boot], args.level))
+        ns = numpy.unique(n)
+        means = numpy.array([x[n == k].mean() for k in ns])
+        print('\t'.join(list(key) + ['%d' % len(n), '%d' % ns[means.argmax()], '%0.4g' % means.max()] +
+                        ['%0.4g' % est[f] for f in fields] + ['%0.4g' % c for c in cis] +
+                        ['%0.4g' % model(k, est['lambda'], est['sigma'], est['kappa']) for k in predict]))
+        base = means[0] if ns[0] == 1 else est['lambda']
+        for k, m in zip(ns, means):
+            speedup = m / base
+            kf = (1.0 / speedup - 1.0 / k) / (1.0 - 1.0 / k) if k > 1 else float('nan')
+            points.append(list(key) + [k, m, model(k, est['lambda'], est['sigma'], est['kappa']), speedup / k, kf])
+    if args.points:
+        print()
+        print('\t'.join(GROUP_KEYS + ['nthreads', 'thruput', 'usl_thruput', 'efficiency', 'karp_flatt']))
+        for p in points:
+            print('\t'.join(p[:4] + ['%d' % p[4]] + ['%0.4g' % v for v in p[5:]]))
+
+
+if __name__ == '__main__':
+
+    import argparse
+    parser = argparse.ArgumentParser(description='Fit Amdahl\'s law and the USL to tabulated scaling results.')
+
+    parser.add_argument('store', metavar='path', type=str, nargs='+',
+                        help='.npz written by tabulate.py --store; several are combined.')
+    parser.add_argument('--reads-per-thread', type=float, default=1.0,
+                        help='Multiply threads_div_max by this for reads per second.')
+    parser.add_argument('--steady', action='store_const', const=True, default=False,
+                        help='Fit steady-state reads per second (master.py --progress) instead of threads_div_max.')
+    parser.add_argument('--predict', metavar='int,int,...', type=str,
+                        help='Also give fitted throughput at these thread counts.')
+    parser.add_argument('--points', action='store_const', const=True, default=False,
+                        help='Also print efficiency and Karp-Flatt serial fraction per measured thread count.')
+    parser.add_argument('--bootstrap', type=int, default=1000,
+                        help='# bootstrap resamples for confidence intervals.')
+    parser.add_argument('--level', type=float, default=0.95,
+                        help='Confidence level of the intervals.')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed for bootstrap resampling.')
+
+    go(parser.parse_args())
@@ -3,20 +3,35 @@
 # results are in subdirectories like:
 # small/results/ht/ht-baseline-tbbq/unp/ht-baseline-old_unp_0_0_2.err/out
 
+"""
+Tabulates the results of a system's runs as CSV, one row per process.  Runs
+are parsed in parallel by a pool of worker processes, and each run's row is
+cached, keyed by the size and modification time of its .err, .out, .steady
+and .EARLY_STOP files, in <system>/results/.tabulate_cache.json; only new or
+changed runs are parsed again.  With --output, the table (and the cache) are written to a
+temporary file and renamed into place, so readers never see a partial table.
+--store also writes a columnar .npz with one row per thread and a summary
+per run; see results_store.py.
+
+steady_rate is the run's steady-state reads/sec over all its processes, from
+the <run>.steady master.py --progress writes (NA without it).  early_stop is
+1 for runs master.py --early-stop stopped (marked .EARLY_STOP); they have no
+per-thread timings, so only their steady_rate is meaningful.
+"""
+
 from __future__ import print_function
 import sys
 import os
+import json
+import multiprocessing
+from checkpoint import fsync_file, fsync_dir
+import results_store
 
-if len(sys.argv) < 2:
-    raise RuntimeError('Specify system as first arg')
-
-system = sys.argv[1]
-system_dir = os.path.join(system, 'results')
+# bump when parsing changes, so cached runs are re-parsed
+CACHE_VERSION = 3
 
-if not os.path.exists(system_dir):
-    raise RuntimeError('No such directory as "%s"' % system_dir)
 
-def parse_dir(dr):
+def parse_dir(system, dr):
     toks = dr.split('/')
     assert toks[0] == system
     assert toks[1] == 'results'
@@ -142,105 +157,225 @@ def new_dat():
             'aligner': 'NA', 'series': 'NA', 'pe': 'NA',
             'threads_per_proc': 'NA', 'proc_id': 'NA',
             'totthreads': 'NA', 'attempt': 'NA',
-            'rd_load_time': 'NA'}
+            'rd_load_time': 'NA', 'steady_rate': 'NA', 'early_stop': 0}
 
 
-def tabulate():
+def parse_run(job):
+    """
+    Parse one run, given (system, directory, .err file name).  Returns its
+    record, with per-thread values in lists, or None if it's incomplete, and
+    any warnings.
+    """
+    system, root, fn = job
+    warnings = []
+    aligner, series, pe = parse_dir(system, root)
     dat = new_dat()
-    keys = [ k for k, _ in sorted(dat.items()) ]
-    print(','.join(keys))
+    threads_per_proc, proc_id, tot_threads, attempt = parse_file(fn, pe)
+    dat.update({'aligner': aligner, 'series': series, 'pe': pe,
+                'threads_per_proc' : threads_per_proc, 'proc_id': proc_id,
+                'totthreads': tot_threads, 'attempt': attempt})
+    if threads_per_proc == 0:
+        threads_per_proc = tot_threads
+    if os.path.exists(run_file(root, fn, '.EARLY_STOP')):
+        dat['early_stop'] = 1
+    steady_fn = run_file(root, fn, '.steady')
+    if os.path.exists(steady_fn):
+        with open(steady_fn) as ifh:
+            ifh.readline()
+            rate = ifh.readline().split('\t')[0]
+            if rate != 'NA':
+                dat['steady_rate'] = float(rate)
+    fn = os.path.join(root, fn)
+    fn_out = fn[:-4] + '.out'
+    if aligner != 'bwa' and not os.path.exists(fn_out):
+        raise RuntimeError('.err file without .out companion: ' + fn_out)
+    with open(fn) as ifh:
+        for ln in ifh:
+            if ln.startswith('Time loading reference'):
+                dat['refload'] = parse_time(ln.split()[-1])
+            elif ln.startswith('Time loading forward index'):
+                dat['fwload'] = parse_time(ln.split()[-1])
+            elif ln.startswith('Time loading mirror index'):
+                dat['rvload'] = parse_time(ln.split()[-1])
+            elif ln.startswith('[bwa_idx_load] wall time'):
+                dat['fwload'] = float(ln.split()[3])
+            elif ln.startswith('Multiseed full-index'):
+                dat['search_time'] = parse_time(ln.split()[-1])
+            elif 'were unpaired; of these' in ln:
+                dat['nunp'] = int(ln.split()[0])
+            elif 'aligned 0 times' in ln:
+                dat['nunp_0al'] = int(ln.split()[0])
+            elif 'aligned exactly 1 time' in ln:
+                dat['nunp_1al'] = int(ln.split()[0])
+            elif 'aligned >1 times' in ln:
+                dat['nunp_multial'] = int(ln.split()[0])
+            elif 'aligned concordantly 0 times' in ln:
+                dat['nconc_0al'] = int(ln.split()[0])
+            elif 'aligned concordantly exactly 1 time' in ln:
+                dat['nconc_1al'] = int(ln.split()[0])
+            elif 'aligned concordantly >1 times' in ln:
+                dat['nconc_multial'] = int(ln.split()[0])
+            elif 'pairs aligned concordantly 0 times; of these' in ln:
+                dat['nconc_0al'] = int(ln.split()[0])
+            elif 'aligned discordantly 1 time' in ln:
+                dat['ndisc_1al'] = int(ln.split()[0])
+            elif 'pairs aligned 0 times concordantly or discordantly; of these' in ln:
+                dat['nconcdisc_0al'] = int(ln.split()[0])
+            elif ln.startswith('Time searching:'):
+                dat['search_time'] = parse_time(ln.split()[-1])
+            elif ln.startswith('[M::process] read'):
+                if dat['rd_load_time'] == 'NA':
+                    dat['rd_load_time'] = 0.0
+                dat['rd_load_time'] += float(ln.split()[9])
+            elif ln.startswith('[kt_pipeline]'):
+                if dat['search_time'] == 'NA':
+                    dat['search_time'] = 0
+                dat['search_time'] += float(ln.split()[3])
+
+    if aligner != 'bwa':
+        with open(fn_out) as iofh:
+            for ln in iofh:
+                toks = ln.split()
+                assert toks[0] == 'thread:'
+                if toks[2] == 'time:':
+                    dat['thread_times'].append(parse_time(toks[-1]))
+                elif toks[2] == 'cpu_changeovers:':
+                    dat['cpu_changeovers'].append(int(toks[-1]))
+                elif toks[2] == 'node_changeovers:':
+                    dat['node_changeovers'].append(int(toks[-1]))
+                else:
+                    raise RuntimeError('Unrecognized output line: ' + ln)
+        if len(dat['thread_times']) < threads_per_proc and dat['early_stop'] == 0:
+            warnings.append('WARNING: number of thread_times (%d) was less than threads per proc (%d) in "%s"' %
+                            (len(dat['thread_times']), threads_per_proc, fn))
+            return None, warnings
+    else:
+        dat['thread_times'] = [dat['search_time']]
+        dat['cpu_changeovers'] = [0]
+        dat['node_changeovers'] = [0]
+    return dat, warnings
+
+
+def csv_row(dat):
+    dat = dict(dat)
+    for tcol in ['thread_times', 'cpu_changeovers', 'node_changeovers']:
+        dat[tcol] = ' '.join(map(str, dat[tcol]))
+    return ','.join(map(str, [v for _, v in sorted(dat.items())]))
+
+def file_sig(fn):
+    """ [size, mtime] of fn, or None if it doesn't exist """
+    if not os.path.exists(fn):
+        return None
+    st = os.stat(fn)
+    return [st.st_size, st.st_mtime]
+
+
+def find_runs(system_dir):
+    """ (directory, .err file name) for every run, in sorted order """
+    runs = []
     for root, dirs, files in os.walk(system_dir):
         #if 'unp.old' in root or 'pe.old' in root:
         #    print('ignoring "%s"' % root, file=sys.stderr)
         #    continue
-        print('Examining "%s"' % root, file=sys.stderr)
-        if any(map(lambda x: x.endswith('.err'), files)):
-            print('  Has .err files', file=sys.stderr)
-            aligner, series, pe = parse_dir(root)
-            for fn in filter(lambda x: x.endswith('.err'), files):
-                print('  Examining "%s/%s"' % (root, fn), file=sys.stderr)
-                dat = new_dat()
-                threads_per_proc, proc_id, tot_threads, attempt = parse_file(fn, pe)
-                dat.update({'aligner': aligner, 'series': series, 'pe': pe,
-                            'threads_per_proc' : threads_per_proc, 'proc_id': proc_id,
-                            'totthreads': tot_threads, 'attempt': attempt})
-                if threads_per_proc == 0:
-                    threads_per_proc = tot_threads
-                if fn.endswith('.err'):
-                    fn = os.path.join(root, fn)
-                    fn_out = fn[:-4] + '.out'
-                    if aligner != 'bwa' and not os.path.exists(fn_out):
-                        raise RuntimeError('.err file without .out companion: ' + fn_out)
-                    with open(fn) as ifh:
-                        for ln in ifh:
-                            if ln.startswith('Time loading reference'):
-                                dat['refload'] = parse_time(ln.split()[-1])
-                            elif ln.startswith('Time loading forward index'):
-                                dat['fwload'] = parse_time(ln.split()[-1])
-                            elif ln.startswith('Time loading mirror index'):
-                                dat['rvload'] = parse_time(ln.split()[-1])
-                            elif ln.startswith('[bwa_idx_load] wall time'):
-                                dat['fwload'] = float(ln.split()[3])
-                            elif ln.startswith('Multiseed full-index'):
-                                dat['search_time'] = parse_time(ln.split()[-1])
-                            elif 'were unpaired; of these' in ln:
-                                dat['nunp'] = int(ln.split()[0])
-                            elif 'aligned 0 times' in ln:
-                                dat['nunp_0al'] = int(ln.split()[0])
-                            elif 'aligned exactly 1 time' in ln:
-                                dat['nunp_1al'] = int(ln.split()[0])
-                            elif 'aligned >1 times' in ln:
-                                dat['nunp_multial'] = int(ln.split()[0])
-                            elif 'aligned concordantly 0 times' in ln:
-                                dat['nconc_0al'] = int(ln.split()[0])
-                            elif 'aligned concordantly exactly 1 time' in ln:
-                                dat['nconc_1al'] = int(ln.split()[0])
-                            elif 'aligned concordantly >1 times' in ln:
-                                dat['nconc_multial'] = int(ln.split()[0])
-                            elif 'pairs aligned concordantly 0 times; of these' in ln:
-                                dat['nconc_0al'] = int(ln.split()[0])
-                            elif 'aligned discordantly 1 time' in ln:
-                                dat['ndisc_1al'] = int(ln.split()[0])
-                            elif 'pairs aligned 0 times concordantly or discordantly; of these' in ln:
-                                dat['nconcdisc_0al'] = int(ln.split()[0])
-                            elif ln.startswith('Time searching:'):
-                                dat['search_time'] = parse_time(ln.split()[-1])
-                            elif ln.startswith('[M::process] read'):
-                                if dat['rd_load_time'] == 'NA':
-                                    dat['rd_load_time'] = 0.0
-                                dat['rd_load_time'] += float(ln.split()[9])
-                            elif ln.startswith('[kt_pipeline]'):
-                                if dat['search_time'] == 'NA':
-                                    dat['search_time'] = 0
-                                dat['search_time'] += float(ln.split()[3])
-
-                    if aligner != 'bwa':
-                        with open(fn_out) as iofh:
-                            for ln in iofh:
-                                toks = ln.split()
-                                assert toks[0] == 'thread:'
-                                if toks[2] == 'time:':
-                                    dat['thread_times'].append(parse_time(toks[-1]))
-                                elif toks[2] == 'cpu_changeovers:':
-                                    dat['cpu_changeovers'].append(int(toks[-1]))
-                                elif toks[2] == 'node_changeovers:':
-                                    dat['node_changeovers'].append(int(toks[-1]))
-                                else:
-                                    raise RuntimeError('Unrecognized output line: ' + ln)
-                        if len(dat['thread_times']) < threads_per_proc:
-                            print('WARNING: number of thread_times (%d) was less than threads per proc (%d)' % \
-                                  (len(dat['thread_times']), threads_per_proc), file=sys.stderr)
-                        else:
-                            for tcol in ['thread_times', 'cpu_changeovers', 'node_changeovers']:
-                                dat[tcol] = ' '.join(map(str, dat[tcol]))
-                            print(','.join(map(str, [v for _, v in sorted(dat.items())])))
-                    else:
-                        dat['thread_times'] = [dat['search_time']]
-                        dat['cpu_changeovers'] = [0]
-                        dat['node_changeovers'] = [0]
-                        for tcol in ['thread_times', 'cpu_changeovers', 'node_changeovers']:
-                            dat[tcol] = ' '.join(map(str, dat[tcol]))
-                        print(','.join(map(str, [v for _, v in sorted(dat.items())])))
+        runs.extend((root, fn) for fn in files if fn.endswith('.err'))
+    return sorted(runs)
+
+
+def run_file(root, fn, ext):
+    """ A file master.py writes once per run, named after process 0, for a process's .err """
+    toks = fn[:-4].split('_')
+    toks[3] = '0'
+    return os.path.join(root, '_'.join(toks) + ext)
+
+
+def load_cache(fn):
+    """ Cached {.err path: {'sig', 'dat', 'warnings'}}, or {} if missing or stale """
+    if fn is None or not os.path.exists(fn):
+        return {}
+    try:
+        with open(fn) as fh:
+            cache = json.load(fh)
+    except ValueError:
+        print('WARNING: ignoring unreadable cache "%s"' % fn, file=sys.stderr)
+        return {}
+    if cache.get('version') != CACHE_VERSION:
+        return {}
+    return cache['runs']
+
+
+def write_atomic(fn, text):
+    """ Write text to fn via a temporary file, renamed into place """
+    tmp_fn = fn + '.tmp'
+    with open(tmp_fn, 'w') as ofh:
+        ofh.write(text)
+        fsync_file(ofh)
+    os.rename(tmp_fn, fn)
+    fsync_dir(os.path.dirname(os.path.abspath(fn)))
+
+
+def tabulate(args):
+    system_dir = os.path.join(args.system, 'results')
+    if not os.path.exists(system_dir):
+        raise RuntimeError('No such directory as "%s"' % system_dir)
+    cache_fn = None if args.no_cache else os.path.join(system_dir, '.tabulate_cache.json')
+    cache = load_cache(cache_fn)
+    runs, sigs, todo = find_runs(system_dir), {}, []
+    for root, fn in runs:
+        path = os.path.join(root, fn)
+        sigs[path] = [file_sig(path), file_sig(path[:-4] + '.out'), file_sig(run_file(root, fn, '.steady')),
+                      file_sig(run_file(root, fn, '.EARLY_STOP'))]
+        if path not in cache or cache[path]['sig'] != sigs[path]:
+            todo.append((args.system, root, fn))
+    print('%d runs, %d new or changed' % (len(runs), len(todo)), file=sys.stderr)
+    if args.workers > 1 and len(todo) > 1:
+        pool = multiprocessing.Pool(min(args.workers, len(todo)))
+        results = pool.map(parse_run, todo, chunksize=max(1, len(todo) // (4 * args.workers)))
+        pool.close()
+        pool.join()
+    else:
+        results = list(map(parse_run, todo))
+    parsed = dict((os.path.join(root, fn), res) for (_, root, fn), res in zip(todo, results))
+    new_cache, dats = {}, []
+    for root, fn in runs:
+        path = os.path.join(root, fn)
+        if path in parsed:
+            dat, warnings = parsed[path]
+        else:
+            dat, warnings = cache[path]['dat'], cache[path]['warnings']
+        new_cache[path] = {'sig': sigs[path], 'dat': dat, 'warnings': warnings}
+        for warning in warnings:
+            print(warning, file=sys.stderr)
+        if dat is not None:
+            dats.append(dat)
+    table = ','.join(k for k, _ in sorted(new_dat().items())) + '\n' + ''.join(csv_row(dat) + '\n' for dat in dats)
+    if args.output is None:
+        sys.stdout.write(table)
+    else:
+        write_atomic(args.output, table)
+    if args.store is not None:
+        machine = args.machine or os.path.basename(os.path.normpath(args.system))
+        tmp_fn = args.store + '.tmp.npz'
+        results_store.write(tmp_fn, results_store.build(dats, machine))
+        os.rename(tmp_fn, args.store)
+    if cache_fn is not None and (len(parsed) > 0 or len(new_cache) != len(cache)):
+        write_atomic(cache_fn, json.dumps({'version': CACHE_VERSION, 'runs': new_cache}))
+
 
 if __name__ == '__main__':
-    tabulate()
+
+    import argparse
+    parser = argparse.ArgumentParser(description='Tabulate thread-scaling results as CSV.')
+
+    parser.add_argument('system', metavar='dir', type=str,
+                        help='System directory, with runs under <dir>/results.')
+    parser.add_argument('--output', metavar='path', type=str,
+                        help='Write the table here, atomically, instead of to stdout.')
+    parser.add_argument('--store', metavar='path', type=str,
+                        help='Also write per-thread and per-run tables to this .npz; see results_store.py.')
+    parser.add_argument('--machine', metavar='name', type=str,
+                        help='Machine name recorded in --store; default: the system directory\'s name.')
+    parser.add_argument('--workers', metavar='int', type=int, default=multiprocessing.cpu_count(),
+                        help='# worker processes parsing runs.')
+    parser.add_argument('--no-cache', action='store_const', const=True, default=False,
+                        help='Parse every run, and neither read nor write the cache.')
+    tabulate(parser.parse_args())
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+"""
+Batched input for cs_sim.py.  With --reads-per-batch B a thread takes B reads
+each time it gets the input lock (B-parsing; B = 1 is D-parsing).  The
+critical section then costs a fixed overhead plus B per-read parsing costs,
+and is followed by B parallel phases.  With lightweight parsing (L-parsing,
+i.e. --block-bytes/--reads-per-block) the critical section only copies a
+block of B reads, at a fixed cost per read, and parsing moves to the
+parallel phase.
+
+Larger batches amortize the overhead, but when the input runs out threads
+finish their last batches at different times, and that gap grows with B.
+recommend() weighs the two using the queueing model in mva.py.
+"""
+
+from __future__ import print_function
+import numpy
+import mva
+
+
+def batch_len_funcs(cs_func, p_func, batch_size, overhead=0.0, light=False, copy_length=0.0):
+    """ Functions giving whole-batch critical and parallel section lengths, for Simulation """
+    def cs():
+        if light:
+            return overhead + batch_size * copy_length
+        return overhead + sum(cs_func() for _ in range(batch_size))
+
+    def p():
+        tot = sum(p_func() for _ in range(batch_size))
+        if light:
+            tot += sum(cs_func() for _ in range(batch_size))
+        return tot
+    return cs, p
+
+
+def batch_samplers(cs_sampler, p_sampler, batch_size, overhead=0.0, light=False, copy_length=0.0):
+    """ Samplers of whole-batch critical and parallel section lengths, for vec_sim """
+    def cs(rng, shape):
+        if light:
+            return numpy.full(shape, overhead + batch_size * copy_length)
+        return overhead + cs_sampler(rng, tuple(shape) + (batch_size,)).sum(axis=-1)
+
+    def p(rng, shape):
+        tot = p_sampler(rng, tuple(shape) + (batch_size,)).sum(axis=-1)
+        if light:
+            tot += cs_sampler(rng, tuple(shape) + (batch_size,)).sum(axis=-1)
+        return tot
+    return cs, p
+
+
+def batch_moments(cs_mean, cs_var, p_mean, batch_size, overhead=0.0, light=False, copy_length=0.0):
+    """ Mean and variance of a batch's critical section, and mean of its parallel section """
+    if light:
+        return overhead + batch_size * copy_length, 0.0, batch_size * (p_mean + cs_mean)
+    return overhead + batch_size * cs_mean, batch_size * cs_var, batch_size * p_mean
+
+
+def recommend(threads, batch_sizes, cs_mean, cs_var, p_mean, overhead=0.0, light=False, copy_length=0.0,
+              total_reads=None, tolerance=0.01, stall=None):
+    """
+    For each thread count, the smallest batch size whose read throughput is
+    within tolerance of the best.  Throughput is steady-state reads per unit
+    time or, given total_reads, total_reads over the expected time to align
+    them all.  In the latter, once the input runs out the last thread still
+    has about n/(n+1) of a batch's parallel work to do, vs. half on average.
+    stall(batch size), if given, is the mean and variance of time the
+    critical section also spends reading input (see storage.py).  Returns
+    (n, batch size, its throughput, best batch size, best throughput) tuples.
+    """
+    nmax = max(threads)
+    scores = {}
+    for b in batch_sizes:
+        cs_b, var_b, p_b = batch_moments(cs_mean, cs_var, p_mean, b, overhead, light, copy_length)
+        if stall is not None:
+            io_mean, io_var = stall(b)
+            cs_b, var_b = cs_b + io_mean, var_b + io_var
+        res = mva.solve(nmax, cs_b, p_b, var_b / (cs_b * cs_b) if cs_b > 0 else 0.0)
+        for n in threads:
+            thru = b * res[n - 1]['throughput']
+            if total_reads is not None:
+                thru = total_reads / (total_reads / thru + p_b * (float(n) / (n + 1) - 0.5))
+            scores[(n, b)] = thru
+    rows = []
+    for n in threads:
+        best = max(batch_sizes, key=lambda b: scores[(n, b)])
+        rec = min(b for b in batch_sizes if scores[(n, b)] >= (1.0 - tolerance) * scores[(n, best)])
+        rows.append((n, rec, scores[(n, rec)], best, scores[(n, best)]))
+    return rows
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+
+"""
+Fits cs_sim.py's per-read critical and parallel section lengths to a measured
+series.  Reads the CSV written by scripts/tabulate.py, takes each thread
+count's measured throughput (reads over the slowest process's search time,
+averaged over attempts), and grid-searches --cs-length, --p-length and the
+critical section's coefficient of variation for the parameters whose modeled
+throughput is closest to measured (least squares on log throughput).
+
+Modeled throughputs come from the analytical model (mva.py; an MP+MT point is
+mp_mt-thread processes side by side), which cs_sim.py --validate checks against simulation; that's
+what makes a fine grid affordable.  SDs and minimums not fitted are set in the
+same proportion to the means as cs_sim.py's defaults.  Parallel-section SD
+barely moves throughput, so it can't be fitted this way.
+
+The fitted parameters are written as an argparse file, one argument per line,
+for cs_sim.py to read with @:
+
+    python calibrate.py results.csv --aligner bt2 --series baseline-tbbq --pe unp --output bt2.args
+    python cs_sim.py @bt2.args --threads 1,8,64,136,272,544
+"""
+
+from __future__ import print_function
+import sys
+import csv
+import math
+import numpy
+import mva
+
+# SDs and minimums relative to the mean, as in cs_sim.py's defaults
+SD_FRAC = 0.2
+MIN_FRAC = 0.2
+
+
+def read_series(fn, aligner=None, series=None, pe=None, reads_per_thread=0):
+    """
+    Returns [(total threads, threads per process, measured reads per unit
+    time)] sorted by # threads, and the mean index-loading time
+    """
+    runs, loads = {}, []
+    with open(fn) as fh:
+        for row in csv.DictReader(fh):
+            if (aligner is not None and row['aligner'] != aligner) or \
+                    (series is not None and row['series'] != series) or \
+                    (pe is not None and row['pe'] != pe):
+                continue
+            if row['search_time'] == 'NA':
+                continue
+            nthreads = int(row['totthreads'])
+            per_proc = int(row['threads_per_proc']) or nthreads
+            if reads_per_thread > 0:
+                nreads = reads_per_thread * per_proc
+            elif row['nunp'] != 'NA':
+                nreads = int(row['nunp'])
+            else:
+                raise RuntimeError('No read count for %s; specify --reads-per-thread' % row['series'])
+            key = (nthreads, per_proc, int(row['attempt']))
+            tot, slowest = runs.get(key, (0, 0.0))
+            runs[key] = (tot + nreads, max(slowest, float(row['search_time'])))
+            load = [float(row[k]) for k in ['refload', 'fwload', 'rvload'] if row[k] != 'NA']
+            if len(load) > 0:
+                loads.append(sum(load))
+    if len(runs) == 0:
+        raise RuntimeError('No measurements for the given series in "%s"' % fn)
+    thru = {}
+    for (nthreads, per_proc, _), (nreads, secs) in runs.items():
+        thru.setdefault((nthreads, per_proc), []).append(nreads / secs)
+    points = [(n, t, numpy.mean(xs)) for (n, t), xs in sorted(thru.items())]
+    return points, (numpy.mean(loads) if len(loads) > 0 else 0.0)
+
+
+def modeled(points, cs_length, p_length, cs_cv):
+    """
+    Modeled reads per unit time at each point, for cs_sim.py's length
+    distributions; parameters may be arrays, giving an array per point
+    """
+    moments = numpy.array([mva.clamped_normal_moments(c, v * c, MIN_FRAC * c) +
+                           mva.clamped_normal_moments(p, SD_FRAC * p, MIN_FRAC * p)[:1]
+                           for c, p, v in zip(*numpy.broadcast_arrays(*map(numpy.atleast_1d, (cs_length, p_length, cs_cv))))])
+    cs_mean, cs_var, p_mean = moments.T
+    # without a bandwidth slowdown, processes are independent, and one pass
+    # of MVA covers every process size
+    thru = mva.throughputs(max(per_proc for _, per_proc, _ in points), cs_mean, p_mean, cs_var / (cs_mean * cs_mean))
+    return [(n // per_proc) * thru[per_proc - 1] for n, per_proc, _ in points]
+
+
+def fit(points, cvs, npts=25, rounds=4):
+    """
+    Grid search over per-read cycle time (critical + parallel section), the
+    critical section's share of it, and its coefficient of variation;
+    each round zooms in around the best cell so far.  Returns (cs_length,
+    p_length, cs_cv) and its sum of squared log errors.
+    """
+    n0, per_proc0, thru0 = points[0]
+    cycle0 = per_proc0 / (thru0 * (n0 // per_proc0))  # time per read per thread at fewest threads
+    log_cycle = (math.log(cycle0 / 2.0), math.log(cycle0 * 2.0))
+    log_share = (math.log(1e-5), math.log(0.99))
+    best = None
+    for rnd in range(rounds):
+        cycles, shares, cs_cvs = [x.ravel() for x in numpy.meshgrid(
+            numpy.exp(numpy.linspace(log_cycle[0], log_cycle[1], npts)),
+            numpy.exp(numpy.linspace(log_share[0], log_share[1], npts)), cvs)]
+        cs_lengths, p_lengths = cycles * shares, cycles * (1.0 - shares)
+        errs = sum(numpy.log(m / x) ** 2 for m, (_, _, x) in zip(modeled(points, cs_lengths, p_lengths, cs_cvs), points))
+        i = int(errs.argmin())
+        if best is None or errs[i] < best[1]:
+            best = ((cs_lengths[i], p_lengths[i], cs_cvs[i]), errs[i])
+        print('  round %d: cs_length=%g p_length=%g cs_cv=%g err=%g' % ((rnd + 1,) + best[0] + (best[1],)),
+              file=sys.stderr)
+        cs_length, p_length, _ = best[0]
+        cycle, share = cs_length + p_length, cs_length / (cs_length + p_length)
+        step_c = (log_cycle[1] - log_cycle[0]) / (npts - 1)
+        step_s = (log_share[1] - log_share[0]) / (npts - 1)
+        log_cycle = (math.log(cycle) - 2 * step_c, math.log(cycle) + 2 * step_c)
+        log_share = (math.log(share) - 2 * step_s, min(math.log(share) + 2 * step_s, math.log(0.99)))
+    return best
+
+
+def write_args(fn, cs_length, p_length, cs_cv, serial_length):
+    args = [('--cs-length', cs_length), ('--cs-length-sd', cs_cv * cs_length),
+            ('--cs-length-min', MIN_FRAC * cs_length),
+            ('--p-length', p_length), ('--p-length-sd', SD_FRAC * p_length),
+            ('--p-length-min', MIN_FRAC * p_length),
+            ('--serial-length', serial_length)]
+    with open(fn, 'w') as ofh:
+        for k, v in args:
+            ofh.write('%s\n%r\n' % (k, float(v)))
+
+
+def go(args):
+    points, serial_length = read_series(args.csv, args.aligner, args.series, args.pe, args.reads_per_thread)
+    print('Fitting %d thread counts' % len(points), file=sys.stderr)
+    cvs = [float(x) for x in args.cs_cv.rstrip(',').split(',')]
+    (cs_length, p_length, cs_cv), err = fit(points, cvs, args.grid_points, args.rounds)
+    print("nthreads\tthreads_per_proc\tmeasured\tmodeled\trel_err")
+    for (n, per_proc, thru), m in zip(points, modeled(points, cs_length, p_length, cs_cv)):
+        m = float(m[0])
+        print("%d\t%d\t%0.3f\t%0.3f\t%0.4f" % (n, per_proc, thru, m, (m - thru) / thru))
+    print('cs_length=%g p_length=%g cs_cv=%g serial_length=%g rms_log_err=%g' %
+          (cs_length, p_length, cs_cv, serial_length, math.sqrt(err / len(points))), file=sys.stderr)
+    if args.output is not None:
+        write_args(args.output, cs_length, p_length, cs_cv, serial_length)
+
+
+if __name__ == '__main__':
+
+    import argparse
+    parser = argparse.ArgumentParser(description='Fit simulator parameters to measured thread-scaling results.')
+
+    parser.add_argument('csv', metavar='path', type=str,
+                        help='CSV output of scripts/tabulate.py.')
+    parser.add_argument('--aligner', type=str,
+                        help='Only use rows for this aligner (bt, bt2, ht, bwa).')
+    parser.add_argument('--series', type=str,
+                        help='Only use rows for this series, e.g. baseline-tbbq.')
+    parser.add_argument('--pe', type=str, choices=['unp', 'pe'],
+                        help='Only use unpaired or paired-end rows.')
+    parser.add_argument('--reads-per-thread', metavar='int', type=int, default=0,
+                        help='Reads per thread in the runs, as given to master.py; default: from the counts '
+                             'in the CSV (unpaired only).')
+    parser.add_argument('--cs-cv', metavar='float,...', type=str, default='0,0.2,0.5,1',
+                        help='Comma-separated critical section coefficients of variation to try.')
+    parser.add_argument('--grid-points', type=int, default=25,
+                        help='Grid points per dimension per round.')
+    parser.add_argument('--rounds', type=int, default=4,
+                        help='# rounds of zooming in on the best grid cell.')
+    parser.add_argument('--output', metavar='path', type=str,
+                        help='Write fitted parameters here, for cs_sim.py @path.')
+
+    go(parser.parse_args())
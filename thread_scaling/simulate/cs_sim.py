@@ -10,18 +10,57 @@ a read.
 The simulator steps forward in time, stopping only for the moments where at
 least one thread changes state.  Those are the same as the moments where any
 thread moves into or out of a critical section.
+
+--engine vector instead runs the equivalent simulation in vec_sim.py, which
+handles all thread counts and --replicas at once with numpy.  --engine array
+runs the compact event core in event_core.py, for long runs; with
+--telemetry it also writes per-time-bucket statistics (see telemetry.py).  --engine
+analytic gives expected values from the queueing model in mva.py, instantly;
+--validate compares those with simulation.
+
+With --out-cs-length > 0 threads also take an output lock to write each
+read's (or, with --batch-output, each batch's) output after aligning it, and
+the per-lock table shows which lock saturates first; see pipeline.py.
+
+--mp-mt T splits each thread count into processes of T threads with their own
+locks, as master.py does, and compares with a single process (pure MT);
+--bw-slowdown stretches parallel phases as more threads run them at once.
+See mp_sim.py.
+
+--cs-dist and --p-dist draw lengths from empirical distributions instead of
+clamped normals, and --p-trace replays recorded per-read alignment times until
+they run out; see empirical.py.
+
+--io-bandwidth > 0 adds time blocked reading from a storage device (latency,
+bandwidth, readahead, other clients) to the input critical section, on top
+of parsing; see storage.py.  The table then also shows the input lock's
+utilization and the share of it spent on I/O.
 """
 
 from __future__ import print_function
+import sys
 import argparse
 import heapq
-from collections import deque
 import numpy
+import vec_sim
+import mva
+import locks
+import batching
+import pipeline
+import mp_sim
+import empirical
+import event_core
+import telemetry
+import storage
+
+
+# locks in the input/output pipeline, in the order they're reported
+IO_LOCKS = ['in', 'out']
 
 
 class Simulation(object):
 
-    def __init__(self, nthreads, cs_len_func, p_len_func, initial_time=0.0):
+    def __init__(self, nthreads, cs_len_func, p_len_func, initial_time=0.0, lock=None, nreads=None):
         self.N = nthreads
         # function that returns critical section length in time
         self.cs_len_func = cs_len_func
@@ -29,13 +68,20 @@ class Simulation(object):
         self.p_len_func = p_len_func
         self.in_cs = None
         self.coming_up = []
-        self.waiting = deque()
+        # decides who gets the lock next, and how long hand-off takes
+        self.lock = locks.FifoLock() if lock is None else lock
         for i in range(nthreads):
             time = self.p_len_func()
             heapq.heappush(self.coming_up, (initial_time + time, 'P', i, time))
         self.p_time = 0
         self.cs_time = 0
         self.wait_time = 0
+        # with a finite input of nreads reads (each thread starts with one),
+        # threads finish when it runs out, at these times
+        self.reads_left = None if nreads is None else nreads - nthreads
+        if nreads is not None and self.reads_left < 0:
+            raise RuntimeError('Fewer reads (%d) than threads (%d)' % (nreads, nthreads))
+        self.finish = [None] * nthreads
 
     def step(self, stop_after=float('inf')):
         """
@@ -74,32 +120,42 @@ class Simulation(object):
 
         Possible states to follow: B or C
         """
-        while True:
+        while len(self.coming_up) > 0:
             assert self.rep_ok()
             new_time, old_state, thread, elapsed = heapq.heappop(self.coming_up)
             if new_time > stop_after:
                 return
             if old_state == 'P':
                 self.p_time += elapsed
-                if self.in_cs is not None:
+                if self.reads_left == 0:
+                    self.finish[thread] = new_time
+                elif self.in_cs is not None:
                     # put in waiting state
-                    self.waiting.appendleft((thread, new_time))
+                    self.lock.wait(thread, new_time)
                 else:
                     # immediately enter CS
                     self.in_cs = thread
+                    self.take_read()
                     time = self.cs_len_func()
                     heapq.heappush(self.coming_up, (new_time + time, 'C', thread, time))
             elif old_state == 'C':
-                # possibly awaken a waiting task
+                # possibly awaken a waiting task; it holds the lock from
+                # now on but only enters the CS after the hand-off
                 self.cs_time += elapsed
-                if len(self.waiting) > 0:
-                    wait_thread, wait_time = self.waiting.pop()
-                    assert new_time > wait_time
-                    self.wait_time += (new_time - wait_time)
-                    yield wait_time, new_time, wait_thread
+                if self.reads_left == 0:
+                    # input's exhausted, so the waiters are done too
+                    self.drain(new_time)
+                nxt = self.lock.handoff(new_time, self.N)
+                if nxt is not None:
+                    wait_thread, wait_time, handoff = nxt
+                    start = new_time + handoff
+                    assert start > wait_time
+                    self.wait_time += (start - wait_time)
+                    yield wait_time, start, wait_thread
                     self.in_cs = wait_thread
+                    self.take_read()
                     time = self.cs_len_func()
-                    heapq.heappush(self.coming_up, (new_time + time, 'C', wait_thread, time))
+                    heapq.heappush(self.coming_up, (start + time, 'C', wait_thread, time))
                 else:
                     self.in_cs = None
                 time = self.p_len_func()
@@ -107,30 +163,396 @@ class Simulation(object):
             else:
                 raise RuntimeError('Bad old state: ' + old_state)
 
+    def take_read(self):
+        if self.reads_left is not None:
+            self.reads_left -= 1
+
+    def drain(self, time):
+        while True:
+            nxt = self.lock.handoff(time, self.N)
+            if nxt is None:
+                return
+            self.wait_time += time - nxt[1]
+            self.finish[nxt[0]] = time
+
     def rep_ok(self):
         return True
 
 
+def norm_func(mean, sd, minimum):
+    if sd == 0:
+        return lambda: mean
+    return lambda: max(numpy.random.normal(mean, sd), minimum)
+
+
+def len_func(args, which):
+    """ Event-engine length function for the 'cs' or 'p' section """
+    dist = getattr(args, which + '_dist')
+    if dist is not None:
+        return empirical.len_func(empirical.load_dist(dist))
+    return norm_func(getattr(args, which + '_length'), getattr(args, which + '_length_sd'),
+                     getattr(args, which + '_length_min'))
+
+
+def sampler(args, which):
+    """ vec_sim sampler for the 'cs' or 'p' section """
+    dist = getattr(args, which + '_dist')
+    if dist is not None:
+        return empirical.load_dist(dist)
+    return vec_sim.normal_sampler(getattr(args, which + '_length'), getattr(args, which + '_length_sd'),
+                                  getattr(args, which + '_length_min'))
+
+
+def make_lock(name, args):
+    return locks.make_lock(name, args.handoff_cost, args.handoff_cost_per_thread,
+                           args.wake_latency, args.backoff_min, args.backoff_max)
+
+
+def storage_model(args, nprocess=1):
+    """ The input device given by --io-*, shared by nprocess processes, or None """
+    if args.io_bandwidth == 0:
+        return None
+    return storage.Storage(args.io_latency, args.io_bandwidth, args.io_readahead, args.io_clients * nprocess)
+
+
+def batch_bytes(args):
+    return args.reads_per_batch * args.read_bytes
+
+
+def in_len_funcs(args, p_func=None, nprocess=1):
+    """ Whole-batch input critical and parallel section length functions, with read stalls """
+    if p_func is None:
+        p_func = len_func(args, 'p')
+    cs_func, p_func = batching.batch_len_funcs(len_func(args, 'cs'), p_func, args.reads_per_batch, args.batch_overhead,
+                                               args.light_parsing, args.copy_length)
+    dev = storage_model(args, nprocess)
+    if dev is not None:
+        cs_func = storage.add_len_func(cs_func, dev.len_func(batch_bytes(args)))
+    return cs_func, p_func
+
+
+def in_samplers(args):
+    """ As in_len_funcs, for vec_sim and event_core """
+    cs_sampler, p_sampler = batching.batch_samplers(sampler(args, 'cs'), sampler(args, 'p'), args.reads_per_batch,
+                                                    args.batch_overhead, args.light_parsing, args.copy_length)
+    dev = storage_model(args)
+    if dev is not None:
+        cs_sampler = storage.add_sampler(cs_sampler, dev.sampler(batch_bytes(args)))
+    return cs_sampler, p_sampler
+
+
+def run_event(n, args):
+    cs_func, p_func = in_len_funcs(args)
+    sim = Simulation(n, cs_func, p_func, args.serial_length, make_lock(args.lock, args))
+    for _ in sim.step(stop_after=args.until):
+        pass
+    return sim.p_time, sim.cs_time, sim.wait_time
+
+
+def run_trace(n, args):
+    """ Replay --p-trace until it runs out; returns times and each thread's finish time """
+    trace = empirical.load_trace(args.p_trace)
+    cs_func, p_func = in_len_funcs(args, trace)
+    sim = Simulation(n, cs_func, p_func, args.serial_length, make_lock(args.lock, args),
+                     nreads=len(trace) // args.reads_per_batch)
+    for _ in sim.step():
+        pass
+    return sim.p_time, sim.cs_time, sim.wait_time, sim.finish
+
+
+def print_trace(threads, args):
+    """ Per thread count, time until the last thread finishes and how evenly they finish """
+    if args.seed is not None:
+        numpy.random.seed(args.seed)
+    print("nthreads\tp_time\tcs_time\twait_time\tmakespan\tthreads_div_max")
+    for n in threads:
+        p_time, cs_time, wait_time, finish = run_trace(n, args)
+        spans = numpy.array(finish) - args.serial_length
+        print("%d\t%0.3f\t%0.3f\t%0.3f\t%0.3f\t%0.4f" % (n, p_time, cs_time, wait_time,
+                                                         spans.max(), spans.mean() / spans.max()))
+
+
+def run_vector(threads, args):
+    """ All thread counts and replicas in one go; returns mean times per thread count """
+    cs_sampler, p_sampler = in_samplers(args)
+    res = vec_sim.simulate(numpy.repeat(threads, args.replicas), cs_sampler, p_sampler,
+                           args.until, args.serial_length, numpy.random.RandomState(args.seed))
+    means = [res[k].reshape(len(threads), args.replicas).mean(axis=1) for k in ['p_time', 'cs_time', 'wait_time']]
+    return list(zip(*means))
+
+
+def handoff_cost(args, n):
+    """ Fixed hand-off time of --lock for n threads, for event_core """
+    if args.lock == 'fifo':
+        return 0.0
+    if args.lock == 'mutex':
+        return args.wake_latency
+    if args.lock == 'queue':
+        return args.handoff_cost + args.handoff_cost_per_thread * n
+    raise RuntimeError('--engine array needs a FIFO lock (fifo, mutex or queue), not --lock %s' % args.lock)
+
+
+def run_array(threads, args):
+    """ Mean times per thread count, from event_core """
+    cs_sampler, p_sampler = in_samplers(args)
+    rng = numpy.random.RandomState(args.seed)
+    res, tables = [], []
+    for n in threads:
+        times = []
+        for _ in range(args.replicas):
+            tel = None
+            if args.telemetry is not None:
+                tel = telemetry.Telemetry(n, args.bucket, args.until)
+                tables.append(tel)
+            sim = event_core.ArraySimulation(n, cs_sampler, p_sampler, args.serial_length, rng,
+                                             handoff_cost(args, n), telemetry=tel)
+            sim.run(stop_after=args.until)
+            times.append((sim.p_time, sim.cs_time, sim.wait_time))
+        res.append(numpy.mean(times, axis=0))
+    if args.telemetry is not None:
+        telemetry.write(args.telemetry, tables)
+    return res
+
+
+def read_moments(args):
+    """ Per-read critical section mean and variance, parallel section mean """
+    cs, p = [empirical.load_dist(getattr(args, which + '_dist')) if getattr(args, which + '_dist') is not None
+             else None for which in ['cs', 'p']]
+    if cs is not None:
+        cs_mean, cs_var = cs.mean, cs.var
+    else:
+        cs_mean, cs_var = mva.clamped_normal_moments(args.cs_length, args.cs_length_sd, args.cs_length_min)
+    if p is not None:
+        p_mean = p.mean
+    else:
+        p_mean, _ = mva.clamped_normal_moments(args.p_length, args.p_length_sd, args.p_length_min)
+    return cs_mean, cs_var, p_mean
+
+
+def in_moments(args, nprocess=1):
+    """ Whole-batch input critical section mean and variance, with read stalls, and parallel section mean """
+    cs_mean, cs_var, p_mean = batching.batch_moments(*read_moments(args), batch_size=args.reads_per_batch,
+                                                     overhead=args.batch_overhead, light=args.light_parsing,
+                                                     copy_length=args.copy_length)
+    dev = storage_model(args, nprocess)
+    if dev is not None:
+        io_mean, io_var = dev.moments(batch_bytes(args))
+        cs_mean, cs_var = cs_mean + io_mean, cs_var + io_var
+    return cs_mean, cs_var, p_mean
+
+
+def io_share(args):
+    """ Expected fraction of the input critical section spent blocked on the device """
+    return storage_model(args).moments(batch_bytes(args))[0] / in_moments(args)[0]
+
+
+def run_analytic(threads, args):
+    """ Expected times over the post-serial part of the run, per thread count """
+    cs_mean, cs_var, p_mean = in_moments(args)
+    res = mva.solve(max(threads), cs_mean, p_mean, cs_var / (cs_mean * cs_mean))
+    span = args.until - args.serial_length
+    return [(res[n-1]['parallel'] * span, res[n-1]['lock_util'] * span, res[n-1]['waiting'] * span) for n in threads]
+
+
+def run(threads, args, engine):
+    if engine == 'analytic':
+        return run_analytic(threads, args)
+    if engine == 'vector':
+        return run_vector(threads, args)
+    if engine == 'array':
+        return run_array(threads, args)
+    if args.seed is not None:
+        numpy.random.seed(args.seed)
+    return [numpy.mean([run_event(n, args) for _ in range(args.replicas)], axis=0) for n in threads]
+
+
+def run_pipeline_event(n, args):
+    phases = pipeline.io_phases(len_func(args, 'cs'), len_func(args, 'p'),
+                                norm_func(args.out_cs_length, args.out_cs_length_sd, args.out_cs_length_min),
+                                args.reads_per_batch, args.batch_overhead, args.out_batch_overhead,
+                                args.batch_output, args.light_parsing, args.copy_length)
+    dev = storage_model(args)
+    if dev is not None:
+        stall = dev.len_func(batch_bytes(args))
+        phases = [(storage.add_len_func(f, stall) if l == 'in' else f, l) for f, l in phases]
+    sim = pipeline.PipelineSimulation(n, phases, {'in': make_lock(args.lock, args),
+                                                  'out': make_lock(args.out_lock, args)},
+                                      args.serial_length)
+    sim.run(stop_after=args.until)
+    return [sim.p_time] + [sim.cs_time[l] for l in IO_LOCKS] + [sim.wait_time[l] for l in IO_LOCKS]
+
+
+def run_pipeline_analytic(threads, args):
+    out_mean, out_var = mva.clamped_normal_moments(args.out_cs_length, args.out_cs_length_sd, args.out_cs_length_min)
+    stations, p_mean = pipeline.io_stations(*(read_moments(args) + (out_mean, out_var)),
+                                            batch_size=args.reads_per_batch, overhead=args.batch_overhead,
+                                            out_overhead=args.out_batch_overhead, batch_output=args.batch_output,
+                                            light=args.light_parsing, copy_length=args.copy_length)
+    dev = storage_model(args)
+    if dev is not None:
+        # read stalls add to the input station's mean and variance
+        (in_mean, in_cv2, visits), io = stations[0], dev.moments(batch_bytes(args))
+        mean = in_mean + io[0]
+        stations[0] = (mean, (in_cv2 * in_mean * in_mean + io[1]) / (mean * mean), visits)
+    res = mva.solve_network(max(threads), stations, p_mean)
+    span = args.until - args.serial_length
+    return [[res[n-1]['parallel'] * span] + [u * span for u in res[n-1]['lock_util']] +
+            [w * span for w in res[n-1]['waiting']] for n in threads]
+
+
+def run_pipeline(threads, args):
+    """ p_time, then cs_time and wait_time for each of IO_LOCKS, per thread count """
+    if args.engine == 'analytic':
+        return run_pipeline_analytic(threads, args)
+    if args.seed is not None:
+        numpy.random.seed(args.seed)
+    return [numpy.mean([run_pipeline_event(n, args) for _ in range(args.replicas)], axis=0) for n in threads]
+
+
+def print_pipeline(threads, args):
+    span = args.until - args.serial_length
+    ideal_thru = float(args.until) / (args.p_length + args.cs_length_sd)
+    print("nthreads\tp_time\t" + "\t".join("%s_cs_time\t%s_wait_time\t%s_util" % (l, l, l) for l in IO_LOCKS) +
+          "\tpt_thruput\tbottleneck")
+    for n, res in zip(threads, run_pipeline(threads, args)):
+        p_time, cs_times, wait_times = res[0], res[1:1+len(IO_LOCKS)], res[1+len(IO_LOCKS):]
+        utils = [cs / span for cs in cs_times]
+        print("%d\t%0.3f\t" % (n, p_time) +
+              "\t".join("%0.3f\t%0.3f\t%0.4f" % x for x in zip(cs_times, wait_times, utils)) +
+              "\t%0.3f\t%s" % (p_time / (n * ideal_thru), IO_LOCKS[utils.index(max(utils))]))
+
+
+def bw_slowdown(args):
+    if args.bw_slowdown == 0:
+        return None
+    return mp_sim.linear_slowdown(args.bw_threads, args.bw_slowdown)
+
+
+def run_mp_event(n, nthreads, args):
+    nprocess = n // nthreads
+    cs_func, p_func = in_len_funcs(args, nprocess=nprocess)
+    sim = mp_sim.MultiProcessSimulation(nprocess, nthreads, cs_func, p_func,
+                                        mp_sim.serial_lengths(nprocess, args.serial_length, args.mm,
+                                                              args.load_contention),
+                                        lambda: make_lock(args.lock, args), bw_slowdown(args))
+    sim.run(stop_after=args.until)
+    return sim.p_time, sum(sim.cs_time), sum(sim.wait_time)
+
+
+def run_mp_analytic(n, nthreads, args):
+    nprocess = n // nthreads
+    cs_mean, cs_var, p_mean = in_moments(args, nprocess)
+    res = mp_sim.solve(nprocess, nthreads, cs_mean, p_mean, cs_var / (cs_mean * cs_mean), bw_slowdown(args))
+    # like the event engine, nothing is done if loading outlasts --until
+    span = max(0.0, args.until - mp_sim.serial_lengths(nprocess, args.serial_length, args.mm,
+                                                       args.load_contention)[0])
+    return tuple(nprocess * res[k] * span for k in ['parallel', 'lock_util', 'waiting'])
+
+
+def run_mp(n, nthreads, args):
+    """ Total times over all n // nthreads processes """
+    if args.engine == 'analytic':
+        return run_mp_analytic(n, nthreads, args)
+    return numpy.mean([run_mp_event(n, nthreads, args) for _ in range(args.replicas)], axis=0)
+
+
+def ratio(num, den):
+    """ num / den, or NaN if den is 0, e.g. when index loading outlasts --until """
+    return num / den if den != 0 else float('nan')
+
+
+def print_mp(threads, args):
+    """ MP+MT times, with pure MT throughput for comparison """
+    if args.seed is not None:
+        numpy.random.seed(args.seed)
+    print("nthreads\tnprocess\tp_time\tcs_time\twait_time\tpt_thruput\tpt_thruput2\tmt_pt_thruput\tmp_speedup")
+    ideal_thru = float(args.until) / (args.p_length + args.cs_length_sd)
+    for n in threads:
+        nthreads = n if args.mp_mt == 0 else args.mp_mt
+        if n % nthreads != 0:
+            print('Skipping nthreads=%d, not a multiple of --mp-mt %d' % (n, nthreads), file=sys.stderr)
+            continue
+        # time left after each process's (possibly contended) index load
+        load = mp_sim.serial_lengths(n // nthreads, args.serial_length, args.mm, args.load_contention)[0]
+        ideal_thru2 = max(0.0, args.until - load) / (args.p_length + args.cs_length_sd)
+        p_time, cs_time, wait_time = run_mp(n, nthreads, args)
+        mt_p_time = p_time if nthreads == n else run_mp(n, n, args)[0]
+        print("%d\t%d\t%0.3f\t%0.3f\t%0.3f\t%0.3f\t%0.3f\t%0.3f\t%0.3f" %
+              (n, n // nthreads, p_time, cs_time, wait_time, p_time/(n*ideal_thru),
+               ratio(p_time, n*ideal_thru2), mt_p_time/(n*ideal_thru), ratio(p_time, mt_p_time)))
+
+
+def validate(threads, args):
+    """ Compare analytical lock utilization and # threads waiting with simulation """
+    engine = args.engine if args.engine in ['event', 'array'] else 'vector'
+    span = args.until - args.serial_length
+    print("nthreads\tlock_util_sim\tlock_util_mva\twaiting_sim\twaiting_mva\tlock_util_err\twaiting_err")
+    for n, sim, ana in zip(threads, run(threads, args, engine), run_analytic(threads, args)):
+        util_sim, util_mva = sim[1] / span, ana[1] / span
+        wait_sim, wait_mva = sim[2] / span, ana[2] / span
+        print("%d\t%0.4f\t%0.4f\t%0.3f\t%0.3f\t%0.4f\t%0.4f" % (n, util_sim, util_mva, wait_sim, wait_mva,
+                                                               (util_mva - util_sim) / max(util_sim, 1e-9),
+                                                               (wait_mva - wait_sim) / max(wait_sim, 1e-9)))
+
+
+def recommend_batch(threads, args):
+    """ Print the recommended # reads per batch for each thread count """
+    batch_sizes = list(map(int, args.recommend_batch.rstrip(',').split(',')))
+    dev = storage_model(args)
+    stall = None if dev is None else (lambda b: dev.moments(b * args.read_bytes))
+    rows = batching.recommend(threads, batch_sizes, *read_moments(args), overhead=args.batch_overhead,
+                              light=args.light_parsing, copy_length=args.copy_length,
+                              total_reads=args.total_reads, tolerance=args.tolerance, stall=stall)
+    print("nthreads\treads_per_batch\treads_per_time\tbest_reads_per_batch\tbest_reads_per_time")
+    for n, rec, rec_thru, best, best_thru in rows:
+        print("%d\t%d\t%0.3f\t%d\t%0.3f" % (n, rec, rec_thru, best, best_thru))
+
+
 def go(args):
-    print("nthreads\tp_time\tcs_time\twait_time\tpt_thruput\tpt_thruput2")
+    threads = list(map(int, args.threads.rstrip(',').split(',')))
+    if args.recommend_batch is not None:
+        recommend_batch(threads, args)
+        return
+    for lock in set([args.lock, args.out_lock]):
+        if lock != 'fifo' and (args.engine != 'event' or args.validate) and \
+                not (args.engine == 'array' and lock in ['mutex', 'queue'] and lock == args.lock):
+            raise RuntimeError('Only --engine event simulates --lock %s' % lock)
+    if args.p_trace is not None:
+        if args.engine != 'event' or args.validate or args.mp_mt > 0 or args.bw_slowdown > 0 or \
+                args.out_cs_length > 0:
+            raise RuntimeError('--p-trace needs --engine event, without --validate, --mp-mt, --bw-slowdown '
+                               'or --out-cs-length')
+        print_trace(threads, args)
+        return
+    if args.mp_mt > 0 or args.bw_slowdown > 0:
+        if args.engine == 'vector' or args.validate or args.out_cs_length > 0:
+            raise RuntimeError('--mp-mt and --bw-slowdown need --engine event or analytic, '
+                               'without --validate or --out-cs-length')
+        print_mp(threads, args)
+        return
+    if args.out_cs_length > 0:
+        if args.engine == 'vector' or args.validate:
+            raise RuntimeError('--out-cs-length needs --engine event or analytic, without --validate')
+        print_pipeline(threads, args)
+        return
+    if args.telemetry is not None and (args.engine != 'array' or args.validate):
+        raise RuntimeError('--telemetry needs --engine array, without --validate')
+    if args.validate:
+        validate(threads, args)
+        return
+    io = storage_model(args) is not None
+    print("nthreads\tp_time\tcs_time\twait_time\tpt_thruput\tpt_thruput2" + ("\tlock_util\tio_share" if io else ""))
     ideal_thru = float(args.until) / (args.p_length + args.cs_length_sd)
     ideal_thru2 = float(args.until - args.serial_length) / (args.p_length + args.cs_length_sd)
-    for n in map(int, args.threads.rstrip(',').split(',')):
-        def norm_cs():
-            return max(numpy.random.normal(args.cs_length, args.cs_length_sd), args.cs_length_min)
-        def norm_p():
-            return max(numpy.random.normal(args.p_length, args.p_length_sd), args.p_length_min)
-        sim = Simulation(n,
-                         (lambda: args.cs_length) if (args.cs_length_sd == 0) else norm_cs,
-                         (lambda: args.p_length) if (args.p_length_sd == 0) else norm_p,
-                         args.serial_length)
-        for _ in sim.step(stop_after=args.until):
-            pass
-        print("%d\t%0.3f\t%0.3f\t%0.3f\t%0.3f\t%0.3f" % (n, sim.p_time, sim.cs_time, sim.wait_time,
-                                                         sim.p_time/(n*ideal_thru), sim.p_time/(n*ideal_thru2)))
+    for n, (p_time, cs_time, wait_time) in zip(threads, run(threads, args, args.engine)):
+        row = "%d\t%0.3f\t%0.3f\t%0.3f\t%0.3f\t%0.3f" % (n, p_time, cs_time, wait_time,
+                                                        p_time/(n*ideal_thru), p_time/(n*ideal_thru2))
+        if io:
+            # lock_util near 1 with a large io_share means input-bound
+            row += "\t%0.4f\t%0.4f" % (cs_time / (args.until - args.serial_length), io_share(args))
+        print(row)
 
 if __name__ == '__main__':
-    import sys
     import unittest
 
     class TestSimulation(unittest.TestCase):
@@ -165,13 +587,380 @@ if __name__ == '__main__':
             self.assertEqual((10, 30, 1), ls[0])
             self.assertEqual((40, 50, 0), ls[1])
 
+        def test_mutex(self):
+            # as test_sim2, but each hand-off takes 5
+            sim = Simulation(2, lambda: 10, lambda: 10, lock=locks.MutexLock(5))
+            ls = [x for x in sim.step(45)]
+            self.assertEqual(2, len(ls))
+            self.assertEqual((10, 25, 1), ls[0])
+            self.assertEqual((30, 40, 0), ls[1])
+
+        def test_queue_cost_grows(self):
+            # more threads, more expensive hand-offs, less critical-section
+            # work done in the same time
+            cs_times = []
+            for n in [4, 8]:
+                sim = Simulation(n, lambda: 10, lambda: 1, lock=locks.QueueLock(1, 1))
+                for _ in sim.step(10000):
+                    pass
+                cs_times.append(sim.cs_time)
+            self.assertGreater(cs_times[0], cs_times[1])
+
+        def test_spin_total(self):
+            # with free hand-offs the order doesn't change how busy the lock is
+            numpy.random.seed(0)
+            totals = []
+            for lock in [locks.FifoLock(), locks.SpinLock()]:
+                sim = Simulation(5, lambda: 10, lambda: 10, lock=lock)
+                for _ in sim.step(10000):
+                    pass
+                totals.append((sim.p_time, sim.cs_time))
+            self.assertEqual(totals[0], totals[1])
+
+    class TestPipeline(unittest.TestCase):
+
+        def test_single_lock(self):
+            # one parallel phase and one lock is just Simulation
+            stats = []
+            for pipe in [False, True]:
+                numpy.random.seed(1)
+                cs, p = norm_func(0.05, 0.02, 0.01), norm_func(1.0, 0.2, 0.2)
+                if pipe:
+                    sim = pipeline.PipelineSimulation(30, [(p, None), (cs, 'in')], {'in': locks.FifoLock()}, 5)
+                    sim.run(500)
+                    stats.append((sim.p_time, sim.cs_time['in'], sim.wait_time['in']))
+                else:
+                    sim = Simulation(30, cs, p, 5)
+                    for _ in sim.step(500):
+                        pass
+                    stats.append((sim.p_time, sim.cs_time, sim.wait_time))
+            self.assertEqual(stats[0], stats[1])
+
+        def test_two_locks(self):
+            # both threads finish aligning at 10; thread 1 waits 5 for the
+            # output lock, after which the two are staggered
+            sim = pipeline.PipelineSimulation(2, [(lambda: 10, None), (lambda: 5, 'out'), (lambda: 5, 'in')],
+                                              {'in': locks.FifoLock(), 'out': locks.FifoLock()})
+            sim.run(40)
+            self.assertEqual(5, sim.wait_time['out'])
+            self.assertEqual(0, sim.wait_time['in'])
+            self.assertEqual(4, sim.ncs['out'])
+
+        def test_batched_output(self):
+            # writing per read takes the output lock once per read
+            phases = pipeline.io_phases(lambda: 1.0, lambda: 10.0, lambda: 2.0, 4, batch_output=False)
+            self.assertEqual(9, len(phases))
+            self.assertEqual(['out'] * 4, [l for _, l in phases if l == 'out'])
+            phases = pipeline.io_phases(lambda: 1.0, lambda: 10.0, lambda: 2.0, 4, out_overhead=1.0, batch_output=True)
+            self.assertEqual([40.0, 9.0, 4.0], [f() for f, _ in phases])
+
+        def test_matches_analytic(self):
+            # the busier output lock saturates first in both
+            numpy.random.seed(0)
+            phases = [(norm_func(1.0, 0.2, 0.2), None), (norm_func(0.02, 0.005, 0.005), 'out'),
+                      (norm_func(0.01, 0.002, 0.002), 'in')]
+            stations = [(0.01, 0.04, 1), (0.02, 0.0625, 1)]
+            for n in [10, 40, 80]:
+                sim = pipeline.PipelineSimulation(n, phases, {'in': locks.FifoLock(), 'out': locks.FifoLock()}, 10)
+                sim.run(1010)
+                ana = mva.solve_network(n, stations, 1.0)[-1]
+                self.assertAlmostEqual(ana['lock_util'][0], sim.cs_time['in'] / 1000, delta=0.02)
+                self.assertAlmostEqual(ana['lock_util'][1], sim.cs_time['out'] / 1000, delta=0.02)
+
+    class TestMultiProcess(unittest.TestCase):
+
+        def test_one_process(self):
+            # one process without slowdown is just Simulation
+            stats = []
+            for mp in [False, True]:
+                numpy.random.seed(2)
+                cs, p = norm_func(0.05, 0.02, 0.01), norm_func(1.0, 0.2, 0.2)
+                if mp:
+                    sim = mp_sim.MultiProcessSimulation(1, 30, cs, p, [5], locks.FifoLock)
+                    sim.run(500)
+                    stats.append((sim.p_time, sim.cs_time[0], sim.wait_time[0]))
+                else:
+                    sim = Simulation(30, cs, p, 5)
+                    for _ in sim.step(500):
+                        pass
+                    stats.append((sim.p_time, sim.cs_time, sim.wait_time))
+            self.assertEqual(stats[0], stats[1])
+
+        def test_independent_locks(self):
+            # 2 processes of 2 threads: each like test_sim2, separately
+            sim = mp_sim.MultiProcessSimulation(2, 2, lambda: 10, lambda: 10, [0, 0], locks.FifoLock)
+            sim.run(25)
+            self.assertEqual([10, 10], sim.wait_time)
+
+        def test_slowdown(self):
+            # 4 threads starting at once, 2 at full speed: the 3rd and 4th
+            # phases take 1.5x and 2x as long
+            sim = mp_sim.MultiProcessSimulation(1, 4, lambda: 0.0, lambda: 10.0, [0],
+                                                locks.FifoLock, mp_sim.linear_slowdown(2, 0.5))
+            sim.run(20)
+            self.assertEqual(10 + 10 + 15 + 20, sim.p_time)
+
+        def test_mp_beats_mt(self):
+            # with a saturated lock, 4 processes of 16 beat 1 of 64, unless
+            # their index loads take much longer
+            res = [mp_sim.solve(p, 64 // p, 0.05, 1.0, 0.0) for p in [1, 4]]
+            self.assertGreater(4 * res[1]['parallel'], 2 * res[0]['parallel'])
+            self.assertEqual([400, 400], mp_sim.serial_lengths(2, 100, load_contention=3.0))
+            self.assertEqual([100, 100], mp_sim.serial_lengths(2, 100, mm=True))
+
+        def test_load_outlasts_until(self):
+            # every process is still loading at --until: zero times and NaN
+            # ratios, not negative times or a ZeroDivisionError
+            import subprocess
+            for engine in ['analytic', 'event']:
+                out = subprocess.check_output([sys.executable, __file__, '--threads', '16,32', '--mp-mt', '16',
+                                               '--serial-length', '2000', '--until', '1000', '--engine', engine,
+                                               '--seed', '0'], stderr=subprocess.STDOUT).decode()
+                rows = [ln.split('\t') for ln in out.strip().split('\n')[1:]]
+                self.assertEqual(2, len(rows))
+                for row in rows:
+                    self.assertEqual([0.0] * 3, list(map(float, row[2:5])))
+                    self.assertEqual(['nan', 'nan'], [row[6], row[8]])
+
+        def test_analytic_slowdown(self):
+            numpy.random.seed(0)
+            slow = mp_sim.linear_slowdown(16, 0.02)
+            sim = mp_sim.MultiProcessSimulation(4, 16, norm_func(0.01, 0.002, 0.002), norm_func(1.0, 0.2, 0.2),
+                                                [10] * 4, locks.FifoLock, slow)
+            sim.run(1010)
+            ana = mp_sim.solve(4, 16, 0.01, 1.0, 0.04, slow)
+            self.assertAlmostEqual(4 * ana['parallel'], sim.p_time / 1000, delta=0.02 * sim.p_time / 1000)
+
+    class TestArrayCore(unittest.TestCase):
+
+        def test_matches_event(self):
+            # with fixed durations and hand-offs, same totals and waits as
+            # Simulation
+            cases = [(1, 10, 100, 10000, 0, 0), (3, 10, 20, 10000, 0, 0), (2, 20, 10, 51, 0, 0),
+                     (5, 3, 7, 1000, 5, 0), (7, 0.5, 1, 997, 100, 0), (2, 10, 10, 45, 0, 5), (9, 1, 3, 500, 0, 0.25)]
+            for n, cs, p, until, initial_time, handoff in cases:
+                sim = Simulation(n, lambda: cs, lambda: p, initial_time, lock=locks.FifoLock(handoff))
+                waits = [x for x in sim.step(until)]
+                arr = event_core.ArraySimulation(n, vec_sim.constant_sampler(cs), vec_sim.constant_sampler(p),
+                                                 initial_time, handoff_cost=handoff, wait_records=10000)
+                arr.run(until)
+                for expected, actual in [(sim.p_time, arr.p_time), (sim.cs_time, arr.cs_time),
+                                         (sim.wait_time, arr.wait_time)]:
+                    self.assertAlmostEqual(expected, actual, places=6)
+                self.assertEqual(sorted(waits), sorted(map(tuple, arr.wait_log().tolist())))
+
+        def test_ring_buffer(self):
+            # only the last 3 waits are kept, oldest first
+            sim = Simulation(5, lambda: 3, lambda: 7, 5)
+            waits = [x for x in sim.step(1000)]
+            arr = event_core.ArraySimulation(5, vec_sim.constant_sampler(3), vec_sim.constant_sampler(7), 5,
+                                             wait_records=3)
+            arr.run(1000)
+            self.assertEqual(len(waits), arr.nwaits)
+            self.assertEqual(waits[-3:], list(map(tuple, arr.wait_log().tolist())))
+            self.assertEqual(arr.cs_time, arr.thread_cs_time.sum())
+
+    class TestTelemetry(unittest.TestCase):
+
+        def test_buckets(self):
+            # 3 threads, CS 10, P 20 (test_sim3): waits of 10 and 20 at time
+            # 20, then the three critical sections run back to back forever
+            tel = telemetry.Telemetry(3, 10, 60)
+            arr = event_core.ArraySimulation(3, vec_sim.constant_sampler(10), vec_sim.constant_sampler(20),
+                                             telemetry=tel)
+            arr.run(60)
+            cols = tel.columns()
+            self.assertEqual([0, 0, 1, 1, 1, 1], cols['lock_util'].tolist())
+            # critical sections end at 30, 40, 50 and 60; the last bucket
+            # includes until
+            self.assertEqual([0, 0, 0, 1, 1, 2], cols['completed'].tolist())
+            # 2 waiting during [20, 30), 1 during [30, 40)
+            self.assertEqual([0, 0, 2, 1, 0, 0], cols['queue_mean'].tolist())
+            self.assertEqual([0, 0, 2, 1, 0, 0], cols['queue_max'].tolist())
+            self.assertEqual([0, 0, 1, 1, 0, 0], cols['wait_max'].tolist())
+            self.assertEqual([0, 0, 1, 0, 0, 0], cols['wait_p50'].tolist())
+
+        def test_totals(self):
+            # buckets add up to the run's totals
+            tel = telemetry.Telemetry(40, 7, 500)
+            arr = event_core.ArraySimulation(40, vec_sim.normal_sampler(0.05, 0.01, 0.01),
+                                             vec_sim.normal_sampler(1, 0.2, 0.2), 20, numpy.random.RandomState(0),
+                                             telemetry=tel)
+            arr.run(500)
+            cols = tel.columns()
+            widths = numpy.minimum(cols['bucket_start'] + 7, 500) - cols['bucket_start']
+            self.assertEqual(arr.ncs.sum(), cols['completed'].sum())
+            # time spent waiting, by thread or by queue length
+            self.assertAlmostEqual(numpy.sum(tel.waiting), (cols['queue_mean'] * widths).sum(), places=6)
+            self.assertLess(abs(arr.wait_time - numpy.sum(tel.waiting)), 0.01 * arr.wait_time)
+            self.assertTrue(numpy.allclose(cols['queue_hist'].sum(axis=1), 1.0))
+
+    class TestEmpirical(unittest.TestCase):
+
+        def test_alias(self):
+            rng = numpy.random.RandomState(0)
+            xs = empirical.AliasTable([1, 0, 3, 6]).sample(rng, (200000,))
+            freqs = numpy.bincount(xs, minlength=4) / 200000.0
+            self.assertTrue(numpy.allclose([0.1, 0.0, 0.3, 0.6], freqs, atol=0.005))
+
+        def test_moments(self):
+            rng = numpy.random.RandomState(0)
+            for samp in [empirical.EmpiricalSampler([1.0, 2.0, 10.0], [5, 3, 1]),
+                         empirical.EmpiricalSampler([0.0, 1.0, 4.0], [2, 1, 1], [1.0, 3.0, 6.0])]:
+                xs = samp(rng, (500000,))
+                self.assertAlmostEqual(samp.mean, xs.mean(), places=1)
+                self.assertAlmostEqual(samp.var / xs.var(), 1.0, places=1)
+
+        def test_trace_finishes(self):
+            # 2 threads, 5 reads of alignment time 10, 10, 10, 10, 50; each
+            # read's critical section takes 1.  Thread 1 waits 1 for the lock
+            # at time 10; thread 0 takes the last, long read at 21 and
+            # finishes long after thread 1 finds the input empty at 22
+            sim = Simulation(2, lambda: 1.0, empirical.Trace([10, 10, 10, 10, 50]), nreads=5)
+            for _ in sim.step():
+                pass
+            self.assertEqual([72, 22], sim.finish)
+            self.assertEqual(90, sim.p_time)
+            self.assertEqual(3, sim.cs_time)
+            self.assertEqual(1, sim.wait_time)
+
+    class TestStorage(unittest.TestCase):
+
+        def test_moments(self):
+            # requests take 0.5 + 100 * 2 / 1000 = 0.7; 250 bytes cross 2 or
+            # 3 readahead boundaries
+            dev = storage.Storage(0.5, 1000.0, 100.0, clients=2)
+            xs = dev.sampler(250)(numpy.random.RandomState(0), (200000,))
+            self.assertEqual([1.4, 2.1], sorted(set(numpy.round(xs, 6).tolist())))
+            mean, var = dev.moments(250)
+            self.assertAlmostEqual(1.75, mean)
+            self.assertAlmostEqual(mean, xs.mean(), places=2)
+            self.assertAlmostEqual(var, xs.var(), places=2)
+
+        def test_stall_in_cs(self):
+            # 200 bytes is two requests of 1 + 100 / 100 = 2, so each
+            # critical section takes 1 + 4
+            dev = storage.Storage(1.0, 100.0, 100.0)
+            sim = Simulation(1, storage.add_len_func(lambda: 1.0, dev.len_func(200)), lambda: 10.0)
+            for _ in sim.step(30):
+                pass
+            self.assertEqual(10, sim.cs_time)
+
+        def test_latency_favors_blocks(self):
+            # without readahead every critical section pays the latency, so
+            # bigger batches pay off at fewer threads
+            dev = storage.Storage(0.05, 1e6, 0)
+            plain = batching.recommend([16], [1, 2, 4, 8, 16, 32, 64], 0.01, 0.0, 1.0)
+            io = batching.recommend([16], [1, 2, 4, 8, 16, 32, 64], 0.01, 0.0, 1.0,
+                                    stall=lambda b: dev.moments(b * 250))
+            self.assertGreater(io[0][1], plain[0][1])
+
+    class TestBatching(unittest.TestCase):
+
+        def test_batch_lengths(self):
+            cs, p = batching.batch_len_funcs(lambda: 1.0, lambda: 10.0, 4, overhead=2.0)
+            self.assertEqual((6.0, 40.0), (cs(), p()))
+            cs, p = batching.batch_len_funcs(lambda: 1.0, lambda: 10.0, 4, overhead=2.0, light=True, copy_length=0.25)
+            self.assertEqual((3.0, 44.0), (cs(), p()))
+
+        def test_samplers_match_moments(self):
+            cs, p = batching.batch_samplers(vec_sim.normal_sampler(1.0, 0.5, 0.0), vec_sim.constant_sampler(10.0),
+                                            8, overhead=3.0)
+            rng = numpy.random.RandomState(0)
+            xs = cs(rng, (100000,))
+            mean, var, p_mean = batching.batch_moments(*(mva.clamped_normal_moments(1.0, 0.5, 0.0) + (10.0, 8)),
+                                                       overhead=3.0)
+            self.assertAlmostEqual(mean, xs.mean(), places=1)
+            self.assertAlmostEqual(var, xs.var(), places=1)
+            self.assertEqual(p_mean, p(rng, (3,))[0])
+
+        def test_recommend(self):
+            # with a big per-lock overhead, contended thread counts want
+            # bigger batches; with little input, imbalance argues for smaller
+            rows = batching.recommend([1, 64], [1, 2, 4, 8, 16, 32, 64], 0.01, 0.0, 1.0, overhead=0.05)
+            self.assertLess(rows[0][1], rows[1][1])
+            few = batching.recommend([64], [1, 2, 4, 8, 16, 32, 64], 0.01, 0.0, 1.0, overhead=0.05,
+                                     total_reads=2000)
+            self.assertLess(few[0][1], rows[1][1])
+
+    class TestVectorSimulation(unittest.TestCase):
+
+        def _event(self, n, cs, p, until, initial_time=0.0):
+            sim = Simulation(n, lambda: cs, lambda: p, initial_time)
+            for _ in sim.step(until):
+                pass
+            return sim.p_time, sim.cs_time, sim.wait_time
+
+        def test_matches_event(self):
+            # with fixed durations the two engines should agree exactly,
+            # whatever else is in the same batch
+            cases = [(1, 10, 100, 10000, 0), (2, 10, 10, 10000, 0), (3, 10, 20, 10000, 0),
+                     (2, 20, 10, 51, 0), (5, 3, 7, 1000, 5), (50, 1, 10, 3000, 0), (7, 0.5, 1, 997, 100)]
+            for n, cs, p, until, initial_time in cases:
+                res = vec_sim.simulate([1, n, 2 * n], vec_sim.constant_sampler(cs), vec_sim.constant_sampler(p),
+                                       until, initial_time)
+                for k, expected in zip(['p_time', 'cs_time', 'wait_time'], self._event(n, cs, p, until, initial_time)):
+                    self.assertAlmostEqual(expected, res[k][1], places=6)
+
+        def test_random(self):
+            # mean times over replicas should be within a few SEs of the
+            # event-driven simulation's
+            numpy.random.seed(0)
+            evs = []
+            for _ in range(20):
+                sim = Simulation(40, lambda: max(numpy.random.normal(0.02, 0.005), 0.005),
+                                 lambda: max(numpy.random.normal(1, 0.2), 0.2), 10)
+                for _ in sim.step(200):
+                    pass
+                evs.append(sim.wait_time)
+            res = vec_sim.simulate([40] * 100, vec_sim.normal_sampler(0.02, 0.005, 0.005),
+                                   vec_sim.normal_sampler(1, 0.2, 0.2), 200, 10, numpy.random.RandomState(0))
+            se = numpy.sqrt(numpy.var(evs) / len(evs) + res['wait_time'].var() / 100)
+            self.assertLess(abs(numpy.mean(evs) - res['wait_time'].mean()), 4 * se)
+
+    class TestAnalytic(unittest.TestCase):
+
+        def test_one_thread(self):
+            # never waits; cycles take S + Z
+            res = mva.solve(1, 2.0, 8.0)
+            self.assertAlmostEqual(0.1, res[0]['throughput'])
+            self.assertAlmostEqual(0.2, res[0]['lock_util'])
+            self.assertAlmostEqual(0.0, res[0]['wait'])
+
+        def test_saturated(self):
+            # with many threads the lock is always busy and the rest wait
+            res = mva.solve(1000, 1.0, 10.0, 0.0)
+            self.assertAlmostEqual(1.0, res[-1]['lock_util'])
+            self.assertAlmostEqual(1000 - 1 - 10, res[-1]['waiting'])
+
+        def test_throughputs(self):
+            # vectorized throughput agrees with solve cell by cell
+            thru = mva.throughputs(50, [0.01, 0.05], [1.0, 2.0], 0.5)
+            for j, (cs, p) in enumerate([(0.01, 1.0), (0.05, 2.0)]):
+                self.assertTrue(numpy.allclose([r['throughput'] for r in mva.solve(50, cs, p, 0.5)], thru[:, j]))
+
+        def test_clamped_moments(self):
+            rng = numpy.random.RandomState(0)
+            xs = numpy.maximum(rng.normal(1.0, 0.5, 1000000), 0.8)
+            mean, var = mva.clamped_normal_moments(1.0, 0.5, 0.8)
+            self.assertAlmostEqual(xs.mean(), mean, places=2)
+            self.assertAlmostEqual(xs.var(), var, places=2)
+
+        def test_matches_simulation(self):
+            cs, p, span = 0.01, 1.0, 1900
+            res = vec_sim.simulate([16, 64, 100], vec_sim.normal_sampler(cs, 0.002, 0.002),
+                                   vec_sim.normal_sampler(p, 0.2, 0.2), 2000, 100, numpy.random.RandomState(0))
+            ana = mva.solve(100, cs, p, 0.04)
+            for i, n in enumerate([16, 64, 100]):
+                self.assertAlmostEqual(ana[n-1]['lock_util'], res['cs_time'][i] / span, delta=0.01)
 
     if '--test' in sys.argv:
         unittest.main(argv=[sys.argv[0]])
 
     else:
 
-        parser = argparse.ArgumentParser(description='Set up critical-section thread scaling experiments.')
+        parser = argparse.ArgumentParser(description='Set up critical-section thread scaling experiments.',
+                                         fromfile_prefix_chars='@')
 
         parser.add_argument('--threads', metavar='int,int,...', type=str, required=True,
                             help='Series of comma-separated ints giving the number of threads to simulate.')
@@ -191,5 +980,90 @@ if __name__ == '__main__':
                             help='Minimium length of parallel-code block.')
         parser.add_argument('--until', type=float, default=10000.0,
                             help='Run simulation until we reach this time point.')
+        parser.add_argument('--cs-dist', metavar='path', type=str,
+                            help='Draw critical section lengths from this empirical distribution (.npy/.npz; '
+                                 'see empirical.py) instead of --cs-length etc.')
+        parser.add_argument('--p-dist', metavar='path', type=str,
+                            help='Draw parallel section lengths from this empirical distribution instead of '
+                                 '--p-length etc.')
+        parser.add_argument('--p-trace', metavar='path', type=str,
+                            help='Replay per-read parallel section lengths from this .npy, in order, until they '
+                                 'run out; reports when threads finish instead of --until statistics.')
+        parser.add_argument('--engine', type=str, choices=['event', 'vector', 'array', 'analytic'], default='event',
+                            help='Event-by-event simulation, vectorized simulation of all thread counts at once, '
+                                 'compact event core for long runs, or analytical queueing model.')
+        parser.add_argument('--lock', type=str, choices=locks.LOCKS, default='fifo',
+                            help='Lock discipline; see locks.py.')
+        parser.add_argument('--handoff-cost', type=float, default=0.001,
+                            help='Time to hand the lock to the next holder (spin, backoff, queue).')
+        parser.add_argument('--handoff-cost-per-thread', type=float, default=0.0001,
+                            help='Extra hand-off time per spinning thread (spin) or per thread (queue).')
+        parser.add_argument('--wake-latency', type=float, default=0.005,
+                            help='Time to wake a sleeping waiter (mutex).')
+        parser.add_argument('--backoff-min', type=float, default=0.0005,
+                            help='Smallest backoff window (backoff).')
+        parser.add_argument('--backoff-max', type=float, default=0.02,
+                            help='Largest backoff window (backoff).')
+        parser.add_argument('--reads-per-batch', type=int, default=1,
+                            help='# reads a thread takes per critical section.')
+        parser.add_argument('--batch-overhead', type=float, default=0.0,
+                            help='Fixed cost of a critical section, on top of per-read costs.')
+        parser.add_argument('--light-parsing', action='store_const', const=True, default=False,
+                            help='Critical section only copies --copy-length per read; parsing '
+                                 '(--cs-length) moves to the parallel section.')
+        parser.add_argument('--copy-length', type=float, default=0.0005,
+                            help='Per-read cost of copying a block in the critical section with --light-parsing.')
+        parser.add_argument('--read-bytes', type=float, default=250.0,
+                            help='Bytes of input per read, for --io-*.')
+        parser.add_argument('--io-latency', type=float, default=0.0,
+                            help='Latency of each input read request.')
+        parser.add_argument('--io-bandwidth', type=float, default=0.0,
+                            help='Sustained input bandwidth in bytes per unit time; 0 for input already in memory. '
+                                 'See storage.py.')
+        parser.add_argument('--io-readahead', type=float, default=1048576.0,
+                            help='Bytes fetched per input read request; 0 for one request per critical section.')
+        parser.add_argument('--io-clients', type=int, default=1,
+                            help='# clients sharing --io-bandwidth; with --mp-mt, per process.')
+        parser.add_argument('--out-cs-length', type=float, default=0.0,
+                            help='Average time required by output critical section per read; 0 for no output lock.')
+        parser.add_argument('--out-cs-length-sd', type=float, default=0.0,
+                            help='Standard deviation for output critical section.')
+        parser.add_argument('--out-cs-length-min', type=float, default=0.0,
+                            help='Minimium length of output critical section.')
+        parser.add_argument('--out-lock', type=str, choices=locks.LOCKS, default='fifo',
+                            help='Lock discipline for the output lock.')
+        parser.add_argument('--batch-output', action='store_const', const=True, default=False,
+                            help='Write a whole batch\'s output in one output critical section.')
+        parser.add_argument('--out-batch-overhead', type=float, default=0.0,
+                            help='Fixed cost of an output critical section, on top of per-read costs.')
+        parser.add_argument('--mp-mt', type=int, default=0,
+                            help='# threads per process, as in master.py; 0 for one process.')
+        parser.add_argument('--mm', action='store_const', const=True, default=False,
+                            help='With --mp-mt, processes share one memory-mapped index, loaded once.')
+        parser.add_argument('--load-contention', type=float, default=1.0,
+                            help='Without --mm, each other process adds this fraction of --serial-length '
+                                 'to every process\'s index load.')
+        parser.add_argument('--bw-threads', type=int, default=0,
+                            help='# threads in parallel phases the memory system serves at full speed.')
+        parser.add_argument('--bw-slowdown', type=float, default=0.0,
+                            help='Parallel phases take this fraction longer per active thread beyond --bw-threads.')
+        parser.add_argument('--recommend-batch', metavar='int,int,...', type=str,
+                            help='Recommend one of these --reads-per-batch for each thread count, '
+                                 'using the analytical model.')
+        parser.add_argument('--total-reads', type=int,
+                            help='With --recommend-batch, account for imbalance when this many reads run out.')
+        parser.add_argument('--tolerance', type=float, default=0.01,
+                            help='With --recommend-batch, take the smallest batch within this fraction of the best.')
+        parser.add_argument('--validate', action='store_const', const=True, default=False,
+                            help='Compare the analytical model with simulation (--engine event, else vector).')
+        parser.add_argument('--telemetry', metavar='path', type=str,
+                            help='With --engine array, write per-bucket lock utilization, queue lengths, waits and '
+                                 'completions for each thread count and replica to this .npz or CSV.')
+        parser.add_argument('--bucket', type=float, default=10.0,
+                            help='Width of --telemetry time buckets.')
+        parser.add_argument('--replicas', type=int, default=1,
+                            help='Average times over this many independent simulations per thread count.')
+        parser.add_argument('--seed', type=int,
+                            help='Seed for pseudo-random generator.')
 
         go(parser.parse_args())
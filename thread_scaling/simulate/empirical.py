@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+"""
+Empirical duration distributions and traces for cs_sim.py, in place of its
+clamped normals.  Real per-read alignment times are heavy-tailed (repetitive
+reads take far longer), and the tail is what makes threads finish unevenly.
+
+A distribution file is one of:
+
+- .npy, 1-D: raw durations, each equally likely
+- .npy, 2-D with 2 columns: (duration, weight) pairs
+- .npz with arrays "edges" (k+1) and "counts" (k): a histogram; a bin is
+  picked by count and the duration is uniform within it
+
+Samplers draw with Walker's alias method, so drawing is O(1) per value and
+vectorizes; they can be used as vec_sim samplers or, via len_func, by the
+event-driven engines.  A trace is a 1-D .npy of per-read durations in input
+order, replayed by the event engine until it runs out (see Simulation's
+nreads).
+"""
+
+from __future__ import print_function
+import numpy
+
+
+class AliasTable(object):
+    """ Draws index i with probability proportional to weights[i] (Vose's method) """
+
+    def __init__(self, weights):
+        p = numpy.asarray(weights, dtype=numpy.float64)
+        if len(p) == 0 or p.min() < 0 or p.sum() <= 0:
+            raise RuntimeError('Weights must be non-negative and not all zero')
+        n = len(p)
+        p = p * n / p.sum()
+        self.prob = numpy.ones(n)
+        self.alias = numpy.arange(n)
+        small = [i for i in range(n) if p[i] < 1.0]
+        large = [i for i in range(n) if p[i] >= 1.0]
+        while len(small) > 0 and len(large) > 0:
+            s, l = small.pop(), large.pop()
+            self.prob[s], self.alias[s] = p[s], l
+            p[l] += p[s] - 1.0
+            (small if p[l] < 1.0 else large).append(l)
+
+    def sample(self, rng, shape):
+        i = rng.randint(0, len(self.prob), size=shape)
+        return numpy.where(rng.uniform(size=shape) < self.prob[i], i, self.alias[i])
+
+
+class EmpiricalSampler(object):
+    """
+    Durations values[i] (+ uniform in [0, widths[i]) for histograms) with
+    probability proportional to weights[i].  sampler(rng, shape) as in
+    vec_sim; mean and var are exact.
+    """
+
+    def __init__(self, values, weights=None, widths=None):
+        self.values = numpy.asarray(values, dtype=numpy.float64)
+        weights = numpy.ones(len(self.values)) if weights is None else numpy.asarray(weights, dtype=numpy.float64)
+        self.widths = None if widths is None else numpy.asarray(widths, dtype=numpy.float64)
+        self.table = AliasTable(weights)
+        w = weights / weights.sum()
+        mid = self.values if widths is None else self.values + self.widths / 2.0
+        second = mid * mid if widths is None else mid * mid + self.widths * self.widths / 12.0
+        self.mean = float((w * mid).sum())
+        self.var = max(float((w * second).sum()) - self.mean * self.mean, 0.0)
+
+    def __call__(self, rng, shape):
+        i = self.table.sample(rng, shape)
+        if self.widths is None:
+            return self.values[i]
+        return self.values[i] + rng.uniform(size=shape) * self.widths[i]
+
+
+def load_dist(fn):
+    """ EmpiricalSampler from a distribution file, as described above """
+    if fn.endswith('.npz'):
+        dat = numpy.load(fn)
+        edges, counts = dat['edges'], dat['counts']
+        if len(edges) != len(counts) + 1:
+            raise RuntimeError('"%s" should have one more edge than counts' % fn)
+        return EmpiricalSampler(edges[:-1], counts, numpy.diff(edges))
+    arr = numpy.load(fn)
+    if arr.ndim == 1:
+        return EmpiricalSampler(arr)
+    if arr.ndim == 2 and arr.shape[1] == 2:
+        return EmpiricalSampler(arr[:, 0], arr[:, 1])
+    raise RuntimeError('Expected 1-D durations or 2-column (duration, weight) array in "%s"' % fn)
+
+
+def len_func(sampler):
+    """ Length function for Simulation, drawing from numpy.random """
+    def draw():
+        return float(sampler(numpy.random, ()))
+    return draw
+
+
+class Trace(object):
+    """ Length function replaying recorded durations in order """
+
+    def __init__(self, durations):
+        self.durations = numpy.asarray(durations, dtype=numpy.float64)
+        self.i = 0
+
+    def __len__(self):
+        return len(self.durations)
+
+    def __call__(self):
+        if self.i >= len(self.durations):
+            raise RuntimeError('Trace of %d durations ran out' % len(self.durations))
+        self.i += 1
+        return float(self.durations[self.i - 1])
+
+
+def load_trace(fn):
+    arr = numpy.load(fn)
+    if arr.ndim != 1:
+        raise RuntimeError('Expected 1-D array of per-read durations in "%s"' % fn)
+    return Trace(arr)
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+
+"""
+Compact event-driven core for long simulations of the model in cs_sim.py.
+With a FIFO lock whose hand-off takes a fixed time h, a thread arriving at
+the lock at time t gets it at
+
+    start = t             if the lock is free at t
+            free + h      otherwise, where free is when it's next released
+
+and releases it at start + cs.  So arrivals at the lock, taken in time
+order, are the only events: the heap holds one (time of next arrival,
+thread) pair per thread, replaced in place as each is processed, and there
+are no per-event critical-section or wait records.  Durations are drawn in
+blocks of `block` with vec_sim-style samplers.
+
+Statistics match Simulation.step(stop_after=until): a parallel or critical
+section counts if it ends by until, a wait counts if the lock is released to
+the waiter by until.  Only the totals are kept unless wait_records > 0, in
+which case the last wait_records (wait start, lock start, thread) records are
+kept in a ring buffer, and per-bucket telemetry is kept if given a
+telemetry.Telemetry.  Per-thread # critical sections and critical/parallel
+times are kept in preallocated arrays.
+
+Under CPython 3 this handles about 0.7 million critical sections (1.4
+million of Simulation's events) per second, so 10^8 events take about a
+minute, vs. a few minutes and far more memory churn for Simulation.
+"""
+
+from __future__ import print_function
+import heapq
+import numpy
+
+
+class Draws(object):
+    """ Durations from a vec_sim-style sampler, drawn block at a time """
+
+    def __init__(self, sampler, rng, block):
+        self.sampler, self.rng, self.block = sampler, rng, block
+        self.refill()
+
+    def refill(self):
+        self.buf = self.sampler(self.rng, (self.block,)).tolist()
+        self.i = 0
+
+
+class ArraySimulation(object):
+
+    def __init__(self, nthreads, cs_sampler, p_sampler, initial_time=0.0, rng=None, handoff_cost=0.0,
+                 block=65536, wait_records=0, telemetry=None):
+        self.N = nthreads
+        self.rng = numpy.random.RandomState() if rng is None else rng
+        self.cs = Draws(cs_sampler, self.rng, block)
+        self.p = Draws(p_sampler, self.rng, block)
+        self.handoff_cost = handoff_cost
+        # optional telemetry.Telemetry, told about every arrival at the lock
+        self.telemetry = telemetry
+        self.p_time = 0.0
+        self.cs_time = 0.0
+        self.wait_time = 0.0
+        self.ncs = numpy.zeros(nthreads, dtype=numpy.int64)
+        self.thread_cs_time = numpy.zeros(nthreads)
+        self.thread_p_time = numpy.zeros(nthreads)
+        # ring buffer of (wait start, lock start, thread)
+        self.wait_records = wait_records
+        self.waits = numpy.zeros((wait_records, 3))
+        self.nwaits = 0
+        p = self.p_draws(nthreads)
+        # (time thread arrives at the lock, thread, length of the parallel
+        # section it's finishing)
+        self.heap = [(initial_time + p[i], i, p[i]) for i in range(nthreads)]
+        heapq.heapify(self.heap)
+        # when the lock is next released
+        self.free = float('-inf')
+
+    def p_draws(self, n):
+        res = []
+        for _ in range(n):
+            if self.p.i == len(self.p.buf):
+                self.p.refill()
+            res.append(self.p.buf[self.p.i])
+            self.p.i += 1
+        return res
+
+    def run(self, stop_after=float('inf')):
+        """ Process arrivals at the lock up to stop_after; call once """
+        heap, cs, p = self.heap, self.cs, self.p
+        handoff = self.handoff_cost
+        free = self.free
+        p_time = cs_time = wait_time = 0.0
+        ncs = [0] * self.N
+        thread_cs = [0.0] * self.N
+        thread_p = [0.0] * self.N
+        record = self.wait_records > 0
+        tel = self.telemetry
+        heapreplace = heapq.heapreplace
+        # draw buffers and positions are kept in locals in the loop
+        cs_buf, cs_i, cs_n = cs.buf, cs.i, len(cs.buf)
+        p_buf, p_i, p_n = p.buf, p.i, len(p.buf)
+        while True:
+            t, thread, p_len = heap[0]
+            if t > stop_after:
+                break
+            p_time += p_len
+            thread_p[thread] += p_len
+            if t < free:
+                # waits until the lock is released, then for the hand-off
+                start = free + handoff
+                if free <= stop_after:
+                    wait_time += start - t
+                    if record:
+                        self.record_wait(t, start, thread)
+            else:
+                start = t
+            if cs_i == cs_n:
+                cs.refill()
+                cs_buf, cs_i = cs.buf, 0
+            cs_len = cs_buf[cs_i]
+            cs_i += 1
+            free = start + cs_len
+            if tel is not None:
+                tel.arrival(t, start, free, thread)
+            if free <= stop_after:
+                cs_time += cs_len
+                ncs[thread] += 1
+                thread_cs[thread] += cs_len
+            if p_i == p_n:
+                p.refill()
+                p_buf, p_i = p.buf, 0
+            nxt = p_buf[p_i]
+            p_i += 1
+            heapreplace(heap, (free + nxt, thread, nxt))
+        cs.i, p.i = cs_i, p_i
+        if tel is not None:
+            tel.finish()
+        self.free = free
+        self.p_time += p_time
+        self.cs_time += cs_time
+        self.wait_time += wait_time
+        self.ncs += ncs
+        self.thread_cs_time += thread_cs
+        self.thread_p_time += thread_p
+
+    def record_wait(self, wait_start, start, thread):
+        self.waits[self.nwaits % self.wait_records] = (wait_start, start, thread)
+        self.nwaits += 1
+
+    def wait_log(self):
+        """ Recorded waits, oldest first """
+        if self.nwaits <= self.wait_records:
+            return self.waits[:self.nwaits]
+        i = self.nwaits % self.wait_records
+        return numpy.concatenate([self.waits[i:], self.waits[:i]])
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+"""
+Lock disciplines for Simulation in cs_sim.py.  A lock decides which waiting
+thread gets the lock when it's released, and how long the hand-off takes.
+Hand-off time is spent by the next holder waiting, and by nobody in the
+critical section.  Roughly corresponding to the locks in the experiments:
+
+fifo     Strict FIFO hand-off at no cost; the idealized lock of the
+         original simulator
+spin     Unfair spin lock (e.g. TinyThread++ fast_mutex): a random spinner
+         wins, and every spinner hammering the lock's cache line slows the
+         hand-off down
+backoff  Spin lock with exponential backoff (e.g. TBB spin_mutex): waiters
+         check the lock less and less often the longer they've waited, so
+         the lock can sit free until the next check
+mutex    Blocking mutex (e.g. TBB mutex): waiters sleep, roughly FIFO, and
+         the next one has to be woken up
+queue    Queuing lock (e.g. TBB queuing_mutex): FIFO, with a hand-off cost
+         that grows with the # threads, as the lock's cache lines travel
+         further on a bigger machine
+
+Times are in the same units as the critical and parallel section lengths.
+"""
+
+from __future__ import print_function
+from collections import deque
+import numpy
+
+
+LOCKS = ['fifo', 'spin', 'backoff', 'mutex', 'queue']
+
+
+class FifoLock(object):
+    """ Waiters get the lock in the order they arrived """
+
+    def __init__(self, handoff_cost=0.0):
+        self.handoff_cost = handoff_cost
+        self.waiting = deque()
+
+    def __len__(self):
+        return len(self.waiting)
+
+    def wait(self, thread, time):
+        self.waiting.appendleft((thread, time))
+
+    def handoff(self, time, nthreads):
+        """
+        The lock is released at time; returns (thread, time it started
+        waiting, hand-off time) for the next holder, or None if none waiting
+        """
+        if len(self.waiting) == 0:
+            return None
+        thread, wait_time = self.waiting.pop()
+        return thread, wait_time, self.handoff_cost
+
+
+class SpinLock(FifoLock):
+    """ A random spinner wins; hand-off slows with the # spinners """
+
+    def __init__(self, handoff_cost=0.0, per_waiter_cost=0.0):
+        super(SpinLock, self).__init__(handoff_cost)
+        self.per_waiter_cost = per_waiter_cost
+        self.waiting = []
+
+    def wait(self, thread, time):
+        self.waiting.append((thread, time))
+
+    def handoff(self, time, nthreads):
+        if len(self.waiting) == 0:
+            return None
+        cost = self.handoff_cost + self.per_waiter_cost * len(self.waiting)
+        i = numpy.random.randint(len(self.waiting))
+        self.waiting[i], self.waiting[-1] = self.waiting[-1], self.waiting[i]
+        thread, wait_time = self.waiting.pop()
+        return thread, wait_time, cost
+
+
+class BackoffLock(SpinLock):
+    """
+    Each waiter checks the lock at random within a backoff window that
+    doubles after every failed check, from backoff_min up to backoff_max.
+    After waiting w, its window is about w.  The first to check after the
+    release gets the lock.
+    """
+
+    def __init__(self, handoff_cost=0.0, backoff_min=0.0, backoff_max=0.0):
+        super(BackoffLock, self).__init__(handoff_cost)
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+
+    def handoff(self, time, nthreads):
+        if len(self.waiting) == 0:
+            return None
+        waited = time - numpy.array([w for _, w in self.waiting])
+        windows = numpy.minimum(numpy.maximum(waited, self.backoff_min), self.backoff_max)
+        checks = numpy.random.uniform(0.0, 1.0, len(windows)) * windows
+        i = int(checks.argmin())
+        self.waiting[i], self.waiting[-1] = self.waiting[-1], self.waiting[i]
+        thread, wait_time = self.waiting.pop()
+        return thread, wait_time, self.handoff_cost + checks[i]
+
+
+class MutexLock(FifoLock):
+    """ FIFO, but the next holder has to be woken up """
+
+    def __init__(self, wake_latency=0.0):
+        super(MutexLock, self).__init__(wake_latency)
+
+
+class QueueLock(FifoLock):
+    """ FIFO, with a hand-off cost that grows with the # threads """
+
+    def __init__(self, handoff_cost=0.0, per_thread_cost=0.0):
+        super(QueueLock, self).__init__(handoff_cost)
+        self.per_thread_cost = per_thread_cost
+
+    def handoff(self, time, nthreads):
+        nxt = super(QueueLock, self).handoff(time, nthreads)
+        if nxt is None:
+            return None
+        thread, wait_time, cost = nxt
+        return thread, wait_time, cost + self.per_thread_cost * nthreads
+
+
+def make_lock(name, handoff_cost=0.0, per_thread_cost=0.0, wake_latency=0.0, backoff_min=0.0, backoff_max=0.0):
+    """ Lock of the given kind; parameters that don't apply are ignored """
+    if name == 'fifo':
+        return FifoLock()
+    if name == 'spin':
+        return SpinLock(handoff_cost, per_thread_cost)
+    if name == 'backoff':
+        return BackoffLock(handoff_cost, backoff_min, backoff_max)
+    if name == 'mutex':
+        return MutexLock(wake_latency)
+    if name == 'queue':
+        return QueueLock(handoff_cost, per_thread_cost)
+    raise RuntimeError('Unknown lock type: "%s"' % name)
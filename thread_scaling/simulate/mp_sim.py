@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+"""
+Simulation of MP+MT runs, as in master.py with mp_mt > 0: P processes of T
+threads each.  Every process has its own input lock, but all processes share
+the machine's memory bandwidth and filesystem:
+
+- A parallel phase is stretched by slowdown(a), where a is the # threads
+  (over all processes) in their parallel phases when it starts, itself
+  included.  Phases already running aren't stretched after the fact.
+- Each process first loads the index (--serial-length).  Without --mm the P
+  loads compete for the filesystem, and each takes serial_length * (1 +
+  load_contention * (P - 1)).  With --mm the index is memory-mapped and
+  shared, so it's loaded once.
+
+With P = 1 and no slowdown this is exactly Simulation in cs_sim.py.
+"""
+
+from __future__ import print_function
+import heapq
+import mva
+
+
+def linear_slowdown(bw_threads, bw_slowdown):
+    """ Parallel phases take 1 + bw_slowdown per active thread beyond bw_threads times as long """
+    def slowdown(active):
+        return 1.0 + bw_slowdown * max(0, active - bw_threads)
+    return slowdown
+
+
+def serial_lengths(nprocess, serial_length, mm=False, load_contention=1.0):
+    """ Time at which each process finishes loading the index """
+    if mm:
+        return [serial_length] * nprocess
+    return [serial_length * (1.0 + load_contention * (nprocess - 1))] * nprocess
+
+
+class MultiProcessSimulation(object):
+
+    def __init__(self, nprocess, nthreads, cs_len_func, p_len_func, initial_times, make_lock, slowdown=None):
+        """
+        nthreads per process; initial_times gives each process's serial
+        length; make_lock() makes one process's lock
+        """
+        self.P, self.T = nprocess, nthreads
+        self.cs_len_func = cs_len_func
+        self.p_len_func = p_len_func
+        self.slowdown = slowdown
+        self.locks = [make_lock() for _ in range(nprocess)]
+        self.in_cs = [None] * nprocess
+        self.active = 0
+        self.coming_up = []
+        for i in range(nprocess * nthreads):
+            heapq.heappush(self.coming_up, (initial_times[i // nthreads], 'S', i, 0.0))
+        self.p_time = 0.0
+        self.cs_time = [0.0] * nprocess
+        self.wait_time = [0.0] * nprocess
+
+    def _parallel(self, thread, time):
+        self.active += 1
+        elapsed = self.p_len_func()
+        if self.slowdown is not None:
+            elapsed *= self.slowdown(self.active)
+        heapq.heappush(self.coming_up, (time + elapsed, 'P', thread, elapsed))
+
+    def _critical(self, thread, time):
+        self.in_cs[thread // self.T] = thread
+        elapsed = self.cs_len_func()
+        heapq.heappush(self.coming_up, (time + elapsed, 'C', thread, elapsed))
+
+    def run(self, stop_after=float('inf')):
+        while len(self.coming_up) > 0:
+            new_time, old_state, thread, elapsed = heapq.heappop(self.coming_up)
+            if new_time > stop_after:
+                return
+            proc = thread // self.T
+            if old_state == 'S':
+                self._parallel(thread, new_time)
+            elif old_state == 'P':
+                self.p_time += elapsed
+                self.active -= 1
+                if self.in_cs[proc] is not None:
+                    self.locks[proc].wait(thread, new_time)
+                else:
+                    self._critical(thread, new_time)
+            elif old_state == 'C':
+                self.cs_time[proc] += elapsed
+                nxt = self.locks[proc].handoff(new_time, self.T)
+                if nxt is not None:
+                    wait_thread, wait_time, handoff = nxt
+                    self.wait_time[proc] += new_time + handoff - wait_time
+                    self._critical(wait_thread, new_time + handoff)
+                else:
+                    self.in_cs[proc] = None
+                self._parallel(thread, new_time)
+            else:
+                raise RuntimeError('Bad old state: ' + old_state)
+
+
+def solve(nprocess, nthreads, cs_mean, p_mean, cs_cv2=1.0, slowdown=None, iters=100):
+    """
+    Analytical counterpart: each process is the queue in mva.py, with the
+    parallel section stretched by slowdown at the mean # active threads,
+    found by fixed-point iteration.  Returns mva.solve's dict for one
+    process of nthreads threads, plus the slowdown factor.
+    """
+    factor = 1.0
+    for _ in range(iters if slowdown is not None else 1):
+        res = mva.solve(nthreads, cs_mean, p_mean * factor, cs_cv2)[-1]
+        if slowdown is None:
+            break
+        new_factor = slowdown(nprocess * res['parallel'])
+        if abs(new_factor - factor) < 1e-9:
+            break
+        factor = 0.5 * (factor + new_factor)
+    res['slowdown'] = factor
+    return res
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+"""
+Analytical model of the simulation in cs_sim.py.  N threads alternating
+between a parallel section (mean length Z) and a critical section protected
+by a single FIFO lock (mean length S) make up the machine-repairman, or
+closed M/G/1//N, queue.  Mean-value analysis (MVA) gives its throughput, lock
+utilization and waiting time for n = 1, 2, ..., N in O(N) time.
+
+MVA is exact when critical-section lengths are exponential.  For other
+distributions we use the usual approximation that a thread arriving while
+the lock is held waits for the residual of the section in progress,
+S * (1 + cv^2) / 2, rather than a whole S; with cv^2 = 1 this is exact MVA.
+Parallel-section lengths only enter through their mean.  Throughput is
+capped at the lock's capacity, 1/S.  solve_network handles several locks in
+turn (see pipeline.py), treating each as its own queue.
+"""
+
+from __future__ import print_function
+import math
+import numpy
+
+
+def clamped_normal_moments(mean, sd, minimum):
+    """ Mean and variance of max(X, minimum) for X ~ Normal(mean, sd), as drawn by cs_sim.py """
+    if sd == 0:
+        return max(mean, minimum), 0.0
+    a = (minimum - mean) / sd
+    cdf = 0.5 * (1.0 + math.erf(a / math.sqrt(2.0)))
+    pdf = math.exp(-0.5 * a * a) / math.sqrt(2.0 * math.pi)
+    m1 = minimum * cdf + mean * (1.0 - cdf) + sd * pdf
+    m2 = minimum * minimum * cdf + mean * mean * (1.0 - cdf) + 2.0 * mean * sd * pdf + \
+        sd * sd * (1.0 - cdf + a * pdf)
+    return m1, max(m2 - m1 * m1, 0.0)
+
+
+def solve_network(nmax, stations, p_mean):
+    """
+    MVA for 1..nmax threads cycling through a parallel section and one or
+    more critical sections, each under its own FIFO lock.  stations is a
+    list of (mean, cv^2, visits) per lock, visits being the # critical
+    sections under that lock per cycle.  Returns a list whose element n-1 is
+    a dict for n threads: throughput (cycles per unit time), parallel, and
+    per-lock lists of lock_util, wait (per critical section) and waiting.
+    Throughput is capped at the busiest lock's capacity.
+    """
+    res = []
+    queue = [0.0] * len(stations)
+    util = [0.0] * len(stations)
+    demand = [s * v for s, _, v in stations]
+    bottleneck = demand.index(max(demand))
+    for n in range(1, nmax + 1):
+        # per cycle: own critical sections, plus those of threads already
+        # waiting, plus the rest of the one in progress
+        resp = [v * (s + s * (q - u) + u * s * (1.0 + cv2) / 2.0)
+                for (s, cv2, v), q, u in zip(stations, queue, util)]
+        thru = n / (sum(resp) + p_mean)
+        if thru * demand[bottleneck] > 1.0:
+            thru = 1.0 / demand[bottleneck]
+            resp[bottleneck] = n * demand[bottleneck] - p_mean - \
+                sum(r for i, r in enumerate(resp) if i != bottleneck)
+        queue = [thru * r for r in resp]
+        util = [thru * d for d in demand]
+        waits = [r / v - s for r, (s, _, v) in zip(resp, stations)]
+        res.append({'throughput': thru, 'lock_util': util, 'wait': waits,
+                    'waiting': [thru * v * w for w, (_, _, v) in zip(waits, stations)],
+                    'parallel': thru * p_mean})
+    return res
+
+
+def solve(nmax, cs_mean, p_mean, cs_cv2=1.0):
+    """
+    MVA for 1..nmax threads.  Returns a list whose element n-1 is a dict for
+    n threads: throughput (critical sections per unit time), lock_util,
+    wait (mean time waiting per critical section), waiting (mean # threads
+    waiting) and parallel (mean # threads in the parallel section).
+    """
+    res = []
+    for r in solve_network(nmax, [(cs_mean, cs_cv2, 1)], p_mean):
+        res.append(dict((k, v[0] if isinstance(v, list) else v) for k, v in r.items()))
+    return res
+
+
+def throughputs(nmax, cs_mean, p_mean, cs_cv2=1.0):
+    """
+    As solve, but just the throughput, for arrays of parameters at once.
+    Returns an array whose element n-1 has the throughputs for n threads.
+    """
+    cs_mean, p_mean, cs_cv2 = [numpy.asarray(x, dtype=numpy.float64) for x in (cs_mean, p_mean, cs_cv2)]
+    queue = numpy.zeros(numpy.broadcast(cs_mean, p_mean, cs_cv2).shape)
+    util = numpy.zeros_like(queue)
+    res = []
+    for n in range(1, nmax + 1):
+        resp = cs_mean + cs_mean * (queue - util) + util * cs_mean * (1.0 + cs_cv2) / 2.0
+        thru = n / (resp + p_mean)
+        sat = thru * cs_mean > 1.0
+        thru = numpy.where(sat, 1.0 / cs_mean, thru)
+        resp = numpy.where(sat, n * cs_mean - p_mean, resp)
+        queue, util = thru * resp, thru * cs_mean
+        res.append(thru)
+    return numpy.array(res)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+
+"""
+Simulation of threads that each cycle through a sequence of phases, each
+either parallel or a critical section under one of several locks.  E.g.
+aligner threads take an input lock to parse reads, align them in parallel,
+then take an output lock to write SAM.  A lock can guard more than one phase
+(e.g. writing each read of a batch separately).  Simulation in cs_sim.py is
+the special case of one parallel phase and one lock.
+
+Statistics are kept per lock, accumulated like Simulation.step: a phase
+counts if it ends by stop_after, a wait counts if the waiting thread gets the
+lock by stop_after.
+
+--engine analytic uses mva.solve_network, which treats each lock as an
+independent queue.  Lock utilizations, and so the bottleneck, come out close
+to simulated ones, but waiting at a lock taken straight after another (e.g.
+input after output) is overestimated: the first lock spaces those arrivals
+out.
+"""
+
+from __future__ import print_function
+import heapq
+import batching
+
+
+class PipelineSimulation(object):
+
+    def __init__(self, nthreads, phases, locks, initial_time=0.0):
+        """
+        phases is a list of (length function, lock name or None for a
+        parallel phase); all threads start at the beginning of phase 0.
+        locks maps lock names to lock objects (see locks.py).
+        """
+        self.N = nthreads
+        self.phases = phases
+        self.locks = locks
+        self.holder = dict((name, None) for name in locks)
+        self.coming_up = []
+        self.p_time = 0.0
+        self.cs_time = dict((name, 0.0) for name in locks)
+        self.wait_time = dict((name, 0.0) for name in locks)
+        self.ncs = dict((name, 0) for name in locks)
+        self.phase = [0] * nthreads
+        for i in range(nthreads):
+            self._enter(i, 0, initial_time)
+
+    def _start(self, thread, k, time):
+        len_func, lock = self.phases[k]
+        elapsed = len_func()
+        # as in Simulation, critical sections that end at the same time as
+        # parallel phases are handled first
+        heapq.heappush(self.coming_up, (time + elapsed, 1 if lock is None else 0, thread, k, elapsed))
+
+    def _enter(self, thread, k, time):
+        self.phase[thread] = k
+        lock = self.phases[k][1]
+        if lock is not None:
+            if self.holder[lock] is not None:
+                self.locks[lock].wait(thread, time)
+                return
+            self.holder[lock] = thread
+        self._start(thread, k, time)
+
+    def run(self, stop_after=float('inf')):
+        while len(self.coming_up) > 0:
+            time, _, thread, k, elapsed = heapq.heappop(self.coming_up)
+            if time > stop_after:
+                return
+            lock = self.phases[k][1]
+            if lock is None:
+                self.p_time += elapsed
+            else:
+                self.cs_time[lock] += elapsed
+                self.ncs[lock] += 1
+                nxt = self.locks[lock].handoff(time, self.N)
+                if nxt is None:
+                    self.holder[lock] = None
+                else:
+                    wait_thread, wait_time, handoff = nxt
+                    self.wait_time[lock] += time + handoff - wait_time
+                    self.holder[lock] = wait_thread
+                    self._start(wait_thread, self.phase[wait_thread], time + handoff)
+            self._enter(thread, (k + 1) % len(self.phases), time)
+
+    def to_stats(self):
+        """ p_time, then per-lock dicts of cs_time, wait_time and # critical sections """
+        return self.p_time, self.cs_time, self.wait_time, self.ncs
+
+
+def io_phases(in_cs_func, p_func, out_cs_func, batch_size=1, overhead=0.0, out_overhead=0.0,
+              batch_output=False, light=False, copy_length=0.0):
+    """
+    Phases of an aligner thread: align a batch of reads (see batching.py),
+    writing each read's output under the 'out' lock, or the whole batch's at
+    once with batch_output, then take the 'in' lock for the next batch
+    """
+    in_cs, p_batch = batching.batch_len_funcs(in_cs_func, p_func, batch_size, overhead, light, copy_length)
+    if batch_output:
+        def out_cs():
+            return out_overhead + sum(out_cs_func() for _ in range(batch_size))
+        return [(p_batch, None), (out_cs, 'out'), (in_cs, 'in')]
+    p_read = batching.batch_len_funcs(in_cs_func, p_func, 1, 0.0, light, copy_length)[1]
+    def out_cs():
+        return out_overhead + out_cs_func()
+    return [(p_read, None), (out_cs, 'out')] * batch_size + [(in_cs, 'in')]
+
+
+def io_stations(in_mean, in_var, p_mean, out_mean, out_var, batch_size=1, overhead=0.0, out_overhead=0.0,
+                batch_output=False, light=False, copy_length=0.0):
+    """ (stations, parallel mean) for mva.solve_network, matching io_phases; stations are in, out """
+    in_b, in_var_b, p_b = batching.batch_moments(in_mean, in_var, p_mean, batch_size, overhead, light, copy_length)
+    if batch_output:
+        out_b, out_var_b, visits = out_overhead + batch_size * out_mean, batch_size * out_var, 1
+    else:
+        out_b, out_var_b, visits = out_overhead + out_mean, out_var, batch_size
+
+    def cv2(mean, var):
+        return var / (mean * mean) if mean > 0 else 0.0
+    return [(in_b, cv2(in_b, in_var_b), 1), (out_b, cv2(out_b, out_var_b), visits)], p_b
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+"""
+Input storage model for cs_sim.py.  By default the input critical section is
+pure CPU: parsing (or, with L-parsing, copying) reads that are already in
+memory.  On a parallel filesystem like Lustre the thread holding the input
+lock can instead be blocked on the device, and everyone queued behind it
+waits too.
+
+The input is read sequentially in readahead-sized requests.  A request takes
+the device's latency plus the time to transfer readahead bytes at its
+sustained bandwidth, shared with any other clients reading at the same time
+(other processes, other nodes):
+
+    request_time = latency + readahead * clients / bandwidth
+
+A critical section consuming nbytes of input waits for every request whose
+boundary it crosses: floor(nbytes / readahead) of them, plus one more with
+probability equal to the fractional part, depending on where in the
+readahead window it starts.  With readahead 0 there is no readahead: each
+critical section makes one request for exactly its nbytes, so larger
+batches (blocks) amortize the latency.  Read stalls are drawn independently
+for each critical section, so they work with every engine, and are added to
+the parse cost.
+"""
+
+from __future__ import print_function
+import math
+import numpy
+
+
+class Storage(object):
+
+    def __init__(self, latency, bandwidth, readahead, clients=1):
+        if bandwidth <= 0 or readahead < 0:
+            raise RuntimeError('Storage bandwidth must be positive and readahead non-negative')
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.readahead = readahead
+        self.clients = clients
+
+    def request_time(self, nbytes=None):
+        """ Time for one request of nbytes, by default readahead bytes """
+        nbytes = self.readahead if nbytes is None else nbytes
+        return self.latency + float(nbytes) * self.clients / self.bandwidth
+
+    def requests(self, nbytes):
+        """ Mean # requests to read nbytes, and time per request """
+        if self.readahead == 0:
+            return 1.0, self.request_time(nbytes)
+        return float(nbytes) / self.readahead, self.request_time()
+
+    def sampler(self, nbytes):
+        """ vec_sim sampler of the time spent reading nbytes """
+        x, req = self.requests(nbytes)
+        whole, frac = divmod(x, 1.0)
+
+        def sample(rng, shape):
+            return (whole + (rng.uniform(size=shape) < frac)) * req
+        return sample
+
+    def len_func(self, nbytes):
+        """ Length function for Simulation, drawing from numpy.random """
+        sample = self.sampler(nbytes)
+
+        def draw():
+            return float(sample(numpy.random, ()))
+        return draw
+
+    def moments(self, nbytes):
+        """ Mean and variance of the time spent reading nbytes """
+        x, req = self.requests(nbytes)
+        frac = x - math.floor(x)
+        return x * req, frac * (1.0 - frac) * req * req
+
+
+def add_len_func(cs_func, stall_func):
+    """ Critical section length function plus a read stall """
+    def cs():
+        return cs_func() + stall_func()
+    return cs
+
+
+def add_sampler(cs_sampler, stall_sampler):
+    def cs(rng, shape):
+        return cs_sampler(rng, shape) + stall_sampler(rng, shape)
+    return cs
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+
+"""
+Runs the critical-section simulation (vectorized, see vec_sim.py) over a grid
+of parameters: every combination of the comma-separated --cs-length,
+--cs-length-sd, --p-length and --p-length-sd values is a cell, and each cell
+is simulated at every --threads count with --replicas independent replicas.
+Cells run in parallel in a pool of processes.  Each cell's random numbers
+come from its own generator seeded with --seed and a hash of the cell's
+parameter values, so results don't depend on --processes or on what else is
+in the grid.
+
+Output is one row per cell and thread count with the mean of each statistic
+over replicas and a 95% confidence interval (t distribution).  lock_util is
+the fraction of the post-serial time the lock was held; as it approaches 1
+the critical section is the bottleneck.  Written as CSV, or Parquet if the
+output file ends in .parquet (needs pandas).
+
+E.g.:
+    python sweep.py --threads 2,4,8,16,32,64,68,128,136,192,204,256,272 \
+        --cs-length 0.005,0.01,0.02 --p-length 0.5,1 --replicas 16 --output sweep.csv
+"""
+
+from __future__ import print_function
+import sys
+import struct
+import zlib
+import itertools
+import multiprocessing
+import numpy
+import vec_sim
+
+try:
+    import pandas
+except ImportError:
+    pandas = None
+
+
+PARAMS = ['cs_length', 'cs_length_sd', 'p_length', 'p_length_sd']
+
+STATS = ['p_time', 'cs_time', 'wait_time', 'pt_thruput', 'lock_util']
+
+# two-sided 95% t quantiles for 1-30 degrees of freedom
+_T95 = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+        2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+        2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
+
+
+def t95(df):
+    if df < 1:
+        return float('nan')
+    if df <= len(_T95):
+        return _T95[df - 1]
+    return 2.0 if df <= 60 else (1.98 if df <= 120 else 1.96)
+
+
+def mean_ci(xs):
+    """ Mean and 95% confidence interval """
+    xs = numpy.asarray(xs, dtype=numpy.float64)
+    mean = xs.mean()
+    if len(xs) < 2:
+        return mean, float('nan'), float('nan')
+    half = t95(len(xs) - 1) * xs.std(ddof=1) / numpy.sqrt(len(xs))
+    return mean, mean - half, mean + half
+
+
+def parse_list(st, typ=float):
+    return [typ(x) for x in st.rstrip(',').split(',')]
+
+
+def header():
+    return PARAMS + ['nthreads', 'replicas'] + [s + sfx for s in STATS for sfx in ['', '_lo', '_hi']]
+
+
+def cell_seed(params):
+    """ Seed for a cell from its parameter values alone """
+    return zlib.crc32(struct.pack('<%dd' % len(params), *params)) & 0xffffffff
+
+
+def run_cell(job):
+    """ Simulate one cell at all thread counts; returns its rows """
+    params, args = job
+    cs_length, cs_length_sd, p_length, p_length_sd = params
+    rng = numpy.random.RandomState([args.seed, cell_seed(params)])
+    res = vec_sim.simulate(numpy.repeat(args.threads, args.replicas),
+                           vec_sim.normal_sampler(cs_length, cs_length_sd, args.cs_length_min),
+                           vec_sim.normal_sampler(p_length, p_length_sd, args.p_length_min),
+                           args.until, args.serial_length, rng)
+    # same normalization as cs_sim.py's pt_thruput
+    ideal_thru = float(args.until) / (p_length + cs_length_sd)
+    rows = []
+    for i, n in enumerate(args.threads):
+        sl = slice(i * args.replicas, (i + 1) * args.replicas)
+        stats = {'p_time': res['p_time'][sl],
+                 'cs_time': res['cs_time'][sl],
+                 'wait_time': res['wait_time'][sl],
+                 'pt_thruput': res['p_time'][sl] / (n * ideal_thru),
+                 'lock_util': res['cs_time'][sl] / (args.until - args.serial_length)}
+        row = list(params) + [n, args.replicas]
+        for st in STATS:
+            row.extend(mean_ci(stats[st]))
+        rows.append(row)
+    return rows
+
+
+def write_table(rows, fn):
+    cols = header()
+    if fn is not None and fn.endswith('.parquet'):
+        if pandas is None:
+            raise RuntimeError('Writing Parquet requires pandas')
+        pandas.DataFrame(rows, columns=cols).to_parquet(fn, index=False)
+        return
+    ofh = sys.stdout if fn is None else open(fn, 'w')
+    print(','.join(cols), file=ofh)
+    for row in rows:
+        print(','.join(map(str, row)), file=ofh)
+    if fn is not None:
+        ofh.close()
+
+
+def go(args):
+    args.threads = parse_list(args.threads, int)
+    grid = list(itertools.product(*[parse_list(getattr(args, p)) for p in PARAMS]))
+    jobs = [(params, args) for params in grid]
+    print('Simulating %d cells x %d thread counts x %d replicas' %
+          (len(grid), len(args.threads), args.replicas), file=sys.stderr)
+    rows = []
+    if args.processes > 1 and len(jobs) > 1:
+        pool = multiprocessing.Pool(min(args.processes, len(jobs)))
+        results = pool.imap(run_cell, jobs)
+    else:
+        pool, results = None, map(run_cell, jobs)
+    for i, cell_rows in enumerate(results):
+        print('  finished cell %d of %d' % (i + 1, len(jobs)), file=sys.stderr)
+        rows.extend(cell_rows)
+    if pool is not None:
+        pool.close()
+        pool.join()
+    write_table(rows, args.output)
+
+
+if __name__ == '__main__':
+
+    import argparse
+    parser = argparse.ArgumentParser(description='Simulate critical-section thread scaling over a grid of parameters.')
+
+    parser.add_argument('--threads', metavar='int,int,...', type=str, required=True,
+                        help='Comma-separated numbers of threads to simulate in every cell.')
+    parser.add_argument('--cs-length', metavar='float,...', type=str, default='0.01',
+                        help='Comma-separated average critical section lengths.')
+    parser.add_argument('--cs-length-sd', metavar='float,...', type=str, default='0.002',
+                        help='Comma-separated critical section length standard deviations.')
+    parser.add_argument('--p-length', metavar='float,...', type=str, default='1.0',
+                        help='Comma-separated average parallel section lengths.')
+    parser.add_argument('--p-length-sd', metavar='float,...', type=str, default='0.2',
+                        help='Comma-separated parallel section length standard deviations.')
+    parser.add_argument('--cs-length-min', type=float, default=0.002,
+                        help='Minimium length of critical section block.')
+    parser.add_argument('--p-length-min', type=float, default=0.2,
+                        help='Minimium length of parallel-code block.')
+    parser.add_argument('--serial-length', type=float, default=100.0,
+                        help='Time taken by serial portion at the beginning of program.')
+    parser.add_argument('--until', type=float, default=10000.0,
+                        help='Run simulation until we reach this time point.')
+    parser.add_argument('--replicas', type=int, default=10,
+                        help='# independent simulations per cell and thread count.')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed; each cell also uses a hash of its parameter values.')
+    parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count(),
+                        help='# cells to simulate at once.')
+    parser.add_argument('--output', metavar='path', type=str,
+                        help='CSV (or .parquet) output file; default: CSV to stdout.')
+
+    go(parser.parse_args())
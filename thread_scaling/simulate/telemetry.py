@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+
+"""
+Time-bucketed telemetry from a simulation, for overlaying on time series
+from real runs (top, iostat, sampled profiles).  The simulation reports each
+arrival at the lock as it's processed -- arrival time, time it got the lock,
+time it released it, thread -- and only per-bucket aggregates are kept:
+
+lock_util          fraction of the bucket the lock was held
+completed          # critical sections (work items taken) ending in the bucket
+queue_mean/p50/p90/max
+                   time-weighted distribution of the # threads waiting
+wait_p50/p90/max   fraction of the bucket a thread spent waiting, across
+                   threads
+
+Buckets start at time 0, so the serial section shows up as idle buckets at
+the start.  Written as .npz (with the full queue-length histogram per bucket)
+or CSV.
+"""
+
+from __future__ import print_function
+from collections import deque
+import numpy
+
+COLUMNS = ['nthreads', 'bucket_start', 'lock_util', 'completed', 'queue_mean', 'queue_p50', 'queue_p90',
+           'queue_max', 'wait_p50', 'wait_p90', 'wait_max']
+
+
+class Telemetry(object):
+
+    def __init__(self, nthreads, bucket, until):
+        self.N = nthreads
+        self.bucket = bucket
+        self.until = until
+        self.nbuckets = int(numpy.ceil(float(until) / bucket))
+        self.busy = [0.0] * self.nbuckets
+        self.completed = [0] * self.nbuckets
+        self.waiting = [[0.0] * nthreads for _ in range(self.nbuckets)]
+        self.queue = [[0.0] * nthreads for _ in range(self.nbuckets)]
+        # sweep over changes in queue length: clock, current length and
+        # times at which queued threads get the lock (increasing, as FIFO)
+        self.clock = 0.0
+        self.qlen = 0
+        self.pending = deque()
+
+    def spread(self, row_of, a, b):
+        """ Add the parts of [a, b) in each bucket, clipped to until, via row_of(bucket, amount) """
+        b = min(b, self.until)
+        w = self.bucket
+        while a < b:
+            i = int(a / w)
+            end = min((i + 1) * w, b)
+            row_of(i, end - a)
+            a = end
+
+    def advance(self, time):
+        qlen = self.qlen
+
+        def add(i, amount):
+            self.queue[i][qlen] += amount
+        self.spread(add, self.clock, time)
+        self.clock = max(self.clock, time)
+
+    def arrival(self, time, start, end, thread):
+        """ thread arrived at the lock at time, held it from start to end """
+        pending = self.pending
+        while len(pending) > 0 and pending[0] <= time:
+            self.advance(pending.popleft())
+            self.qlen -= 1
+        self.advance(time)
+        if start > time:
+            self.qlen += 1
+            pending.append(start)
+
+            def add(i, amount):
+                self.waiting[i][thread] += amount
+            self.spread(add, time, start)
+
+        def add_busy(i, amount):
+            self.busy[i] += amount
+        self.spread(add_busy, start, end)
+        if end <= self.until:
+            self.completed[min(int(end / self.bucket), self.nbuckets - 1)] += 1
+
+    def finish(self):
+        while len(self.pending) > 0 and self.pending[0] <= self.until:
+            self.advance(self.pending.popleft())
+            self.qlen -= 1
+        self.advance(self.until)
+
+    def columns(self):
+        """ Dict of per-bucket arrays, named as in COLUMNS, plus queue_hist """
+        starts = numpy.arange(self.nbuckets) * self.bucket
+        widths = numpy.minimum(starts + self.bucket, self.until) - starts
+        queue = numpy.array(self.queue)
+        cum = numpy.cumsum(queue, axis=1) / widths[:, None]
+
+        def queue_pct(q):
+            return (cum < q - 1e-12).sum(axis=1)
+        waiting = numpy.array(self.waiting) / widths[:, None]
+        wait_pct = numpy.percentile(waiting, [50, 90, 100], axis=1)
+        return {'nthreads': numpy.full(self.nbuckets, self.N, dtype=numpy.int64),
+                'bucket_start': starts,
+                'lock_util': numpy.array(self.busy) / widths,
+                'completed': numpy.array(self.completed, dtype=numpy.int64),
+                'queue_mean': (queue * numpy.arange(self.N)).sum(axis=1) / widths,
+                'queue_p50': queue_pct(0.5),
+                'queue_p90': queue_pct(0.9),
+                'queue_max': numpy.array([numpy.flatnonzero(r > 0).max() if r.any() else 0 for r in queue]),
+                'wait_p50': wait_pct[0],
+                'wait_p90': wait_pct[1],
+                'wait_max': wait_pct[2],
+                'queue_hist': queue / widths[:, None]}
+
+
+def write(fn, tables):
+    """ Write the columns of several Telemetry objects, one after another """
+    cols = [t.columns() for t in tables]
+    if fn.endswith('.npz'):
+        width = max(c['queue_hist'].shape[1] for c in cols)
+        out = dict((k, numpy.concatenate([c[k] for c in cols])) for k in COLUMNS)
+        out['queue_hist'] = numpy.concatenate([numpy.pad(c['queue_hist'], ((0, 0), (0, width - c['queue_hist'].shape[1])),
+                                                         'constant') for c in cols])
+        numpy.savez_compressed(fn, **out)
+        return
+    with open(fn, 'w') as ofh:
+        print(','.join(COLUMNS), file=ofh)
+        for c in cols:
+            for row in zip(*[c[k] for k in COLUMNS]):
+                print(','.join(map(str, row)), file=ofh)
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+
+"""
+Vectorized version of the simulation in cs_sim.py: many independent replicas
+(each with its own # threads) are simulated at once with numpy array
+operations, and random durations are drawn in large batches.
+
+Rather than popping one event at a time off a heap, each step takes every
+thread's next attempt to enter the critical section, sorted by time, and
+works out when each would get through the (FIFO) lock using the recurrence
+
+    end[k] = max(end[k-1], arrive[k]) + cs[k]
+
+which is a cumulative max over arrive[k] - (cs[0] + ... + cs[k-1]).  A thread
+that leaves the critical section comes back cs_end + p later, and might then
+arrive ahead of some of the sorted attempts, so we only commit the prefix of
+attempts that come before any such return.  That prefix is usually a large
+fraction of the threads, so the number of steps is about the number of
+critical sections per thread rather than the total.
+
+Statistics are accumulated like Simulation.step(stop_after=until): a parallel
+or critical section counts if it ends by `until`, a wait counts if the
+waiting thread gets the lock by `until`.
+"""
+
+from __future__ import print_function
+import numpy as np
+
+
+def constant_sampler(value):
+    def sample(rng, shape):
+        return np.full(shape, value, dtype=np.float64)
+    return sample
+
+
+def normal_sampler(mean, sd, minimum):
+    """ Normal durations, clamped from below as in cs_sim.py """
+    if sd == 0:
+        return constant_sampler(mean)
+
+    def sample(rng, shape):
+        return np.maximum(rng.normal(mean, sd, shape), minimum)
+    return sample
+
+
+class DrawBuffer(object):
+    """
+    Pre-drawn durations for each of nrep replicas.  take(w) gives the next w
+    for every replica; advance(n) consumes the first n[r] of replica r's.
+    Draws that aren't consumed are handed out again next time.  That doesn't
+    bias anything, since whether a draw gets used never depends on its value.
+    """
+
+    def __init__(self, sampler, rng, nrep, size):
+        self.sampler = sampler
+        self.rng = rng
+        self.rows = np.arange(nrep)[:, None]
+        self.size = size
+        self.buf = sampler(rng, (nrep, size))
+        self.ptr = np.zeros(nrep, dtype=np.int64)
+
+    def take(self, w):
+        if self.ptr.max() + w > self.size:
+            # shift what's left to the front and replace what was consumed
+            cols = np.arange(self.size)
+            self.buf = self.buf[self.rows, (cols + self.ptr[:, None]) % self.size]
+            used = cols >= self.size - self.ptr[:, None]
+            self.buf[used] = self.sampler(self.rng, (int(self.ptr.sum()),))
+            self.ptr[:] = 0
+        return self.buf[self.rows, self.ptr[:, None] + np.arange(w)]
+
+    def advance(self, n):
+        self.ptr += n
+
+
+def simulate_group(nthreads, cs_sampler, p_sampler, until, initial_time=0.0, rng=None, batch=64):
+    """
+    Simulate one replica per element of nthreads.  Returns a dict of arrays,
+    one element per replica: p_time, cs_time, wait_time and ncs (# critical
+    sections completed).  Durations are drawn about batch per thread at a
+    time.
+    """
+    if rng is None:
+        rng = np.random.RandomState()
+    nthreads = np.asarray(nthreads, dtype=np.int64)
+    nrep, nmax = len(nthreads), int(nthreads.max())
+    rows = np.arange(nrep)
+    cols = np.arange(nmax)
+    inf = np.inf
+    cs_draws = DrawBuffer(cs_sampler, rng, nrep, batch * nmax)
+    p_draws = DrawBuffer(p_sampler, rng, nrep, batch * nmax)
+
+    # The times at which threads will next try to enter the CS, sorted, with
+    # inf for threads beyond the replica's # threads.  Which thread is which
+    # doesn't matter to any of the statistics.
+    p = p_draws.take(nmax)
+    p_draws.advance(nthreads)
+    arrive = np.where(cols[None, :] < nthreads[:, None], initial_time + p, inf)
+    p_time = np.where(arrive <= until, p, 0.0).sum(axis=1)
+    arrive.sort(axis=1)
+    cs_time = np.zeros(nrep)
+    wait_time = np.zeros(nrep)
+    ncs = np.zeros(nrep, dtype=np.int64)
+    lock_free = np.full(nrep, -inf)
+
+    # only the first w attempts are considered per step; w follows the # we
+    # can commit, which is well below nmax when the lock is saturated
+    w = nmax
+    with np.errstate(invalid='ignore'):
+        while (arrive[:, 0] <= until).any():
+            a = arrive[:, :w]
+            cs = cs_draws.take(w)
+            p = p_draws.take(w)
+            cum = np.cumsum(cs, axis=1)
+            end = cum + np.maximum(lock_free[:, None], np.maximum.accumulate(a - (cum - cs), axis=1))
+            start = end - cs
+            back = end + p
+            # attempt k is safe to commit if it comes before any thread
+            # served ahead of it gets back; past `until` nothing more counts
+            first_back = np.empty_like(back)
+            first_back[:, 0] = inf
+            first_back[:, 1:] = np.minimum.accumulate(back[:, :-1], axis=1)
+            ok = (a < first_back) & (a <= until)
+            ncommit = np.where(ok.all(axis=1), w, ok.argmin(axis=1))
+            commit = cols[None, :w] < ncommit[:, None]
+
+            cs_time += np.where(commit & (end <= until), cs, 0.0).sum(axis=1)
+            wait_time += np.where(commit & (start <= until), start - a, 0.0).sum(axis=1)
+            p_time += np.where(commit & (back <= until), p, 0.0).sum(axis=1)
+            ncs += (commit & (end <= until)).sum(axis=1)
+            done = ncommit > 0
+            lock_free[done] = end[rows[done], ncommit[done] - 1]
+            cs_draws.advance(ncommit)
+            p_draws.advance(ncommit)
+            arrive[:, :w] = np.where(commit, back, a)
+            arrive.sort(axis=1)
+            w = min(nmax, max(16, 2 * int(ncommit.max())))
+
+    return {'p_time': p_time, 'cs_time': cs_time, 'wait_time': wait_time, 'ncs': ncs}
+
+
+def simulate(nthreads, cs_sampler, p_sampler, until, initial_time=0.0, rng=None, batch=64, max_cells=1 << 16):
+    """
+    Like simulate_group, but replicas are simulated in groups of similar #
+    threads (within a factor of 2, at most max_cells threads in all) so that
+    few threads aren't padded out to the largest #.  Results are in the order
+    of nthreads.
+    """
+    if rng is None:
+        rng = np.random.RandomState()
+    nthreads = np.asarray(nthreads, dtype=np.int64)
+    idx = np.argsort(nthreads, kind='mergesort')
+    res = {}
+    i = 0
+    while i < len(idx):
+        j = i + 1
+        while j < len(idx) and nthreads[idx[j]] <= 2 * nthreads[idx[i]] and (j + 1 - i) * nthreads[idx[j]] <= max_cells:
+            j += 1
+        grp = simulate_group(nthreads[idx[i:j]], cs_sampler, p_sampler, until, initial_time, rng, batch)
+        for k, v in grp.items():
+            if k not in res:
+                res[k] = np.zeros(len(nthreads), dtype=v.dtype)
+            res[k][idx[i:j]] = v
+        i = j
+    return res